@@ -0,0 +1,320 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from langchain.pydantic_v1 import BaseModel, Field
+from langchain_core.messages import BaseMessage, convert_to_messages
+from langchain_core.runnables import Runnable
+from langserve import add_routes
+from sse_starlette.sse import EventSourceResponse
+
+from metrics import METRICS_HANDLER, REGISTRY, percentile
+from response_cache import cached_agent
+
+MAX_CONCURRENCY = int(os.environ.get("AGENT_MAX_CONCURRENCY", "16"))
+MAX_QUEUE = int(os.environ.get("AGENT_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.environ.get("AGENT_QUEUE_TIMEOUT", "30"))
+WARMUP_RETRY_INTERVAL = float(os.environ.get("AGENT_WARMUP_RETRY_INTERVAL", "10"))
+# Endpoints under the agent prefix that run the agent; the playground and
+# schema routes are left unthrottled. langserve's /c/{config_hash}/...
+# variants end in the same names.
+LIMITED_ENDPOINTS = ("invoke", "batch", "stream", "stream_log", "stream_events", "events")
+
+REJECTED_REQUESTS = REGISTRY.counter(
+    "agent_rejected_requests_total", "Agent requests rejected with 429 by the concurrency limit.")
+STREAM_TTFT = REGISTRY.histogram(
+    "agent_stream_ttft_seconds", "Time to first token on the streaming endpoint.")
+
+
+# We need to add these input/output schemas because the current AgentExecutor
+# is lacking in schemas.
+
+class Input(BaseModel):
+    input: str
+    chat_history: List[BaseMessage] = Field(
+        ...,
+        extra={"widget": {"type": "chat", "input": "location"}},
+    )
+
+
+class Output(BaseModel):
+    output: str
+
+
+class ConcurrencyLimitMiddleware:
+    # Plain ASGI middleware: at most max_concurrency requests to the
+    # `endpoints` under `prefix` run at once and at most max_queue wait for a slot. Anything beyond
+    # that, or waiting longer than queue_timeout, is rejected with a 429
+    # instead of growing an unbounded queue.
+    def __init__(self, app, prefix="/agent", max_concurrency=MAX_CONCURRENCY,
+                 max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT, endpoints=LIMITED_ENDPOINTS):
+        self.app = app
+        self.prefix = prefix.rstrip("/") + "/"
+        self.endpoints = frozenset(endpoints)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.rejected = 0
+
+    def _is_limited(self, path):
+        return path.startswith(self.prefix) and path.rstrip("/").rsplit("/", 1)[-1] in self.endpoints
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._is_limited(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        if self.slots.locked() and self.waiting >= self.max_queue:
+            return await self._reject(send)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            return await self._reject(send)
+        finally:
+            self.waiting -= 1
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.slots.release()
+
+    async def _reject(self, send):
+        self.rejected += 1
+        REJECTED_REQUESTS.inc()
+        body = json.dumps({"detail": "Too many concurrent agent requests"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", b"1"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class StreamTimings:
+    # Rolling window of per-request time-to-first-token and total time for
+    # the streaming endpoint.
+    def __init__(self, window=1000):
+        self.ttft = deque(maxlen=window)
+        self.total = deque(maxlen=window)
+        self.requests = 0
+
+    def record(self, ttft, total):
+        self.requests += 1
+        self.ttft.append(ttft)
+        self.total.append(total)
+        STREAM_TTFT.observe(ttft)
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return {}
+        return {f"p{q}_ms": percentile(samples, q) * 1000 for q in (50, 95, 99)}
+
+    @property
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'ttft': self._percentiles(self.ttft),
+            'total': self._percentiles(self.total),
+        }
+
+
+async def stream_agent_events(agent_executor, inputs, timings):
+    # Server-sent events for one agent run: tool_start/tool_end for each
+    # intermediate step, token for every streamed chat model chunk, final for
+    # the executor's output and a closing metrics event. If the agent raises,
+    # an error event ends the stream instead.
+    start = time.perf_counter()
+    first_token = None
+    root_run_id = None
+    try:
+        async for event in agent_executor.astream_events(
+                inputs, config={"callbacks": [METRICS_HANDLER]}, version="v1"):
+            kind = event["event"]
+            if root_run_id is None and kind == "on_chain_start":
+                root_run_id = event["run_id"]
+            elif kind == "on_chat_model_stream":
+                content = event["data"]["chunk"].content
+                if content:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    yield {"event": "token", "data": content}
+            elif kind == "on_tool_start":
+                yield {"event": "tool_start",
+                       "data": json.dumps({"tool": event["name"], "input": event["data"].get("input")}, default=str)}
+            elif kind == "on_tool_end":
+                output = str(event["data"].get("output"))
+                yield {"event": "tool_end", "data": json.dumps({"tool": event["name"], "output": output[:2000]})}
+            elif kind == "on_chain_end" and event["run_id"] == root_run_id:
+                output = event["data"].get("output") or {}
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                yield {"event": "final", "data": json.dumps({"output": output.get("output")}, default=str)}
+    except Exception as e:
+        logging.exception(f"Agent run failed while streaming: {e}")
+        yield {"event": "error", "data": json.dumps({"error": f"{type(e).__name__}: {e}"})}
+        return
+    finally:
+        total = time.perf_counter() - start
+        timings.record(first_token if first_token is not None else total, total)
+    yield {"event": "metrics", "data": json.dumps({"ttft_ms": (first_token or total) * 1000, "total_ms": total * 1000})}
+
+
+class LazyAgent:
+    # Holds the agent executor. When given a factory, the executor is built
+    # in a worker thread after the server starts (retrying on failure, e.g.
+    # while the network is down) and agent routes answer 503 until then.
+    def __init__(self, factory=None, executor=None, retry_interval=WARMUP_RETRY_INTERVAL):
+        self.factory = factory
+        self.executor = executor
+        self.retry_interval = retry_interval
+        self.error = None
+        self.created_at = time.monotonic()
+        self.ready_seconds = 0.0 if executor is not None else None
+
+    @property
+    def ready(self):
+        return self.executor is not None
+
+    async def warm_up(self):
+        while self.executor is None:
+            try:
+                self.executor = await asyncio.to_thread(self.factory)
+                self.ready_seconds = time.monotonic() - self.created_at
+                self.error = None
+                logging.info(f"Agent ready after {self.ready_seconds:.1f}s")
+            except Exception as e:
+                self.error = e
+                logging.exception(f"Agent warm-up failed, retrying in {self.retry_interval}s: {e}")
+                await asyncio.sleep(self.retry_interval)
+
+    def require(self):
+        if self.executor is None:
+            detail = "Agent is starting" if self.error is None else f"Agent failed to start: {self.error}"
+            raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+        return self.executor
+
+    def as_runnable(self):
+        return LazyAgentRunnable(self)
+
+
+class LazyAgentRunnable(Runnable):
+    # Passes every call, streaming included, to the LazyAgent's executor so
+    # langserve's stream routes see the executor's own steps.
+    name = "AgentExecutor"
+
+    def __init__(self, lazy_agent):
+        self.lazy_agent = lazy_agent
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.lazy_agent.require().invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self.lazy_agent.require().ainvoke(input, config, **kwargs)
+
+    def stream(self, input, config=None, **kwargs):
+        yield from self.lazy_agent.require().stream(input, config, **kwargs)
+
+    async def astream(self, input, config=None, **kwargs):
+        async for chunk in self.lazy_agent.require().astream(input, config, **kwargs):
+            yield chunk
+
+
+def create_app(agent_executor, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE, response_cache=None):
+    # agent_executor may be a ready executor or a LazyAgent to build in the
+    # background once the server is accepting connections.
+    lazy_agent = agent_executor if isinstance(agent_executor, LazyAgent) else LazyAgent(executor=agent_executor)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        warm_up = None if lazy_agent.ready else asyncio.create_task(lazy_agent.warm_up())
+        yield
+        if warm_up is not None:
+            warm_up.cancel()
+
+    app = FastAPI(
+      title="LangChain Server",
+      version="1.0",
+      description="A simple API server using LangChain's Runnable interfaces",
+      lifespan=lifespan,
+    )
+    app.state.agent = lazy_agent
+    app.add_middleware(ConcurrencyLimitMiddleware, prefix="/agent",
+                       max_concurrency=max_concurrency, max_queue=max_queue)
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    async def readyz():
+        if lazy_agent.ready:
+            return {"status": "ready", "ready_seconds": lazy_agent.ready_seconds}
+        status = "starting" if lazy_agent.error is None else "failed"
+        return JSONResponse({"status": status, "error": str(lazy_agent.error) if lazy_agent.error else None},
+                            status_code=503)
+
+    # Callbacks passed through the config are inherited by every child run,
+    # so the handler sees the retriever, LLM and tool stages of each request.
+    agent = lazy_agent.as_runnable()
+    if response_cache is not None:
+        agent = cached_agent(agent, response_cache)
+
+        @app.get("/cache/stats")
+        async def cache_stats():
+            return response_cache.stats
+
+        REGISTRY.gauge("agent_response_cache", "Agent response cache counters.",
+                       lambda: {(name,): value for name, value in response_cache.stats.items()}, ("stat",))
+    agent = agent.with_config(callbacks=[METRICS_HANDLER])
+
+    stream_timings = StreamTimings()
+    app.state.stream_timings = stream_timings
+
+    @app.post("/agent/events")
+    async def agent_events(request: Request):
+        # Same body as /agent/invoke: {"input": {"input": ..., "chat_history": [...]}}
+        executor = lazy_agent.require()
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Request body must be JSON")
+        payload = body.get("input") if isinstance(body, dict) else None
+        if (not isinstance(payload, dict) or not isinstance(payload.get("input", ""), str)
+                or not isinstance(payload.get("chat_history") or [], list)):
+            raise HTTPException(status_code=422, detail='Expected {"input": {"input": str, "chat_history": [...]}}')
+        try:
+            chat_history = convert_to_messages(payload.get("chat_history") or [])
+        except (KeyError, TypeError, ValueError, NotImplementedError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid chat_history: {e}")
+        inputs = {"input": payload.get("input", ""), "chat_history": chat_history}
+        return EventSourceResponse(stream_agent_events(executor, inputs, stream_timings))
+
+    @app.get("/stream/stats")
+    async def stream_stats():
+        return stream_timings.stats
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    # langserve serves these routes through ainvoke/astream, so the agent,
+    # its LLM calls and its tools all run on the event loop.
+    add_routes(
+        app,
+        agent.with_types(input_type=Input, output_type=Output),
+        path="/agent",
+    )
+    return app
@@ -0,0 +1,41 @@
+import logging
+import os
+
+from langchain_core.load import dumps, loads
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+HUB_PROMPT = "hwchase17/openai-functions-agent"
+PROMPT_CACHE_PATH = os.environ.get("AGENT_PROMPT_CACHE", ".prompt_cache/openai-functions-agent.json")
+# Set to 1 to pull the prompt from the hub once and cache it locally;
+# otherwise the vendored copy below is used and startup needs no network.
+PULL_FROM_HUB = os.environ.get("AGENT_PROMPT_FROM_HUB", "0") == "1"
+
+
+def vendored_agent_prompt():
+    # Local copy of hwchase17/openai-functions-agent.
+    return ChatPromptTemplate.from_messages([
+        ("system", "You are a helpful assistant"),
+        MessagesPlaceholder("chat_history", optional=True),
+        ("human", "{input}"),
+        MessagesPlaceholder("agent_scratchpad"),
+    ])
+
+
+def load_agent_prompt(path=PROMPT_CACHE_PATH, pull_from_hub=PULL_FROM_HUB):
+    if os.path.exists(path):
+        with open(path) as file:
+            return loads(file.read())
+    if not pull_from_hub:
+        return vendored_agent_prompt()
+
+    from langchain import hub
+
+    try:
+        prompt = hub.pull(HUB_PROMPT)
+    except Exception as e:
+        logging.warning(f"Could not pull {HUB_PROMPT}, using the vendored prompt: {e}")
+        return vendored_agent_prompt()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        file.write(dumps(prompt, pretty=True))
+    return prompt
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from agent_app import create_app
+from benchmarks.common import report, summarize
+from benchmarks.fakes import build_fake_agent_executor
+from response_cache import ResponseCache
+
+
+async def run_load(app, requests, concurrency, distinct_questions=None, path="/agent/invoke"):
+    # Drives the ASGI app in-process through httpx, so no sockets or network
+    # are involved and the numbers reflect the serving stack alone.
+    latencies = []
+    statuses = Counter()
+    client_slots = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://agent.test", timeout=120) as client:
+        async def one(i):
+            async with client_slots:
+                start = time.perf_counter()
+                question = f"Question {i % distinct_questions if distinct_questions else i}"
+                response = await client.post(path, json={"input": {"input": question, "chat_history": []}})
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        'requests': requests,
+        'client_concurrency': concurrency,
+        'elapsed_s': elapsed,
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'status_codes': dict(statuses),
+        'latency': summarize(latencies),
+    }
+
+
+def run(requests, concurrency, max_concurrency, max_queue, llm_latency, tool_latency,
+        cache=False, distinct_questions=None, stream=False):
+    agent_executor = build_fake_agent_executor(llm_latency, tool_latency)
+    response_cache = ResponseCache(disk_path="") if cache else None
+    app = create_app(agent_executor, max_concurrency=max_concurrency, max_queue=max_queue,
+                     response_cache=response_cache)
+    path = "/agent/events" if stream else "/agent/invoke"
+    results = asyncio.run(run_load(app, requests, concurrency, distinct_questions, path))
+    if stream:
+        # httpx's ASGI transport buffers whole responses, so time to first
+        # token comes from the server-side timings.
+        results['stream'] = app.state.stream_timings.stats
+    if response_cache is not None:
+        results['cache'] = response_cache.stats
+    results.update({'max_concurrency': max_concurrency, 'max_queue': max_queue,
+                    'llm_latency_s': llm_latency, 'tool_latency_s': tool_latency})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test /agent with a fake chat model and search tool.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--tool-latency", type=float, default=0.02)
+    parser.add_argument("--cache", action="store_true", help="Put the response cache in front of the agent")
+    parser.add_argument("--distinct-questions", type=int, default=None,
+                        help="Cycle through this many questions instead of making every request unique")
+    parser.add_argument("--stream", action="store_true", help="Use the SSE endpoint and report time to first token")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("agent_load", run(args.requests, args.concurrency, args.max_concurrency, args.max_queue,
+                             args.llm_latency, args.tool_latency, args.cache, args.distinct_questions,
+                             args.stream),
+           args.output)
@@ -0,0 +1,49 @@
+import json
+import socket
+import statistics
+import time
+
+from metrics import percentile
+
+# Vocabulary of the synthetic documents, chunks and pages.
+WORDS = "trace evaluate dataset prompt monitor feedback latency chain agent retriever annotation".split()
+# Roughly the Auckland region, in EPSG:4326.
+BOUNDS = (174.4, -37.2, 175.2, -36.5)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(samples):
+    # Latency samples in seconds -> summary in milliseconds.
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': max(samples) * 1000 if samples else 0.0,
+    }
+
+
+def time_calls(func, iterations, warmup=0):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(name, results, output=None):
+    print(f"== {name}")
+    for key, value in results.items():
+        print(f"{key}: {json.dumps(value, default=str)}")
+    if output:
+        with open(output, 'w') as file:
+            json.dump({'benchmark': name, 'results': results}, file, indent=2, default=str)
@@ -0,0 +1,54 @@
+import argparse
+
+import psycopg2
+
+from benchmarks.common import report, summarize, time_calls
+from db import close_pools
+from insert_road import query_nearest_road
+
+NEAREST_ROAD_SQL = """
+    SELECT
+        road_name,
+        speed_limit,
+        ST_Distance(geom, ST_SetSRID(ST_MakePoint(%s, %s), 4326)) AS distance
+    FROM road_segments
+    ORDER BY geom <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)
+    LIMIT 1;
+"""
+
+
+def per_call_connect(connection_string, lat, lon):
+    # The pre-pool behaviour: one connection and one unprepared query per call.
+    conn = psycopg2.connect(connection_string)
+    cur = conn.cursor()
+    cur.execute(NEAREST_ROAD_SQL, (lon, lat, lon, lat))
+    result = cur.fetchone()
+    cur.close()
+    conn.close()
+    return result
+
+
+def run(connection_string, iterations, lat, lon):
+    connect_samples = time_calls(lambda: per_call_connect(connection_string, lat, lon), iterations, warmup=3)
+    pooled_samples = time_calls(lambda: query_nearest_road(connection_string, lat, lon), iterations, warmup=3)
+    close_pools()
+
+    per_call = summarize(connect_samples)
+    pooled = summarize(pooled_samples)
+    return {
+        'per_call_connect': per_call,
+        'pooled_prepared': pooled,
+        'p50_speedup': per_call['p50_ms'] / pooled['p50_ms'] if pooled['p50_ms'] else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-call connect against pooled nearest-road lookups.")
+    parser.add_argument("connection_string")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--lat", type=float, default=-36.758110)
+    parser.add_argument("--lon", type=float, default=174.729309)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("db_pool", run(args.connection_string, args.iterations, args.lat, args.lon), args.output)
@@ -0,0 +1,87 @@
+import argparse
+import time
+
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+from benchmarks.common import WORDS, report
+from benchmarks.embedding_server import FakeEmbeddingServer
+from embedding_engine import BatchedEmbeddings
+
+
+def synthetic_chunks(count, min_words, max_words, seed=0):
+    # Chunks of widely varying length, as character-based splitting produces.
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(min_words, max_words, count)
+    return [" ".join(WORDS[(i + j) % len(WORDS)] for j in range(length)) + f" #{i}"
+            for i, length in enumerate(lengths)]
+
+
+def run_embeddings(name, embeddings, texts, server):
+    before = dict(server.stats)
+    start = time.perf_counter()
+    try:
+        if hasattr(embeddings, 'embed_array'):
+            vectors = embeddings.embed_array(texts)
+        else:
+            vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        error = None
+    except Exception as e:
+        vectors, error = None, f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    result = {
+        'seconds': seconds,
+        'texts_per_second': len(texts) / seconds if vectors is not None else None,
+        'server_requests': server.stats['requests'] - before['requests'],
+        'rate_limited': server.stats['rate_limited'] - before['rate_limited'],
+        'rejected': server.stats['rejected'] - before['rejected'],
+        'error': error,
+    }
+    if vectors is not None:
+        result['shape'] = list(vectors.shape)
+    if hasattr(embeddings, 'stats'):
+        result['client'] = dict(embeddings.stats)
+    print(f"{name}: {seconds:.2f}s {result['server_requests']} requests, {result['rate_limited']} rate limited")
+    return result, vectors
+
+
+def run(count, min_words, max_words, dim, latency, tokens_per_minute, concurrency, baseline_chunk_size):
+    texts = synthetic_chunks(count, min_words, max_words)
+    results = {'texts': count, 'dim': dim, 'latency_ms': latency * 1000, 'tokens_per_minute': tokens_per_minute}
+    with FakeEmbeddingServer(dim, latency, tokens_per_minute=tokens_per_minute) as server:
+        # OpenAIEmbeddings' default of 1000 inputs per request can exceed the
+        # request token limit with long chunks; the smaller chunk_size is the
+        # usual workaround.
+        baseline = OpenAIEmbeddings(base_url=server.base_url, api_key="fake", max_retries=6)
+        results['openai_embeddings_default'], _ = run_embeddings("OpenAIEmbeddings", baseline, texts, server)
+        baseline = OpenAIEmbeddings(base_url=server.base_url, api_key="fake", max_retries=6,
+                                    chunk_size=baseline_chunk_size)
+        results['openai_embeddings'], expected = run_embeddings(
+            f"OpenAIEmbeddings(chunk_size={baseline_chunk_size})", baseline, texts, server)
+        engine = BatchedEmbeddings(base_url=server.base_url, api_key="fake", max_concurrency=concurrency)
+        results['batched_embeddings'], vectors = run_embeddings("BatchedEmbeddings", engine, texts, server)
+        engine.close()
+    if vectors is not None:
+        results['batched_embeddings']['contiguous_float32'] = bool(
+            vectors.flags['C_CONTIGUOUS'] and vectors.dtype == np.float32)
+    if expected is not None and vectors is not None:
+        results['max_abs_difference'] = float(np.abs(expected - vectors).max())
+        results['speedup'] = results['openai_embeddings']['seconds'] / results['batched_embeddings']['seconds']
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAIEmbeddings vs BatchedEmbeddings against a fake server.")
+    parser.add_argument("--texts", type=int, default=20000)
+    parser.add_argument("--min-words", type=int, default=20)
+    parser.add_argument("--max-words", type=int, default=600)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.2, help="Base seconds per request")
+    parser.add_argument("--tokens-per-minute", type=int, default=20_000_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--baseline-chunk-size", type=int, default=256)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("embedding_engine", run(args.texts, args.min_words, args.max_words, args.dim, args.latency,
+                                   args.tokens_per_minute, args.concurrency, args.baseline_chunk_size), args.output)
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import threading
+import time
+
+import numpy as np
+from aiohttp import web
+
+from benchmarks.common import free_port
+
+
+class FakeEmbeddingServer:
+    # OpenAI-compatible POST /v1/embeddings served from a background thread.
+    # Latency grows with the request's token count, request limits match
+    # OpenAI's (400 beyond them) and a tokens-per-minute bucket answers 429
+    # with retry-after-ms when exhausted. Accepts strings or token arrays
+    # and returns float lists or base64 as requested.
+    def __init__(self, dim=256, latency=0.05, per_token=0.000002, tokens_per_minute=5_000_000,
+                 max_request_tokens=300_000, max_inputs=2048, port=None):
+        self.dim = dim
+        self.latency = latency
+        self.per_token = per_token
+        self.tokens_per_second = tokens_per_minute / 60
+        self.bucket_capacity = tokens_per_minute / 6
+        self.bucket = self.bucket_capacity
+        self.bucket_updated = time.monotonic()
+        self.max_request_tokens = max_request_tokens
+        self.max_inputs = max_inputs
+        self.port = port or free_port()
+        self.stats = {'requests': 0, 'rate_limited': 0, 'rejected': 0, 'tokens': 0}
+        self.started = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def _vector(self, item):
+        key = item if isinstance(item, str) else ",".join(map(str, item))
+        seed = int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def _take_tokens(self, tokens):
+        now = time.monotonic()
+        self.bucket = min(self.bucket_capacity, self.bucket + (now - self.bucket_updated) * self.tokens_per_second)
+        self.bucket_updated = now
+        if tokens > self.bucket:
+            return (tokens - self.bucket) / self.tokens_per_second
+        self.bucket -= tokens
+        return 0.0
+
+    async def handle(self, request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        # Roughly four characters per token for string input.
+        tokens = sum(len(item) // 4 + 1 if isinstance(item, str) else len(item) for item in inputs)
+        if len(inputs) > self.max_inputs or tokens > self.max_request_tokens:
+            self.stats['rejected'] += 1
+            return web.json_response({"error": {"message": f"Request too large: {len(inputs)} inputs, "
+                                                           f"{tokens} tokens", "type": "invalid_request_error"}},
+                                     status=400)
+        wait = self._take_tokens(tokens)
+        if wait:
+            self.stats['rate_limited'] += 1
+            return web.json_response({"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                                     status=429, headers={"retry-after-ms": str(int(wait * 1000) + 1)})
+
+        await asyncio.sleep(self.latency + tokens * self.per_token)
+        self.stats['requests'] += 1
+        self.stats['tokens'] += tokens
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for index, item in enumerate(inputs):
+            vector = self._vector(item)
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii") if as_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        return web.json_response({
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def app(self):
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_post("/v1/embeddings", self.handle)
+        return app
+
+    def _serve(self):
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(self.app())
+        self.loop.run_until_complete(self.runner.setup())
+        self.loop.run_until_complete(web.TCPSite(self.runner, "127.0.0.1", self.port).start())
+        self.started.set()
+        self.loop.run_forever()
+
+    def __enter__(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self.started.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the fake OpenAI-compatible embedding server.")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-minute", type=int, default=5_000_000)
+    args = parser.parse_args()
+
+    server = FakeEmbeddingServer(args.dim, args.latency, tokens_per_minute=args.tokens_per_minute)
+    web.run_app(server.app(), host="127.0.0.1", port=args.port)
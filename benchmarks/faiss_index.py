@@ -0,0 +1,102 @@
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.common import report, summarize
+from faiss_index import INDEX_MODES, build_index, effective_mode, index_memory_bytes, index_settings, tune_index
+
+
+def synthetic_embeddings(count, dim, clusters, seed=0):
+    # Unit vectors drawn around random cluster centres, which is closer to
+    # real text embeddings than uniform noise (and harder for IVF than it).
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centres[labels] + 0.35 * rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    hits = sum(len(set(row[:k]) & set(expected)) for row, expected in zip(found, truth))
+    return hits / truth.size
+
+
+def measure_search(index, queries, k, single_queries):
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    batch_seconds = time.perf_counter() - start
+
+    # One query at a time, as the retriever issues them.
+    samples = []
+    for query in queries[:single_queries]:
+        start = time.perf_counter()
+        index.search(query[None, :], k)
+        samples.append(time.perf_counter() - start)
+    return found, {
+        'batch_qps': len(queries) / batch_seconds if batch_seconds else None,
+        'single_query': summarize(samples),
+    }
+
+
+def run(count, dim, queries, k, modes, nprobes, ef_searches, threads, seed=0):
+    if threads:
+        faiss.omp_set_num_threads(threads)
+    vectors = synthetic_embeddings(count + queries, dim, clusters=max(16, count // 1000), seed=seed)
+    vectors, query_vectors = vectors[:count], vectors[count:]
+
+    results = {'vectors': count, 'dim': dim, 'queries': queries, 'k': k, 'modes': {}}
+    truth = None
+    for mode in ['flat'] + [mode for mode in modes if mode != 'flat']:
+        settings = index_settings(mode)
+        start = time.perf_counter()
+        index = build_index(vectors, settings)
+        build_seconds = time.perf_counter() - start
+        base = {
+            'effective_mode': effective_mode(mode, count, settings),
+            'build_seconds': build_seconds,
+            'memory_bytes': index_memory_bytes(index),
+            'bytes_per_vector': index_memory_bytes(index) / count,
+        }
+
+        # Sweep the search-time knob for the mode (a single run for flat).
+        if mode in ('ivf_flat', 'ivf_pq'):
+            sweep = [('nprobe', value, dict(nprobe=value)) for value in nprobes]
+        elif mode == 'hnsw':
+            sweep = [('efSearch', value, dict(ef_search=value)) for value in ef_searches]
+        else:
+            sweep = [(None, None, {})]
+
+        runs = []
+        for knob, value, params in sweep:
+            tune_index(index, **params)
+            found, timings = measure_search(index, query_vectors, k, min(queries, 1000))
+            if truth is None:
+                truth = found
+            runs.append({knob or 'exact': value, 'recall_at_k': recall_at_k(found, truth), **timings})
+            print(f"{mode} {knob or ''}={value}: recall@{k}={runs[-1]['recall_at_k']:.3f} "
+                  f"qps={timings['batch_qps']:.0f}")
+        results['modes'][mode] = {**base, 'runs': runs}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall, throughput and memory of the FAISS index modes.")
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384, help="1536 matches text-embedding-ada-002")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--modes", default=",".join(INDEX_MODES))
+    parser.add_argument("--nprobe", default="1,4,16,64")
+    parser.add_argument("--ef-search", default="16,64,256")
+    parser.add_argument("--threads", type=int, default=0, help="OpenMP threads (0 = faiss default)")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.vectors, args.dim, args.queries, args.k, args.modes.split(","),
+                  [int(value) for value in args.nprobe.split(",")],
+                  [int(value) for value in args.ef_search.split(",")], args.threads)
+    report("faiss_index", results, args.output)
@@ -0,0 +1,18 @@
+import os
+import time
+
+from agent_app import LazyAgent, create_app
+from benchmarks.fakes import build_fake_agent_executor
+
+# Simulated cost of building the retriever and agent, in seconds.
+BUILD_DELAY = float(os.environ.get("FAKE_AGENT_BUILD_DELAY", "2"))
+
+
+def build_slow_fake_agent_executor():
+    time.sleep(BUILD_DELAY)
+    return build_fake_agent_executor()
+
+
+# Offline stand-in for serve:app with the same lifecycle, for
+# `python -m benchmarks.startup --app benchmarks.fake_app:app`.
+app = create_app(LazyAgent(build_slow_fake_agent_executor))
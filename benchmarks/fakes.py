@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+import time
+
+import numpy as np
+
+from langchain.agents import AgentExecutor, create_openai_functions_agent
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, FunctionMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import StructuredTool
+
+from agent_prompt import vendored_agent_prompt
+
+
+class FakeFunctionCallingChatModel(BaseChatModel):
+    # Stands in for ChatOpenAI in an openai-functions agent: the first turn
+    # calls `tool_name` with the user's question, the turn after the tool
+    # result answers. `latency` simulates the model's response time.
+    latency: float = 0.05
+    tool_name: str = "fake_search"
+    answer: str = "LangSmith helps you trace, test and monitor LLM applications."
+
+    @property
+    def _llm_type(self):
+        return "fake-function-calling"
+
+    def _respond(self, messages):
+        if any(isinstance(message, FunctionMessage) for message in messages):
+            return AIMessage(content=self.answer)
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        return AIMessage(content="", additional_kwargs={
+            "function_call": {"name": self.tool_name, "arguments": json.dumps({"query": question})},
+        })
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Streams the answer word by word; `latency` is split between the
+        # first chunk and the rest, like a real model's time to first token.
+        message = self._respond(messages)
+        if not message.content:
+            await asyncio.sleep(self.latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", additional_kwargs=message.additional_kwargs))
+            return
+        words = message.content.split(" ")
+        await asyncio.sleep(self.latency / 2)
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.latency / 2 / len(words))
+            token = word if i == len(words) - 1 else word + " "
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def make_fake_search_tool(latency=0.02, name="fake_search"):
+    def search(query: str) -> str:
+        time.sleep(latency)
+        return f"Fake search results for: {query}"
+
+    async def asearch(query: str) -> str:
+        await asyncio.sleep(latency)
+        return f"Fake search results for: {query}"
+
+    return StructuredTool.from_function(func=search, coroutine=asearch, name=name,
+                                        description="Search for information. Returns canned results.")
+
+
+def build_fake_agent_executor(llm_latency=0.05, tool_latency=0.02):
+    tools = [make_fake_search_tool(tool_latency)]
+    llm = FakeFunctionCallingChatModel(latency=llm_latency)
+    agent = create_openai_functions_agent(llm, tools, vendored_agent_prompt())
+    return AgentExecutor(agent=agent, tools=tools)
+
+
+class FakeEmbeddings(Embeddings):
+    # Deterministic unit vectors derived from a hash of the text. Each call
+    # sleeps `latency` plus `per_text` per input, like a remote embedding API.
+    def __init__(self, dim=256, latency=0.05, per_text=0.0005):
+        self.dim = dim
+        self.latency = latency
+        self.per_text = per_text
+        self.calls = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency + self.per_text * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        await asyncio.sleep(self.latency + self.per_text * len(texts))
+        return [self._vector(text) for text in texts]
@@ -0,0 +1,172 @@
+import argparse
+import copy
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import report
+from benchmarks.road_data import LOADERS, measure_queries, table_bytes, truncate
+from benchmarks.synthetic_geojson import road_features, worksite_features, write_feature_collection
+from bulk_load import geometry_to_hex_ewkb
+from db import close_pools
+from geometry_reduction import METRES_PER_DEGREE_LAT, METRES_PER_DEGREE_LON, GeometryReducer
+from insert_road import create_table_if_not_exists, iter_road_rows, linestring_to_wkt
+from insert_roadworks import create_road_construction_table, geometry_to_wkt, iter_construction_rows
+from road_index import point_segment_distances
+
+ROWS = {
+    'road_segments': lambda features, encoder: iter_road_rows(features, encoder),
+    'road_construction': lambda features, encoder: iter_construction_rows(features, encode_geometry=encoder),
+}
+WKT_ENCODERS = {'road_segments': linestring_to_wkt, 'road_construction': geometry_to_wkt}
+
+
+def parse_config(value):
+    # "none" or "<precision>:<tolerance metres>", e.g. "6:1" or ":2".
+    if value == 'none':
+        return None, 0.0
+    precision, tolerance = value.split(':')
+    return (int(precision) if precision else None), float(tolerance or 0)
+
+
+def make_reducer(precision, tolerance):
+    return GeometryReducer(precision, tolerance) if precision is not None or tolerance > 0 else None
+
+
+def time_encoding(table, features, precision, tolerance, wkt, repeats):
+    # Best of `repeats` runs of reduction plus encoding into rows, on fresh
+    # copies (reduce_features replaces geometries in place).
+    best = None
+    for _ in range(repeats):
+        batch = copy.deepcopy(features)
+        reducer = make_reducer(precision, tolerance)
+        start = time.perf_counter()
+        if reducer:
+            batch = reducer.reduce_features(batch)
+            encoder = reducer.to_wkt if wkt else reducer.to_hex_ewkb
+        else:
+            encoder = WKT_ENCODERS[table] if wkt else geometry_to_hex_ewkb
+        size = sum(len(row[-1]) for row in ROWS[table](batch, encoder))
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, size, reducer)
+    return best
+
+
+def max_deviation(original, reduced):
+    # Largest distance in metres from an original vertex to its reduced line.
+    worst = 0.0
+    for before, after in zip(original, reduced):
+        before = np.asarray(before['geometry']['coordinates'])
+        after = np.asarray(after['geometry']['coordinates'])
+        if len(after) < 2:
+            continue
+        scale = np.array([METRES_PER_DEGREE_LON * math.cos(math.radians(before[0, 1])), METRES_PER_DEGREE_LAT])
+        before, after = before * scale, after * scale
+        distances = point_segment_distances(before[:, :1], before[:, 1:], after[:-1, 0], after[:-1, 1],
+                                            after[1:, 0], after[1:, 1])
+        worst = max(worst, float(distances.min(axis=1).max()))
+    return worst
+
+
+def measure_encoding(tables, precision, tolerance, repeats):
+    results = {}
+    for table, features in tables.items():
+        wkt_seconds, wkt_bytes, reducer = time_encoding(table, features, precision, tolerance, True, repeats)
+        ewkb_seconds, ewkb_chars, _ = time_encoding(table, features, precision, tolerance, False, repeats)
+        vertices = reducer.stats['vertices_in'] if reducer else None
+        results[table] = {
+            'wkt_seconds': wkt_seconds,
+            'wkt_bytes': wkt_bytes,
+            'ewkb_seconds': ewkb_seconds,
+            'ewkb_bytes': ewkb_chars // 2,
+            'vertices_in': vertices,
+            'vertices_out': reducer.stats['vertices_out'] if reducer else vertices,
+        }
+    reducer = make_reducer(precision, tolerance)
+    if reducer:
+        sample = tables['road_segments'][:2000]
+        reduced = list(reducer.reduce_features(copy.deepcopy(sample)))
+        results['road_segments']['max_deviation_m'] = max_deviation(sample, reduced)
+    return results
+
+
+def measure_database(connection_string, paths, precision, tolerance, method, queries):
+    # Loads both tables with the config, then measures their size and the
+    # query latencies against them.
+    create_table_if_not_exists(connection_string)
+    create_road_construction_table(connection_string)
+    results = {}
+    for table, path in paths.items():
+        truncate(connection_string, table)
+        start = time.perf_counter()
+        LOADERS[table][method](connection_string, path, reducer=make_reducer(precision, tolerance))
+        results[table] = {'load_seconds': time.perf_counter() - start, **table_bytes(connection_string, table)}
+    results['queries'] = measure_queries(connection_string, queries, 100)
+    return results
+
+
+def compare_to_baseline(results, baseline):
+    for table, current in results.items():
+        if table == 'database':
+            continue
+        base = baseline[table]
+        current['wkt_bytes_saved'] = 1 - current['wkt_bytes'] / base['wkt_bytes']
+        current['ewkb_bytes_saved'] = 1 - current['ewkb_bytes'] / base['ewkb_bytes']
+        current['wkt_speedup'] = base['wkt_seconds'] / current['wkt_seconds']
+        if current['vertices_in']:
+            current['vertices_saved'] = 1 - current['vertices_out'] / current['vertices_in']
+    if 'database' in results:
+        database, base = results['database'], baseline['database']
+        for table in ('road_segments', 'road_construction'):
+            size = database[table]['table_bytes'] + database[table]['index_bytes']
+            database[table]['bytes_saved'] = 1 - size / (base[table]['table_bytes'] + base[table]['index_bytes'])
+        for query in ('nearest_road', 'roadworks_within'):
+            latency = database['queries'][query]
+            latency['p50_speedup'] = base['queries'][query]['p50_ms'] / latency['p50_ms']
+
+
+def run(roads, worksites, configs, repeats, connection_string=None, method='stream', queries=1000):
+    tables = {'road_segments': list(road_features(roads)), 'road_construction': list(worksite_features(worksites))}
+    results = {'roads': roads, 'worksites': worksites, 'configs': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {}
+        if connection_string:
+            for table, features in tables.items():
+                paths[table] = os.path.join(directory, f"{table}.geojson")
+                write_feature_collection(features, paths[table])
+        for config in configs:
+            precision, tolerance = parse_config(config)
+            result = measure_encoding(tables, precision, tolerance, repeats)
+            if connection_string:
+                result['database'] = measure_database(connection_string, paths, precision, tolerance, method, queries)
+            results['configs'][config] = result
+            compare_to_baseline(result, results['configs'][configs[0]])
+            roads_result = result['road_segments']
+            print(f"{config}: road WKT {roads_result['wkt_bytes'] / 1e6:.1f} MB "
+                  f"({roads_result['wkt_bytes_saved']:.0%} smaller), encoded in {roads_result['wkt_seconds']:.2f}s")
+    close_pools()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bytes, vertices and encoding time saved by quantizing and "
+                                                 "simplifying geometry at ingest, and the effect on queries.")
+    parser.add_argument("--roads", type=int, default=20000)
+    parser.add_argument("--worksites", type=int, default=2000)
+    parser.add_argument("--configs", default="none,7:0,6:0,6:1,5:2",
+                        help="Comma-separated precision:tolerance_m pairs; the first is the baseline")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--database", help="Scratch PostGIS connection string: also load each config and "
+                                           "measure table size and query latency (empties both tables; "
+                                           "leave the INGEST_* settings unset)")
+    parser.add_argument("--method", choices=("insert", "stream", "copy"), default="stream")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("geometry_reduction", run(args.roads, args.worksites, args.configs.split(","), args.repeats,
+                                     args.database, args.method, args.queries), args.output)
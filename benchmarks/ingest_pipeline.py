@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import threading
+import time
+
+from aiohttp import web
+from langchain_community.document_loaders import WebBaseLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.common import WORDS, free_port, report
+from benchmarks.fakes import FakeEmbeddings
+from ingest_pipeline import ingest_sources
+from vector_cache import build_vectorstore
+
+
+def page_html(number, paragraphs):
+    body = "".join(
+        f"<p>{' '.join(WORDS[(number + i + j) % len(WORDS)] for j in range(80))}</p>" for i in range(paragraphs))
+    return f"<html lang='en'><head><title>Page {number}</title></head><body><h1>Page {number}</h1>{body}</body></html>"
+
+
+class FixtureServer:
+    # Local HTTP server in a background thread serving /page/<n>, each
+    # response delayed by `latency` seconds to stand in for a remote site.
+    def __init__(self, pages, paragraphs, latency):
+        self.pages = {str(n): page_html(n, paragraphs) for n in range(pages)}
+        self.latency = latency
+        self.port = free_port()
+        self.started = threading.Event()
+
+    async def handle(self, request):
+        await asyncio.sleep(self.latency)
+        return web.Response(text=self.pages[request.match_info["number"]], content_type="text/html")
+
+    def _serve(self):
+        self.loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get("/page/{number}", self.handle)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        self.loop.run_until_complete(web.TCPSite(self.runner, "127.0.0.1", self.port).start())
+        self.started.set()
+        self.loop.run_forever()
+
+    def __enter__(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self.started.wait()
+        return [f"http://127.0.0.1:{self.port}/page/{n}" for n in self.pages]
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def run_sequential(urls, embeddings, text_splitter):
+    # The original approach: load every page in turn, then split and embed
+    # everything in one go.
+    start = time.perf_counter()
+    docs = WebBaseLoader(urls).load()
+    vectorstore = build_vectorstore(text_splitter.split_documents(docs), embeddings)
+    return {'seconds': time.perf_counter() - start, 'chunks': vectorstore.index.ntotal}
+
+
+def run_pipeline(urls, embeddings, text_splitter, max_connections, batch_size):
+    vectorstore, stats = asyncio.run(ingest_sources(
+        urls, embeddings, text_splitter, batch_size=batch_size, max_connections=max_connections,
+        per_host=max_connections))
+    stats['indexed'] = vectorstore.index.ntotal
+    return stats
+
+
+def run(pages, paragraphs, page_latency, embed_latency, max_connections, batch_size, skip_sequential):
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    results = {'pages': pages, 'page_latency_ms': page_latency * 1000, 'embed_latency_ms': embed_latency * 1000}
+    with FixtureServer(pages, paragraphs, page_latency) as urls:
+        if not skip_sequential:
+            results['sequential'] = run_sequential(urls, FakeEmbeddings(latency=embed_latency), text_splitter)
+        results['pipeline'] = run_pipeline(urls, FakeEmbeddings(latency=embed_latency), text_splitter,
+                                           max_connections, batch_size)
+    if 'sequential' in results:
+        results['speedup'] = results['sequential']['seconds'] / results['pipeline']['seconds']
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sequential WebBaseLoader ingest vs the async pipeline.")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--page-latency", type=float, default=0.1, help="Seconds per fixture page response")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per embedding call")
+    parser.add_argument("--max-connections", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--skip-sequential", action="store_true")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("ingest_pipeline", run(args.pages, args.paragraphs, args.page_latency, args.embed_latency,
+                                  args.max_connections, args.batch_size, args.skip_sequential), args.output)
@@ -0,0 +1,51 @@
+import argparse
+import time
+
+from langchain_core.documents import Document
+
+from benchmarks.common import WORDS, report, summarize, time_calls
+from benchmarks.fakes import FakeEmbeddings
+from faiss_index import INDEX_MODES, index_settings
+from vector_cache import build_vectorstore
+
+
+def synthetic_documents(count, words=120):
+    return [Document(page_content=" ".join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(words)) + f" #{i}",
+                     metadata={'source': f"synthetic/{i}"})
+            for i in range(count)]
+
+
+def run(documents, queries, k, modes, dim, embed_latency):
+    # End-to-end retrieval through the LangChain FAISS store: query embedding
+    # (fake, with optional latency), index search and docstore lookup.
+    docs = synthetic_documents(documents)
+    results = {'documents': documents, 'queries': queries, 'k': k, 'dim': dim,
+               'embed_latency_s': embed_latency, 'modes': {}}
+    for mode in modes:
+        embeddings = FakeEmbeddings(dim=dim, latency=0.0, per_text=0.0)
+        start = time.perf_counter()
+        vector = build_vectorstore(docs, embeddings, index_settings(mode))
+        build_seconds = time.perf_counter() - start
+        embeddings.latency = embed_latency
+        retriever = vector.as_retriever(search_kwargs={'k': k})
+        questions = iter(f"how do I {WORDS[i % len(WORDS)]} a {WORDS[(i * 3) % len(WORDS)]} {i}"
+                         for i in range(queries + 10))
+        latency = summarize(time_calls(lambda: retriever.invoke(next(questions)), queries, warmup=10))
+        results['modes'][mode] = {'build_seconds': build_seconds, 'retrieve': latency}
+        print(f"{mode}: build {build_seconds:.2f}s, retrieve p50 {latency['p50_ms']:.2f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retriever latency over a FAISS store with fake embeddings.")
+    parser.add_argument("--documents", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--modes", default=",".join(INDEX_MODES))
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per query embedding call")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("retrieval", run(args.documents, args.queries, args.k, args.modes.split(","), args.dim,
+                            args.embed_latency), args.output)
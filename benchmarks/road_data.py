@@ -0,0 +1,129 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import BOUNDS, report, summarize, time_calls
+from benchmarks.synthetic_geojson import write_datasets
+from db import close_pools, pooled_connection
+from insert_road import copy_road_data, create_table_if_not_exists, insert_road_data, query_nearest_road, \
+    stream_road_data
+from insert_roadworks import copy_road_construction_data, create_road_construction_table, \
+    insert_road_construction_data, query_roadworks_within, stream_road_construction_data
+
+LOADERS = {
+    'road_segments': {'insert': insert_road_data, 'stream': stream_road_data, 'copy': copy_road_data},
+    'road_construction': {'insert': insert_road_construction_data, 'stream': stream_road_construction_data,
+                          'copy': copy_road_construction_data},
+}
+
+
+def table_rows(connection_string, table):
+    with pooled_connection(connection_string) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT count(*) FROM {table}")
+            return cur.fetchone()[0]
+
+
+def truncate(connection_string, table):
+    with pooled_connection(connection_string) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"TRUNCATE {table}")
+
+
+def table_bytes(connection_string, table):
+    with pooled_connection(connection_string) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"ANALYZE {table}")
+            cur.execute("SELECT pg_table_size(%s), pg_indexes_size(%s)", (table, table))
+            data, indexes = cur.fetchone()
+    return {'table_bytes': data, 'index_bytes': indexes}
+
+
+def measure_ingest(connection_string, table, path, features, methods):
+    # Each loader starts from an empty table; the last one's rows are kept
+    # for the query benchmarks.
+    results = {}
+    for method in methods:
+        truncate(connection_string, table)
+        start = time.perf_counter()
+        LOADERS[table][method](connection_string, path)
+        seconds = time.perf_counter() - start
+        rows = table_rows(connection_string, table)
+        results[method] = {
+            'seconds': seconds,
+            'rows': rows,
+            'features_per_second': features / seconds,
+            **table_bytes(connection_string, table),
+        }
+        print(f"{table} {method}: {rows} rows in {seconds:.1f}s")
+    return results
+
+
+def measure_queries(connection_string, queries, radius, seed=0):
+    rng = np.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = BOUNDS
+    points = iter(zip(rng.uniform(min_lat, max_lat, queries * 2), rng.uniform(min_lon, max_lon, queries * 2)))
+    matches = []
+
+    def nearest_road():
+        query_nearest_road(connection_string, *next(points))
+
+    def roadworks():
+        matches.append(len(query_roadworks_within(connection_string, *next(points), radius)))
+
+    # A few calls first so each pooled connection has its statements prepared.
+    results = {
+        'nearest_road': summarize(time_calls(nearest_road, queries, warmup=10)),
+        'roadworks_within': summarize(time_calls(roadworks, queries, warmup=10)),
+    }
+    results['roadworks_within']['radius_m'] = radius
+    results['roadworks_within']['mean_matches'] = float(np.mean(matches)) if matches else 0.0
+    return results
+
+
+def run(connection_string, roads, worksites, queries, radius, methods, data_dir=None, truncate_tables=False):
+    create_table_if_not_exists(connection_string)
+    create_road_construction_table(connection_string)
+    for table in LOADERS:
+        if not truncate_tables and table_rows(connection_string, table):
+            raise SystemExit(f"{table} is not empty; run against a scratch database with --truncate")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        roads_path, worksites_path = write_datasets(data_dir or directory, roads, worksites)
+        results = {
+            'roads': roads,
+            'worksites': worksites,
+            'generate_seconds': time.perf_counter() - start,
+            'geojson_bytes': {'road_segments': os.path.getsize(roads_path),
+                              'road_construction': os.path.getsize(worksites_path)},
+            'ingest': {
+                'road_segments': measure_ingest(connection_string, 'road_segments', roads_path, roads, methods),
+                'road_construction': measure_ingest(connection_string, 'road_construction', worksites_path,
+                                                    worksites, methods),
+            },
+        }
+    results['queries'] = measure_queries(connection_string, queries, radius)
+    close_pools()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest throughput and query latency of the road tables on "
+                                                 "synthetic data in a local PostGIS. Empties both tables.")
+    parser.add_argument("connection_string")
+    parser.add_argument("--roads", type=int, default=50000)
+    parser.add_argument("--worksites", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--radius", type=float, default=100)
+    parser.add_argument("--methods", default="insert,stream,copy")
+    parser.add_argument("--data-dir", help="Keep the generated GeoJSON here instead of a temporary directory")
+    parser.add_argument("--truncate", action="store_true", help="Allow emptying non-empty tables")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("road_data", run(args.connection_string, args.roads, args.worksites, args.queries, args.radius,
+                            args.methods.split(","), args.data_dir, args.truncate), args.output)
@@ -0,0 +1,62 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import report, summarize
+from db import close_pools
+from insert_road import query_nearest_road
+from road_index import DEFAULT_CELL_SIZE, RoadIndex
+
+
+def run(connection_string, samples, cell_size, seed=0):
+    index = RoadIndex(connection_string, cell_size=cell_size, auto_refresh=False)
+    start = time.perf_counter()
+    segment_count = index.refresh()
+    load_seconds = time.perf_counter() - start
+
+    segments, grid = index._snapshot
+    rng = np.random.default_rng(seed)
+    lons = rng.uniform(segments.x0.min(), segments.x0.max(), samples)
+    lats = rng.uniform(segments.y0.min(), segments.y0.max(), samples)
+
+    local_samples = []
+    database_samples = []
+    matches = 0
+    for lat, lon in zip(lats, lons):
+        start = time.perf_counter()
+        local = index.nearest(lat, lon)
+        local_samples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        remote = query_nearest_road(connection_string, lat, lon)
+        database_samples.append(time.perf_counter() - start)
+
+        # Ties between roads at the same distance may resolve differently, so
+        # agreement is judged on distance rather than road name.
+        if remote is not None and abs(local[2] - remote[2]) < 1e-9:
+            matches += 1
+    close_pools()
+
+    local_summary = summarize(local_samples)
+    database_summary = summarize(database_samples)
+    return {
+        'segments': segment_count,
+        'cells': len(grid.cell_keys) if grid is not None else 0,
+        'load_seconds': load_seconds,
+        'in_process': local_summary,
+        'database': database_summary,
+        'p50_speedup': database_summary['p50_ms'] / local_summary['p50_ms'] if local_summary['p50_ms'] else None,
+        'agreement': matches / samples if samples else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the in-process road index against PostGIS KNN.")
+    parser.add_argument("connection_string")
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--cell-size", type=float, default=DEFAULT_CELL_SIZE)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("road_index", run(args.connection_string, args.samples, args.cell_size), args.output)
@@ -0,0 +1,88 @@
+import argparse
+
+import numpy as np
+
+from benchmarks.common import BOUNDS, report, summarize, time_calls
+from db import close_pools, pooled_connection
+
+GEOGRAPHY_SQL = """
+    SELECT worksite_name, ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326)::geography) AS distance
+    FROM {table}
+    WHERE ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326)::geography, %(radius)s)
+    ORDER BY distance
+"""
+
+NZTM_SQL = """
+    SELECT worksite_name, ST_Distance(c.geom_nztm, q.pt) AS distance
+    FROM {table} c,
+         (SELECT ST_Transform(ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326), 2193) AS pt) q
+    WHERE ST_DWithin(c.geom_nztm, q.pt, %(radius)s)
+    ORDER BY distance
+"""
+
+
+def create_synthetic_table(conn, table, rows):
+    # Small square worksites scattered over BOUNDS; the table copies
+    # road_construction's columns, generated geom_nztm and indexes.
+    min_lon, min_lat, max_lon, max_lat = BOUNDS
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {table}")
+    cur.execute(f"CREATE TABLE {table} (LIKE road_construction INCLUDING ALL)")
+    cur.execute(f"""
+        INSERT INTO {table} (worksite_code, worksite_name, geom)
+        SELECT 'BENCH-' || i, 'Synthetic worksite ' || i,
+               ST_MakeEnvelope(x, y, x + 0.0005, y + 0.0005, 4326)
+        FROM (
+            SELECT i,
+                   %s + random() * %s AS x,
+                   %s + random() * %s AS y
+            FROM generate_series(1, %s) AS i
+        ) s
+    """, (min_lon, max_lon - min_lon, min_lat, max_lat - min_lat, rows))
+    cur.execute(f"ANALYZE {table}")
+    conn.commit()
+    cur.close()
+
+
+def run(connection_string, rows, queries, radius, table, keep):
+    with pooled_connection(connection_string) as conn:
+        create_synthetic_table(conn, table, rows)
+
+    rng = np.random.default_rng(0)
+    min_lon, min_lat, max_lon, max_lat = BOUNDS
+    points = iter(zip(rng.uniform(min_lon, max_lon, queries * 2), rng.uniform(min_lat, max_lat, queries * 2)))
+
+    results = {'rows': rows, 'radius_m': radius}
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        for name, sql in (('geography_cast', GEOGRAPHY_SQL), ('nztm_indexed', NZTM_SQL)):
+            matches = []
+
+            def lookup():
+                lon, lat = next(points)
+                cur.execute(sql.format(table=table), {'lon': lon, 'lat': lat, 'radius': radius})
+                matches.append(len(cur.fetchall()))
+
+            results[name] = summarize(time_calls(lookup, queries))
+            results[name]['mean_matches'] = float(np.mean(matches))
+        if not keep:
+            cur.execute(f"DROP TABLE {table}")
+        cur.close()
+    close_pools()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark roadworks proximity search on a synthetic table.")
+    parser.add_argument("connection_string")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius", type=float, default=100.0)
+    parser.add_argument("--table", default="road_construction_bench")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic table afterwards")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("roadworks_proximity",
+           run(args.connection_string, args.rows, args.queries, args.radius, args.table, args.keep),
+           args.output)
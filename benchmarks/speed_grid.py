@@ -0,0 +1,114 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import report, summarize
+from db import close_pools
+from insert_road import query_nearest_road
+from road_index import RoadIndex
+from speed_grid import DEFAULT_GRID_CELL_SIZE, SpeedGrid, build_speed_grid
+
+
+def directory_bytes(path):
+    return {name: os.path.getsize(os.path.join(path, name)) for name in sorted(os.listdir(path))}
+
+
+def run(connection_string, samples, cell_size, batch_size, seed=0):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'speed_grid')
+        start = time.perf_counter()
+        meta = build_speed_grid(connection_string, path, cell_size)
+        build_seconds = time.perf_counter() - start
+        if meta is None:
+            close_pools()
+            return {'segments': 0}
+        files = directory_bytes(path)
+
+        start = time.perf_counter()
+        grid = SpeedGrid(path)
+        open_seconds = time.perf_counter() - start
+
+        index = RoadIndex(connection_string, auto_refresh=False)
+        index.refresh()
+
+        # Sample inside the grid's extent, where roads are.
+        rng = np.random.default_rng(seed)
+        lons = rng.uniform(grid.origin_x, grid.origin_x + grid.columns * grid.cell_size, samples)
+        lats = rng.uniform(grid.origin_y, grid.origin_y + grid.rows * grid.cell_size, samples)
+
+        grid_samples = []
+        index_samples = []
+        database_samples = []
+        distance_matches = 0
+        speed_matches = 0
+        compared = 0
+        for lat, lon in zip(lats, lons):
+            start = time.perf_counter()
+            local = grid.nearest(lat, lon)
+            grid_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            index.nearest(lat, lon)
+            index_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            remote = query_nearest_road(connection_string, lat, lon)
+            database_samples.append(time.perf_counter() - start)
+
+            if local is None or remote is None:
+                continue
+            compared += 1
+            # As in the road_index benchmark, ties may pick a different road
+            # at the same distance, so agreement is judged on distance; the
+            # speed limit is what callers actually use.
+            if abs(local[2] - remote[2]) < 1e-9:
+                distance_matches += 1
+            if local[1] == remote[1]:
+                speed_matches += 1
+
+        batch_lats = rng.uniform(grid.origin_y, grid.origin_y + grid.rows * grid.cell_size, batch_size)
+        batch_lons = rng.uniform(grid.origin_x, grid.origin_x + grid.columns * grid.cell_size, batch_size)
+        start = time.perf_counter()
+        grid.nearest_many(batch_lats, batch_lons)
+        batch_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        grid.lookup_speed_limits(batch_lats, batch_lons)
+        speed_batch_seconds = time.perf_counter() - start
+        close_pools()
+
+    grid_summary = summarize(grid_samples)
+    database_summary = summarize(database_samples)
+    return {
+        'segments': meta['segments'],
+        'covered_cells': meta['covered_cells'],
+        'candidates': meta['candidates'],
+        'build_seconds': build_seconds,
+        'open_seconds': open_seconds,
+        'file_bytes': files,
+        'total_bytes': sum(files.values()),
+        'speed_grid': grid_summary,
+        'road_index': summarize(index_samples),
+        'database': database_summary,
+        'p50_speedup_vs_database': (database_summary['p50_ms'] / grid_summary['p50_ms']
+                                    if grid_summary['p50_ms'] else None),
+        'batch_points_per_second': batch_size / batch_seconds,
+        'speed_only_points_per_second': batch_size / speed_batch_seconds,
+        'compared': compared,
+        'distance_agreement': distance_matches / compared if compared else None,
+        'speed_limit_agreement': speed_matches / compared if compared else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the precomputed speed grid against RoadIndex and PostGIS KNN.")
+    parser.add_argument("connection_string")
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=1_000_000)
+    parser.add_argument("--cell-size", type=float, default=DEFAULT_GRID_CELL_SIZE)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("speed_grid", run(args.connection_string, args.samples, args.cell_size, args.batch_size), args.output)
@@ -0,0 +1,69 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.common import free_port, report
+
+
+def _status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+def measure_startup(app, timeout, poll_interval=0.05):
+    # Time from process spawn until /healthz answers (server bound) and until
+    # /readyz returns 200 (agent built).
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    healthy = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            if healthy is None and _status(f"{base_url}/healthz") == 200:
+                healthy = time.perf_counter() - start
+            if healthy is not None and _status(f"{base_url}/readyz") == 200:
+                ready = time.perf_counter() - start
+                break
+            time.sleep(poll_interval)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {'healthz_seconds': healthy, 'readyz_seconds': ready}
+
+
+def run(app, runs, timeout):
+    samples = [measure_startup(app, timeout) for _ in range(runs)]
+    healthy = [s['healthz_seconds'] for s in samples if s['healthz_seconds'] is not None]
+    ready = [s['readyz_seconds'] for s in samples if s['readyz_seconds'] is not None]
+    return {
+        'app': app,
+        'runs': samples,
+        'mean_healthz_seconds': sum(healthy) / len(healthy) if healthy else None,
+        'mean_readyz_seconds': sum(ready) / len(ready) if ready else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure time to /healthz and /readyz for a server start.")
+    parser.add_argument("--app", default="serve:app", help="uvicorn app path, e.g. benchmarks.fake_app:app")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report("startup", run(args.app, args.runs, args.timeout), args.output)
@@ -0,0 +1,136 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks import agent_load, faiss_index, geometry_reduction, retrieval, road_data, road_index, speed_grid
+from benchmarks.common import report
+
+# Sizes per preset; "quick" finishes in well under a minute without a
+# database and is meant for comparing runs on one machine.
+PRESETS = {
+    'quick': {'documents': 5000, 'vectors': 20000, 'queries': 200, 'requests': 200,
+              'roads': 5000, 'worksites': 500, 'db_queries': 200},
+    'full': {'documents': 50000, 'vectors': 200000, 'queries': 2000, 'requests': 1000,
+             'roads': 100000, 'worksites': 10000, 'db_queries': 2000},
+}
+# Leaf names whose value should not grow (latencies, durations) or shrink
+# (throughputs) between runs. Tail latencies over a few hundred samples are
+# too noisy to gate on.
+LOWER_IS_BETTER = ('mean_ms', 'p50_ms', 'p95_ms', 'seconds')
+HIGHER_IS_BETTER = ('per_second', '_qps', '_rps', 'recall_at_k', 'agreement')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=REPO_ROOT).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'started_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def run(preset, connection_string=None, parts=None):
+    sizes = PRESETS[preset]
+    benchmarks = {
+        'retrieval': lambda: retrieval.run(sizes['documents'], sizes['queries'], 4, ['flat', 'hnsw'], 384, 0.0),
+        'faiss_index': lambda: faiss_index.run(sizes['vectors'], 384, sizes['queries'], 10,
+                                               ['flat', 'ivf_flat', 'hnsw', 'ivf_pq'], [16], [64], 0),
+        'agent': lambda: agent_load.run(sizes['requests'], 50, 16, 64, 0.05, 0.02),
+        'geometry_reduction': lambda: geometry_reduction.run(sizes['roads'], sizes['worksites'],
+                                                             ['none', '6:0', '6:1'], 3),
+    }
+    if connection_string:
+        # road_data loads the tables the other two read, so it goes first.
+        benchmarks.update({
+            'road_data': lambda: road_data.run(connection_string, sizes['roads'], sizes['worksites'],
+                                               sizes['db_queries'], 100, ['insert', 'stream', 'copy'],
+                                               truncate_tables=True),
+            'road_index': lambda: road_index.run(connection_string, sizes['db_queries'],
+                                                 road_index.DEFAULT_CELL_SIZE),
+            'speed_grid': lambda: speed_grid.run(connection_string, sizes['db_queries'],
+                                                 speed_grid.DEFAULT_GRID_CELL_SIZE, 100000),
+        })
+
+    results = {'preset': preset, 'environment': environment(), 'benchmarks': {}}
+    for name, benchmark in benchmarks.items():
+        if parts and name not in parts:
+            continue
+        print(f"-- {name}")
+        start = time.perf_counter()
+        try:
+            results['benchmarks'][name] = benchmark()
+        except Exception as e:
+            # One broken part should not cost the results of the others.
+            logging.exception(f"Benchmark {name} failed")
+            results['benchmarks'][name] = {'error': f"{type(e).__name__}: {e}"}
+        results['benchmarks'][name]['wall_seconds'] = time.perf_counter() - start
+    return results
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        items = {}
+        for key, item in value.items():
+            items.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+        return items
+    if isinstance(value, list):
+        items = {}
+        for i, item in enumerate(value):
+            items.update(flatten(item, f"{prefix}[{i}]"))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(baseline, current, threshold):
+    # -> list of (metric, baseline, current, relative change) that got worse
+    # by more than threshold.
+    before = flatten(baseline.get('benchmarks', {}))
+    after = flatten(current.get('benchmarks', {}))
+    regressions = []
+    for metric, old in before.items():
+        new = after.get(metric)
+        if new is None or not old or metric.endswith('wall_seconds'):
+            continue
+        change = (new - old) / abs(old)
+        if metric.endswith(LOWER_IS_BETTER) and change > threshold:
+            regressions.append((metric, old, new, change))
+        elif metric.endswith(HIGHER_IS_BETTER) and -change > threshold:
+            regressions.append((metric, old, new, change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and write one JSON report.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default='quick')
+    parser.add_argument("--database", help="PostGIS connection string of a scratch database; enables the "
+                                           "road benchmarks, which empty road_segments and road_construction")
+    parser.add_argument("--only", help="Comma-separated benchmarks to run")
+    parser.add_argument("--compare", help="Earlier suite JSON to check this run against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change reported as a regression")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.preset, args.database, args.only.split(",") if args.only else None)
+    report("suite", results, args.output)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(baseline, results, args.threshold)
+        for metric, old, new, change in regressions:
+            print(f"REGRESSION {metric}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+        print(f"{len(regressions)} regression(s) against {args.compare} at {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from benchmarks.common import BOUNDS
+
+SPEED_LIMITS = ('30', '40', '50', '60', '80', '100')
+STATUSES = ('Active', 'Planned', 'Completed')
+WORK_STATUSES = ('In Progress', 'Not Started', 'Complete')
+
+
+def road_features(count, seed=0, bounds=BOUNDS, min_vertices=2, max_vertices=40, step=0.0005):
+    # Random-walk LineStrings with the properties of the speed limit layer
+    # that road_feature_to_row reads. Coordinates keep full float precision,
+    # as in the source data.
+    rng = np.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = bounds
+    vertex_counts = rng.integers(min_vertices, max_vertices + 1, count)
+    for i, vertices in enumerate(vertex_counts):
+        start = rng.uniform((min_lon, min_lat), (max_lon, max_lat))
+        heading = rng.uniform(0, 2 * np.pi)
+        # Gently curving roads: the heading drifts a little at each vertex.
+        headings = heading + np.cumsum(rng.normal(0, 0.2, vertices - 1))
+        steps = np.column_stack((np.cos(headings), np.sin(headings))) * step * rng.uniform(0.5, 1.5, (vertices - 1, 1))
+        coordinates = np.vstack((start, start + np.cumsum(steps, axis=0)))
+        yield {
+            'type': 'Feature',
+            'properties': {
+                'road_id': int(i),
+                'road_name': f"Synthetic Road {i % 5000}",
+                'Shape__Length': float(np.linalg.norm(steps, axis=1).sum() * 111_000),
+                'ns_speed_limit': SPEED_LIMITS[int(rng.integers(len(SPEED_LIMITS)))],
+            },
+            'geometry': {'type': 'LineString', 'coordinates': coordinates.tolist()},
+        }
+
+
+def _ring(rng, center, radius, vertices):
+    angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+    radii = radius * rng.uniform(0.6, 1.0, vertices)
+    ring = center + np.column_stack((np.cos(angles), np.sin(angles))) * radii[:, None]
+    return np.vstack((ring, ring[:1])).tolist()
+
+
+def worksite_features(count, seed=0, bounds=BOUNDS, multipolygon_share=0.2, min_vertices=4, max_vertices=60,
+                      radius=0.0005):
+    # Star-shaped Polygon worksites, a share of them MultiPolygons of two to
+    # four parts, with the properties construction_feature_to_row reads.
+    rng = np.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = bounds
+    for i in range(count):
+        center = rng.uniform((min_lon, min_lat), (max_lon, max_lat))
+        if rng.random() < multipolygon_share:
+            parts = int(rng.integers(2, 5))
+            offsets = rng.normal(0, radius * 3, (parts, 2))
+            geometry = {'type': 'MultiPolygon', 'coordinates': [
+                [_ring(rng, center + offset, radius, int(rng.integers(min_vertices, max_vertices + 1)))]
+                for offset in offsets]}
+        else:
+            geometry = {'type': 'Polygon', 'coordinates': [
+                _ring(rng, center, radius, int(rng.integers(min_vertices, max_vertices + 1)))]}
+        yield {
+            'type': 'Feature',
+            'properties': {
+                'WorksiteCode': f"SYN-{i}",
+                'WorksiteName': f"Synthetic worksite {i}",
+                'ProjectName': f"Synthetic project {i % 500}",
+                'Status': STATUSES[i % len(STATUSES)],
+                'WorksiteType': 'Road',
+                'Shape__Area': float(np.pi * (radius * 111_000) ** 2),
+                'Shape__Length': float(2 * np.pi * radius * 111_000),
+                'PrincipalOrganisation': 'Synthetic Transport',
+                'ProjectStartDate': '2024-01-01T00:00:00',
+                'ProjectEndDate': '2024-12-31T00:00:00',
+                'WorkStartDate': '2024-02-01T00:00:00',
+                'WorkCompletionDate': None,
+                'WorkStatus': WORK_STATUSES[i % len(WORK_STATUSES)],
+            },
+            'geometry': geometry,
+        }
+
+
+def write_feature_collection(features, path):
+    # Streams features into a FeatureCollection without holding them all.
+    count = 0
+    with open(path, 'w') as file:
+        file.write('{"type": "FeatureCollection", "features": [\n')
+        for feature in features:
+            if count:
+                file.write(',\n')
+            json.dump(feature, file)
+            count += 1
+        file.write('\n]}\n')
+    return count
+
+
+def write_datasets(directory, roads, worksites, seed=0):
+    # -> (roads path, worksites path)
+    os.makedirs(directory, exist_ok=True)
+    roads_path = os.path.join(directory, f"roads_{roads}.geojson")
+    worksites_path = os.path.join(directory, f"worksites_{worksites}.geojson")
+    write_feature_collection(road_features(roads, seed), roads_path)
+    write_feature_collection(worksite_features(worksites, seed), worksites_path)
+    return roads_path, worksites_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic road and worksite GeoJSON files.")
+    parser.add_argument("directory")
+    parser.add_argument("--roads", type=int, default=100000)
+    parser.add_argument("--worksites", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for path in write_datasets(args.directory, args.roads, args.worksites, args.seed):
+        print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
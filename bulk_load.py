@@ -0,0 +1,123 @@
+import struct
+from itertools import chain
+
+WKB_TYPES = {
+    'Point': 1,
+    'LineString': 2,
+    'Polygon': 3,
+    'MultiPoint': 4,
+    'MultiLineString': 5,
+    'MultiPolygon': 6,
+}
+EWKB_SRID_FLAG = 0x20000000
+
+ROAD_SEGMENT_COLUMNS = ('ramm_road_id', 'road_name', 'shape_length', 'speed_limit', 'geom')
+ROAD_CONSTRUCTION_COLUMNS = (
+    'worksite_code', 'worksite_name', 'project_name', 'status', 'worksite_type',
+    'shape_area', 'shape_length', 'principal_organisation', 'project_start_date',
+    'project_end_date', 'work_start_date', 'work_completion_date', 'work_status', 'geom',
+)
+
+
+def _pack_points(points):
+    # Only X/Y are written; any Z/M ordinates in the source are dropped to
+    # match the 2D geometry columns.
+    flat = list(chain.from_iterable((point[0], point[1]) for point in points))
+    return struct.pack('<I%dd' % len(flat), len(points), *flat)
+
+
+def _pack_geometry(geometry_type, coordinates, srid=None):
+    type_code = WKB_TYPES[geometry_type]
+    if srid is None:
+        header = struct.pack('<BI', 1, type_code)
+    else:
+        header = struct.pack('<BII', 1, type_code | EWKB_SRID_FLAG, srid)
+
+    if geometry_type == 'Point':
+        return header + struct.pack('<2d', coordinates[0], coordinates[1])
+    if geometry_type == 'LineString':
+        return header + _pack_points(coordinates)
+    if geometry_type == 'Polygon':
+        return header + struct.pack('<I', len(coordinates)) + b''.join(_pack_points(ring) for ring in coordinates)
+
+    member_type = geometry_type[len('Multi'):]
+    members = b''.join(_pack_geometry(member_type, member) for member in coordinates)
+    return header + struct.pack('<I', len(coordinates)) + members
+
+
+def geometry_to_ewkb(geometry, srid=4326):
+    if geometry['type'] not in WKB_TYPES:
+        raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+    return _pack_geometry(geometry['type'], geometry['coordinates'], srid)
+
+
+def geometry_to_hex_ewkb(geometry, srid=4326):
+    # PostGIS accepts hex EWKB as the text input form of geometry, so the
+    # server never has to parse WKT.
+    return geometry_to_ewkb(geometry, srid).hex()
+
+
+def _copy_text(value):
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+class CopyStream:
+    # File-like adapter that renders rows to COPY text format on demand, so
+    # copy_expert can consume a generator without materialising it.
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+        self.row_count = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += '\t'.join(_copy_text(value) for value in row) + '\n'
+            self.row_count += 1
+        if size < 0:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def copy_to_staging(cur, table, columns, rows, extra_columns=()):
+    # Creates an unconstrained temp copy of the target's columns (plus any
+    # (name, type) extra_columns in front) and streams rows into it.
+    column_list = ', '.join(columns)
+    staging = f"{table}_staging"
+    extra_select = ''.join(f"NULL::{column_type} AS {name}, " for name, column_type in extra_columns)
+    cur.execute(f"""
+        CREATE TEMP TABLE {staging} ON COMMIT DROP AS
+        SELECT {extra_select}{column_list} FROM {table} WITH NO DATA
+    """)
+    copy_columns = ', '.join([name for name, _ in extra_columns] + list(columns))
+    stream = CopyStream(rows)
+    cur.copy_expert(f"COPY {staging} ({copy_columns}) FROM STDIN", stream)
+    return staging, stream.row_count
+
+
+def copy_rows(conn, table, columns, rows):
+    # COPY into a staging table, then move everything into the target with
+    # one INSERT ... SELECT inside the same transaction.
+    column_list = ', '.join(columns)
+    cur = conn.cursor()
+    try:
+        staging, _ = copy_to_staging(cur, table, columns, rows)
+        cur.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging}")
+        inserted = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return inserted
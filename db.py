@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "10"))
+# Connections idle for longer than this are pinged before being handed out.
+HEALTH_CHECK_INTERVAL = float(os.environ.get("DB_HEALTH_CHECK_INTERVAL", "30"))
+CHECKOUT_TIMEOUT = float(os.environ.get("DB_CHECKOUT_TIMEOUT", "30"))
+
+# Server-side prepared statements, created lazily on each pooled connection
+# the first time they are executed there.
+PREPARED_STATEMENTS = {
+    'nearest_road': ("(float8, float8)", """
+        SELECT
+            road_name,
+            speed_limit,
+            ST_Distance(geom, ST_SetSRID(ST_MakePoint($1, $2), 4326)) AS distance
+        FROM road_segments
+        ORDER BY geom <-> ST_SetSRID(ST_MakePoint($1, $2), 4326)
+        LIMIT 1
+    """),
+    'nearest_roads_batch': ("(float8[], float8[])", """
+        SELECT p.ord, r.road_name, r.speed_limit, r.distance
+        FROM unnest($1, $2) WITH ORDINALITY AS p(lon, lat, ord)
+        CROSS JOIN LATERAL (SELECT ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326) AS pt) q
+        LEFT JOIN LATERAL (
+            SELECT road_name, speed_limit, ST_Distance(geom, q.pt) AS distance
+            FROM road_segments
+            ORDER BY geom <-> q.pt
+            LIMIT 1
+        ) r ON true
+        ORDER BY p.ord
+    """),
+    # Every road that can be nearest to some point within $3 degrees of the
+    # given one: anything nearer to such a point than the road nearest the
+    # given one is within that road's distance plus 2 * $3 of it.
+    'roads_near_area': ("(float8, float8, float8)", """
+        WITH q AS (SELECT ST_SetSRID(ST_MakePoint($1, $2), 4326) AS pt),
+             nearest AS (
+                 SELECT ST_Distance(r.geom, q.pt) AS distance
+                 FROM road_segments r, q
+                 ORDER BY r.geom <-> q.pt
+                 LIMIT 1
+             )
+        SELECT r.road_name, r.speed_limit, ST_AsBinary(r.geom, 'NDR')
+        FROM road_segments r, q, nearest
+        WHERE ST_DWithin(r.geom, q.pt, nearest.distance + 2 * $3)
+    """),
+    # Distances are planar metres in NZTM (EPSG:2193), whose scale error is a
+    # fraction of a percent across mainland New Zealand.
+    'roadworks_near': ("(float8, float8, float8)", """
+        SELECT worksite_name, project_name, status, work_status,
+               ST_Distance(c.geom_nztm, q.pt) AS distance,
+               worksite_code
+        FROM road_construction c,
+             (SELECT ST_Transform(ST_SetSRID(ST_MakePoint($1, $2), 4326), 2193) AS pt) q
+        WHERE ST_DWithin(c.geom_nztm, q.pt, $3)
+        ORDER BY distance
+    """),
+    'roadworks_geometries_near': ("(float8, float8, float8)", """
+        SELECT worksite_name, project_name, status, work_status, worksite_code,
+               ST_AsBinary(c.geom, 'NDR')
+        FROM road_construction c,
+             (SELECT ST_Transform(ST_SetSRID(ST_MakePoint($1, $2), 4326), 2193) AS pt) q
+        WHERE ST_DWithin(c.geom_nztm, q.pt, $3)
+    """),
+}
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    def __init__(self, connection_string, minconn=POOL_MIN_SIZE, maxconn=POOL_MAX_SIZE,
+                 health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.pool = ThreadedConnectionPool(minconn, maxconn, connection_string,
+                                           connection_factory=PooledConnection)
+        # ThreadedConnectionPool raises when exhausted; the semaphore makes
+        # callers wait for a free connection instead.
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.health_check_interval = health_check_interval
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout=CHECKOUT_TIMEOUT):
+        if not self.slots.acquire(timeout=timeout):
+            raise PoolError("Timed out waiting for a pooled connection")
+        try:
+            conn = self.pool.getconn()
+            if not self._is_healthy(conn):
+                logging.warning("Discarding unhealthy pooled connection")
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+            return conn
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        conn.last_used = time.monotonic()
+        try:
+            self.pool.putconn(conn, close=close or conn.closed)
+        finally:
+            self.slots.release()
+
+    def closeall(self):
+        self.pool.closeall()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(connection_string, minconn=None, maxconn=None):
+    with _pools_lock:
+        pool = _pools.get(connection_string)
+        if pool is None:
+            pool = ConnectionPool(connection_string,
+                                  minconn if minconn is not None else POOL_MIN_SIZE,
+                                  maxconn if maxconn is not None else POOL_MAX_SIZE)
+            _pools[connection_string] = pool
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
+
+@contextmanager
+def pooled_connection(connection_string):
+    pool = get_pool(connection_string)
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+        if not conn.closed:
+            conn.commit()
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
+
+
+def execute_prepared(cur, name, params):
+    conn = cur.connection
+    if name not in conn.prepared:
+        param_types, query = PREPARED_STATEMENTS[name]
+        cur.execute(f"PREPARE {name} {param_types} AS {query}")
+        conn.prepared.add(name)
+    placeholders = ', '.join(['%s'] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})", params)
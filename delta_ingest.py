@@ -0,0 +1,186 @@
+import hashlib
+import json
+import logging
+
+from bulk_load import ROAD_CONSTRUCTION_COLUMNS, ROAD_SEGMENT_COLUMNS, CopyStream, copy_to_staging, geometry_to_hex_ewkb
+from db import pooled_connection
+from geojson_stream import iter_features, with_progress
+from geometry_reduction import default_reducer
+from ingest_hooks import notify_ingest
+from insert_road import road_feature_to_row
+from insert_roadworks import construction_feature_to_row
+
+
+def road_source_key(feature):
+    # ramm road ids repeat across speed-limit segments of the same road, so
+    # prefer the export's per-feature OBJECTID when there is one.
+    properties = feature['properties']
+    if properties.get('OBJECTID') is not None:
+        return f"oid:{properties['OBJECTID']}"
+    return f"road:{properties['road_id']}"
+
+
+def construction_source_key(feature):
+    return str(feature['properties']['WorksiteCode'])
+
+
+DELTA_TARGETS = {
+    'road_segments': (ROAD_SEGMENT_COLUMNS, road_feature_to_row, road_source_key),
+    'road_construction': (ROAD_CONSTRUCTION_COLUMNS, construction_feature_to_row, construction_source_key),
+}
+
+STAGING_KEY_COLUMNS = (('source_key', 'VARCHAR(100)'), ('fingerprint', 'CHAR(32)'))
+
+
+def feature_fingerprint(feature):
+    # Reduced geometries hold NumPy arrays, fingerprinted as their lists.
+    payload = json.dumps([feature.get('properties'), feature.get('geometry')],
+                         sort_keys=True, separators=(',', ':'), default=lambda value: value.tolist())
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def ensure_delta_schema(connection_string, table):
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_fingerprints (
+            table_name VARCHAR(63) NOT NULL,
+            source_key VARCHAR(100) NOT NULL,
+            fingerprint CHAR(32) NOT NULL,
+            PRIMARY KEY (table_name, source_key)
+        );
+        """)
+        cur.execute(f"""
+        ALTER TABLE {table} ADD COLUMN IF NOT EXISTS source_key VARCHAR(100);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_source_key ON {table} (source_key);
+        """)
+        cur.close()
+
+
+def load_fingerprints(conn, table):
+    cur = conn.cursor(name='delta_fingerprints')
+    cur.itersize = 50000
+    cur.execute("SELECT source_key, fingerprint FROM ingest_fingerprints WHERE table_name = %s", (table,))
+    fingerprints = dict(cur)
+    cur.close()
+    return fingerprints
+
+
+def delta_ingest(connection_string, geojson_file_path, table, delete_missing=True, reducer=None):
+    # reducer: see insert_road.insert_road_data. Features are fingerprinted
+    # after reduction, so changing the INGEST_* settings rewrites the rows
+    # whose stored geometry differs.
+    if table not in DELTA_TARGETS:
+        raise ValueError(f"Unsupported ingest table: {table}")
+    reducer = reducer or default_reducer()
+    encode_geometry = reducer.to_hex_ewkb if reducer else geometry_to_hex_ewkb
+    columns, feature_to_row, source_key = DELTA_TARGETS[table]
+    column_list = ', '.join(columns)
+    ensure_delta_schema(connection_string, table)
+
+    stats = {'unchanged': 0, 'inserted': 0, 'updated': 0, 'deleted': 0, 'rejected': 0, 'duplicates': 0}
+    with pooled_connection(connection_string) as conn:
+        stored = load_fingerprints(conn, table)
+        cur = conn.cursor()
+        if not stored:
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table} WHERE source_key IS NULL)")
+            if cur.fetchone()[0]:
+                logging.warning(f"{table} has rows loaded without source keys; delta ingest will not "
+                                f"update or delete them. Truncate {table} before the first delta load.")
+
+        seen = set()
+
+        def changed_rows():
+            features = with_progress(iter_features(geojson_file_path), f"{table} features")
+            if reducer:
+                features = reducer.reduce_features(features)
+            for index, feature in enumerate(features):
+                try:
+                    key = source_key(feature)
+                    if key in seen:
+                        stats['duplicates'] += 1
+                        logging.warning(f"Skipping feature {index}: duplicate source key {key}")
+                        continue
+                    # Marked seen before conversion so a feature that fails to
+                    # convert keeps its previous row rather than being deleted.
+                    seen.add(key)
+                    fingerprint = feature_fingerprint(feature)
+                    if stored.get(key) == fingerprint:
+                        stats['unchanged'] += 1
+                        continue
+                    row = feature_to_row(feature, encode_geometry)
+                    stats['updated' if key in stored else 'inserted'] += 1
+                    yield (key, fingerprint) + tuple(row)
+                except Exception as e:
+                    stats['rejected'] += 1
+                    logging.error(f"Error processing feature {index}: {str(e)}")
+
+        # Only changed features are encoded and sent; unchanged ones stop at
+        # the fingerprint comparison above.
+        staging, _ = copy_to_staging(cur, table, columns, changed_rows(), extra_columns=STAGING_KEY_COLUMNS)
+
+        cur.execute("CREATE TEMP TABLE delta_deleted (source_key VARCHAR(100)) ON COMMIT DROP")
+        if delete_missing:
+            deleted_keys = [(key,) for key in stored if key not in seen]
+            if deleted_keys:
+                cur.copy_expert("COPY delta_deleted (source_key) FROM STDIN", CopyStream(deleted_keys))
+
+        # Extent of everything that is about to change (old and new shapes),
+        # for listeners that invalidate by area.
+        cur.execute(f"""
+            SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM (
+                SELECT ST_Extent(g) AS e FROM (
+                    SELECT geom AS g FROM {staging}
+                    UNION ALL
+                    SELECT t.geom FROM {table} t JOIN {staging} s ON t.source_key = s.source_key
+                    UNION ALL
+                    SELECT t.geom FROM {table} t JOIN delta_deleted d ON t.source_key = d.source_key
+                ) changed
+            ) extent
+        """)
+        bbox = cur.fetchone()
+        bbox = None if bbox[0] is None else tuple(bbox)
+
+        updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in columns)
+        cur.execute(f"""
+            INSERT INTO {table} (source_key, {column_list})
+            SELECT source_key, {column_list} FROM {staging}
+            ON CONFLICT (source_key) DO UPDATE SET {updates}
+        """)
+        cur.execute(f"DELETE FROM {table} t USING delta_deleted d WHERE t.source_key = d.source_key")
+        stats['deleted'] = cur.rowcount
+
+        cur.execute(f"""
+            INSERT INTO ingest_fingerprints (table_name, source_key, fingerprint)
+            SELECT %s, source_key, fingerprint FROM {staging}
+            ON CONFLICT (table_name, source_key) DO UPDATE SET fingerprint = EXCLUDED.fingerprint
+        """, (table,))
+        cur.execute("""
+            DELETE FROM ingest_fingerprints f USING delta_deleted d
+            WHERE f.table_name = %s AND f.source_key = d.source_key
+        """, (table,))
+        cur.close()
+
+    print(f"Delta ingest into {table}: {stats['inserted']} inserted, {stats['updated']} updated, "
+          f"{stats['deleted']} deleted, {stats['unchanged']} unchanged, {stats['rejected']} rejected")
+    if reducer:
+        print(f"Geometry reduction: {reducer.describe()}")
+    if stats['inserted'] or stats['updated'] or stats['deleted']:
+        notify_ingest(table, bbox, connection_string)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Apply only the changed features of a GeoJSON file.")
+    parser.add_argument("connection_string")
+    parser.add_argument("geojson_file_path")
+    parser.add_argument("--table", choices=sorted(DELTA_TARGETS), default='road_construction')
+    parser.add_argument("--keep-missing", action="store_true",
+                        help="Do not delete rows whose source key is absent from the file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    delta_ingest(args.connection_string, args.geojson_file_path, args.table,
+                 delete_missing=not args.keep_missing)
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", ".embedding_cache.sqlite3")
+MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# SQLite's default limit on host parameters per statement is 999.
+LOOKUP_CHUNK = 500
+
+
+class CachedEmbeddings(Embeddings):
+    # Wraps an Embeddings object with a local SQLite store of float32 vectors
+    # keyed by (model, text hash). Only cache misses reach the wrapped model,
+    # and least-recently-used rows are evicted beyond max_entries.
+    def __init__(self, underlying, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.underlying = underlying
+        self.model = getattr(underlying, 'model', None) or type(underlying).__name__
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self.conn.commit()
+        # Running row count for eviction; stored keys were just looked up and
+        # missed, so each write adds about one row per item.
+        (self.entries,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.model}\0{kind}\0{text}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), LOOKUP_CHUNK):
+            chunk = unique_keys[start:start + LOOKUP_CHUNK]
+            placeholders = ', '.join(['?'] * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk).fetchall()
+            found.update(rows)
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                  [(now, key) for key in found])
+        return found
+
+    def _store(self, items):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+            [(key, vector.tobytes(), now) for key, vector in items])
+        self.entries += len(items)
+        if self.entries > self.max_entries:
+            deleted = self.conn.execute("""
+                DELETE FROM embeddings WHERE key IN (
+                    SELECT key FROM embeddings ORDER BY last_access LIMIT ?
+                )
+            """, (self.entries - self.max_entries,)).rowcount
+            self.entries -= deleted
+
+    def _find(self, kind, texts):
+        keys = [self._key(kind, text) for text in texts]
+        with self.lock:
+            found = self._lookup(keys)
+            self.conn.commit()
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        return keys, found, missing
+
+    def _merge(self, keys, found, missing, vectors):
+        # -> one float32 row per key. Misses are rounded to float32 like the
+        # stored copies, so a text gets the same vector whether or not it
+        # was cached.
+        computed = dict(zip(missing.keys(), np.asarray(vectors, dtype=np.float32))) if missing else {}
+        if computed:
+            with self.lock:
+                self._store(list(computed.items()))
+                self.conn.commit()
+        hits = sum(1 for key in keys if key not in missing)
+        with self.lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return [computed[key] if key in computed else np.frombuffer(found[key], dtype=np.float32) for key in keys]
+
+    def _embed(self, kind, texts, embed_missing):
+        keys, found, missing = self._find(kind, texts)
+        vectors = embed_missing(list(missing.values())) if missing else None
+        return self._merge(keys, found, missing, vectors)
+
+    async def _aembed(self, kind, texts, aembed_missing):
+        # SQLite work runs in a worker thread; only the model call is awaited
+        # on the loop.
+        keys, found, missing = await asyncio.to_thread(self._find, kind, texts)
+        vectors = await aembed_missing(list(missing.values())) if missing else None
+        return await asyncio.to_thread(self._merge, keys, found, missing, vectors)
+
+    def _embed_missing_documents(self, texts):
+        if hasattr(self.underlying, 'embed_array'):
+            return self.underlying.embed_array(texts)
+        return self.underlying.embed_documents(texts)
+
+    async def _aembed_missing_documents(self, texts):
+        if hasattr(self.underlying, 'aembed_array'):
+            return await self.underlying.aembed_array(texts)
+        return await self.underlying.aembed_documents(texts)
+
+    async def _aembed_missing_query(self, texts):
+        return [await self.underlying.aembed_query(texts[0])]
+
+    @staticmethod
+    def _stack(rows):
+        return np.vstack(rows) if rows else np.empty((0, 0), dtype=np.float32)
+
+    def embed_array(self, texts):
+        # Contiguous float32 rows, as BatchedEmbeddings.embed_array returns.
+        return self._stack(self._embed('document', texts, self._embed_missing_documents))
+
+    async def aembed_array(self, texts):
+        return self._stack(await self._aembed('document', texts, self._aembed_missing_documents))
+
+    def embed_documents(self, texts):
+        return [row.tolist() for row in self._embed('document', texts, self._embed_missing_documents)]
+
+    async def aembed_documents(self, texts):
+        return [row.tolist() for row in await self._aembed('document', texts, self._aembed_missing_documents)]
+
+    def embed_query(self, text):
+        return self._embed('query', [text], lambda missing: [self.underlying.embed_query(missing[0])])[0].tolist()
+
+    async def aembed_query(self, text):
+        return (await self._aembed('query', [text], self._aembed_missing_query))[0].tolist()
+
+    def close(self):
+        if hasattr(self.underlying, 'close'):
+            self.underlying.close()
+        with self.lock:
+            self.conn.close()
+
+    @property
+    def stats(self):
+        with self.lock:
+            (entries,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'entries': entries,
+            }
@@ -0,0 +1,261 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import numpy as np
+import openai
+import tiktoken
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-ada-002")
+# OpenAI accepts up to 8191 tokens per input, 2048 inputs and 300k tokens
+# per request; the batch token default leaves some headroom.
+MAX_INPUT_TOKENS = int(os.environ.get("EMBEDDING_MAX_INPUT_TOKENS", "8191"))
+MAX_BATCH_TOKENS = int(os.environ.get("EMBEDDING_MAX_BATCH_TOKENS", "250000"))
+MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", "2048"))
+MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", "6"))
+CHUNK_TOKENS = int(os.environ.get("EMBEDDING_CHUNK_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("EMBEDDING_CHUNK_OVERLAP_TOKENS", "64"))
+
+
+def token_text_splitter(chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, model=EMBEDDING_MODEL):
+    # Same splitting rules as RecursiveCharacterTextSplitter() but with chunk
+    # sizes measured in the embedding model's tokens, so chunks are uniform
+    # and never exceed the model's input limit.
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name=model, chunk_size=chunk_tokens, chunk_overlap=overlap_tokens)
+
+
+def pack_batches(token_counts, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE):
+    # Greedy packing in input order: a batch is closed when the next input
+    # would break either limit. Chunks are small next to the token cap, so
+    # batches end up within one chunk of it.
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for i, count in enumerate(token_counts):
+        if batch and (batch_tokens + count > max_batch_tokens or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += count
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class AdaptiveLimiter:
+    # AIMD concurrency for embedding requests: the number of requests in
+    # flight halves on every rate-limit response and grows by one after a
+    # full window of successes, up to max_concurrency. A rate limit with a
+    # Retry-After also pauses every sender until then.
+    def __init__(self, max_concurrency, limit=None):
+        self.max_concurrency = max_concurrency
+        self.limit = limit or max_concurrency
+        self.active = 0
+        self.successes = 0
+        self.paused_until = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        self.successes += 1
+        if self.successes >= self.limit and self.limit < self.max_concurrency:
+            self.limit += 1
+            self.successes = 0
+
+    def on_rate_limit(self, retry_after):
+        self.limit = max(1, self.limit // 2)
+        self.successes = 0
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+class BatchedEmbeddings(Embeddings):
+    # OpenAI-compatible embeddings that tokenize once with tiktoken, pack
+    # token arrays into requests near the batch token and size limits, run
+    # the requests concurrently under an adaptive limit with rate-limit
+    # aware retries, and decode base64 responses straight into one
+    # contiguous float32 array. Each event loop keeps one client (and its
+    # keep-alive connections); synchronous calls all run on one background
+    # loop. close() shuts the clients and that loop down.
+    def __init__(self, model=EMBEDDING_MODEL, base_url=None, api_key=None, max_batch_tokens=MAX_BATCH_TOKENS,
+                 max_batch_size=MAX_BATCH_SIZE, max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES,
+                 max_input_tokens=MAX_INPUT_TOKENS):
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_input_tokens = max_input_tokens
+        # Learned concurrency carries over between calls.
+        self.concurrency = max_concurrency
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.clients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
+        self.loop = None
+        self.loop_thread = None
+        self.loop_lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'tokens': 0}
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+        if client is None:
+            client = self.clients[loop] = openai.AsyncOpenAI(
+                api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return client
+
+    def _tokenize(self, texts):
+        tokens = []
+        for text in texts:
+            # The API rejects empty input; a lone space embeds the same way.
+            encoded = self.encoding.encode(text or " ", disallowed_special=())
+            if len(encoded) > self.max_input_tokens:
+                logging.warning(f"Truncating embedding input from {len(encoded)} to {self.max_input_tokens} tokens")
+                encoded = encoded[:self.max_input_tokens]
+            tokens.append(encoded)
+        return tokens
+
+    async def _request(self, limiter, batch_tokens):
+        client = self._client()
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            try:
+                # Posted directly: embeddings.create() walks every token id of
+                # the body in Python to transform it, which dominates the cost
+                # of large batches.
+                response = await client.post(
+                    "/embeddings", cast_to=httpx.Response,
+                    body={"input": batch_tokens, "model": self.model, "encoding_format": "base64"})
+                limiter.on_success()
+                return json.loads(response.content)["data"]
+            except openai.RateLimitError as e:
+                retry_after = _retry_after(e)
+                limiter.on_rate_limit(retry_after)
+                self.stats['rate_limited'] += 1
+                error = e
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                retry_after = None
+                error = e
+            finally:
+                await limiter.release()
+            if attempt == self.max_retries:
+                raise error
+            self.stats['retries'] += 1
+            # Exponential backoff with jitter unless the server said when.
+            await asyncio.sleep(retry_after or min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random()))
+
+    async def aembed_array(self, texts):
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        tokens = self._tokenize(texts)
+        limiter = AdaptiveLimiter(self.max_concurrency, self.concurrency)
+        vectors = None
+
+        async def embed_batch(indices):
+            nonlocal vectors
+            data = await self._request(limiter, [tokens[i] for i in indices])
+            self.stats['requests'] += 1
+            self.stats['tokens'] += sum(len(tokens[i]) for i in indices)
+            for item in data:
+                embedding = item["embedding"]
+                if isinstance(embedding, str):
+                    vector = np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+                else:
+                    vector = np.asarray(embedding, dtype=np.float32)
+                if vectors is None:
+                    vectors = np.empty((len(texts), len(vector)), dtype=np.float32)
+                vectors[indices[item["index"]]] = vector
+
+        batches = pack_batches([len(t) for t in tokens], self.max_batch_tokens, self.max_batch_size)
+        try:
+            await asyncio.gather(*(embed_batch(indices) for indices in batches))
+        finally:
+            self.concurrency = limiter.limit
+        return vectors
+
+    def _background_loop(self):
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.loop_thread = threading.Thread(target=self.loop.run_forever, name="embedding-loop", daemon=True)
+                self.loop_thread.start()
+            return self.loop
+
+    def embed_array(self, texts):
+        # Also safe from inside another event loop, which this blocks.
+        return asyncio.run_coroutine_threadsafe(self.aembed_array(texts), self._background_loop()).result()
+
+    def close(self):
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop, client in list(self.clients.items()):
+            if loop.is_closed():
+                continue
+            if loop is current:
+                loop.create_task(client.close())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.close(), loop).result()
+            else:
+                loop.run_until_complete(client.close())
+        self.clients.clear()
+        with self.loop_lock:
+            loop, thread = self.loop, self.loop_thread
+            self.loop = self.loop_thread = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
+
+    async def aembed_documents(self, texts):
+        return (await self.aembed_array(texts)).tolist()
+
+    async def aembed_query(self, text):
+        return (await self.aembed_array([text]))[0].tolist()
@@ -0,0 +1,110 @@
+import logging
+import math
+import os
+
+import faiss
+import numpy as np
+
+INDEX_MODES = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq')
+
+# Build-time settings: changing any of these changes the stored index.
+INDEX_MODE = os.environ.get("VECTOR_INDEX_MODE", "flat")
+IVF_NLIST = int(os.environ.get("VECTOR_INDEX_NLIST", "0"))  # 0 = about 4 * sqrt(n)
+HNSW_M = int(os.environ.get("VECTOR_INDEX_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("VECTOR_INDEX_EF_CONSTRUCTION", "200"))
+PQ_M = int(os.environ.get("VECTOR_INDEX_PQ_M", "0"))  # 0 = about dim / 8 subquantizers
+PQ_NBITS = int(os.environ.get("VECTOR_INDEX_PQ_NBITS", "8"))
+TRAIN_SAMPLE = int(os.environ.get("VECTOR_INDEX_TRAIN_SAMPLE", "100000"))
+# Search-time settings: applied on every load, no rebuild needed.
+NPROBE = int(os.environ.get("VECTOR_INDEX_NPROBE", "16"))
+EF_SEARCH = int(os.environ.get("VECTOR_INDEX_EF_SEARCH", "64"))
+
+# k-means wants at least this many training points per centroid.
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_settings(mode=None, nlist=None, hnsw_m=None, ef_construction=None, pq_m=None, pq_nbits=None):
+    mode = mode or INDEX_MODE
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Unknown vector index mode {mode!r}, expected one of {INDEX_MODES}")
+    return {
+        'mode': mode,
+        'nlist': IVF_NLIST if nlist is None else nlist,
+        'hnsw_m': HNSW_M if hnsw_m is None else hnsw_m,
+        'ef_construction': HNSW_EF_CONSTRUCTION if ef_construction is None else ef_construction,
+        'pq_m': PQ_M if pq_m is None else pq_m,
+        'pq_nbits': PQ_NBITS if pq_nbits is None else pq_nbits,
+    }
+
+
+def choose_nlist(count, nlist=0):
+    if not nlist:
+        nlist = int(4 * math.sqrt(count))
+    return max(1, min(nlist, count // MIN_POINTS_PER_CENTROID))
+
+
+def choose_pq_m(dim, pq_m=0):
+    # The number of subquantizers must divide the dimension.
+    target = pq_m or max(1, dim // 8)
+    return max(m for m in range(1, min(target, dim) + 1) if dim % m == 0)
+
+
+def effective_mode(mode, count, settings=None):
+    # Trained indexes need enough vectors to train on; small corpora (a
+    # single web page) stay exact.
+    settings = settings or {}
+    if mode in ('ivf_flat', 'ivf_pq') and count < MIN_POINTS_PER_CENTROID * 4:
+        return 'flat'
+    if mode == 'ivf_pq' and count < MIN_POINTS_PER_CENTROID * (1 << settings.get('pq_nbits', PQ_NBITS)):
+        return 'ivf_flat'
+    return mode
+
+
+def create_index(dim, count, settings):
+    mode = effective_mode(settings['mode'], count, settings)
+    if mode != settings['mode']:
+        logging.info(f"{count} vectors are too few for {settings['mode']}, using {mode}")
+    if mode == 'flat':
+        return faiss.IndexFlatL2(dim)
+    if mode == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, settings['hnsw_m'])
+        index.hnsw.efConstruction = settings['ef_construction']
+        return index
+    nlist = choose_nlist(count, settings['nlist'])
+    quantizer = faiss.IndexFlatL2(dim)
+    if mode == 'ivf_flat':
+        return faiss.IndexIVFFlat(quantizer, dim, nlist)
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, choose_pq_m(dim, settings['pq_m']), settings['pq_nbits'])
+
+
+def train_index(index, vectors, sample_size=TRAIN_SAMPLE, seed=0):
+    if index.is_trained:
+        return
+    if len(vectors) > sample_size:
+        rows = np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False)
+        vectors = vectors[np.sort(rows)]
+    index.train(vectors)
+
+
+def tune_index(index, nprobe=NPROBE, ef_search=EF_SEARCH):
+    # Search-time recall/latency knobs; ignored by index types without them.
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def build_index(vectors, settings=None, train_sample=TRAIN_SAMPLE, nprobe=NPROBE, ef_search=EF_SEARCH):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or not len(vectors):
+        raise ValueError(f"Cannot build a vector index from an array of shape {vectors.shape}")
+    index = create_index(vectors.shape[1], len(vectors), settings or index_settings())
+    train_index(index, vectors, train_sample)
+    index.add(vectors)
+    return tune_index(index, nprobe, ef_search)
+
+
+def index_memory_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
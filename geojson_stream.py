@@ -0,0 +1,109 @@
+import json
+import time
+from itertools import islice
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _StreamReader:
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop everything already consumed so the buffer only ever holds the
+        # value currently being decoded plus one read-ahead chunk.
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found or 'EOF'}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buffer, self.pos)
+                # A value ending exactly at the buffer edge may be truncated
+                # (e.g. a number), so only accept it once more input is seen.
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow reads with the pending value so very large geometries are
+            # not re-decoded once per fixed-size chunk.
+            self.fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+
+def iter_features(geojson_file_path, chunk_size=1 << 16):
+    # Yields the members of a FeatureCollection's "features" array one at a
+    # time without loading the whole document.
+    with open(geojson_file_path, 'r') as file:
+        reader = _StreamReader(file, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == 'features':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    return
+                while True:
+                    yield reader.value()
+                    separator = reader.peek()
+                    if separator == ']':
+                        return
+                    reader.expect(',')
+            reader.value()
+            if reader.peek() == '}':
+                return
+            reader.expect(',')
+
+
+def batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def with_progress(features, label, interval=5.0):
+    start = last_report = time.perf_counter()
+    count = 0
+    for feature in features:
+        count += 1
+        yield feature
+        now = time.perf_counter()
+        if now - last_report >= interval:
+            print(f"Parsed {count} {label} ({count / (now - start):.0f} features/sec)")
+            last_report = now
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Parsed {count} {label} in {elapsed:.1f}s ({rate:.0f} features/sec)")
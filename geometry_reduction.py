@@ -0,0 +1,276 @@
+import os
+import struct
+
+import numpy as np
+
+from bulk_load import EWKB_SRID_FLAG, WKB_TYPES
+from geojson_stream import batched
+
+# Decimal places kept at ingest: 6 is about 0.1 m, 5 about 1 m. Empty
+# keeps full precision.
+COORDINATE_PRECISION = os.environ.get("INGEST_COORDINATE_PRECISION", "")
+# Douglas-Peucker tolerance in metres; 0 disables simplification.
+SIMPLIFY_TOLERANCE_M = float(os.environ.get("INGEST_SIMPLIFY_TOLERANCE_M", "0"))
+# Features reduced together; the NumPy work is per batch, not per feature.
+REDUCE_BATCH_SIZE = int(os.environ.get("INGEST_REDUCE_BATCH_SIZE", "2000"))
+
+REDUCIBLE_TYPES = ('LineString', 'Polygon', 'MultiPolygon')
+METRES_PER_DEGREE_LAT = 110574.0
+METRES_PER_DEGREE_LON = 111320.0
+
+
+def simplify(points, tolerance, starts, ends):
+    # Douglas-Peucker over many lines at once (line i is points[starts[i]
+    # ..ends[i]]). Each pass measures every interior vertex of every open
+    # interval against its chord and splits each interval at its farthest
+    # vertex when that is beyond the tolerance, so the number of passes is
+    # the deepest recursion in the batch. Distances are to the chord
+    # segment, which also handles closed rings whose chord is one point.
+    # -> boolean mask of the vertices to keep.
+    keep = np.zeros(len(points), dtype=bool)
+    keep[starts] = True
+    keep[ends] = True
+    tolerance_squared = tolerance * tolerance
+    while len(starts):
+        interior = ends - starts - 1
+        open_intervals = interior > 0
+        starts, ends, interior = starts[open_intervals], ends[open_intervals], interior[open_intervals]
+        if not len(starts):
+            break
+        offsets = np.cumsum(interior) - interior
+        owner = np.repeat(np.arange(len(starts)), interior)
+        index = starts[owner] + 1 + np.arange(interior.sum()) - offsets[owner]
+        a = points[starts[owner]]
+        ab = points[ends[owner]] - a
+        ap = points[index] - a
+        length_squared = np.einsum('ij,ij->i', ab, ab)
+        t = np.clip(np.einsum('ij,ij->i', ap, ab) / np.where(length_squared > 0, length_squared, 1.0), 0.0, 1.0)
+        offset = ap - t[:, None] * ab
+        distance_squared = np.einsum('ij,ij->i', offset, offset)
+
+        maxima = np.maximum.reduceat(distance_squared, offsets)
+        # First vertex reaching its interval's maximum; owner is sorted, so
+        # that is where the owner changes among the vertices at a maximum.
+        at_max = np.flatnonzero(distance_squared == maxima[owner])
+        first = np.ones(len(at_max), dtype=bool)
+        first[1:] = owner[at_max[1:]] != owner[at_max[:-1]]
+        farthest = index[at_max[first]]
+        split = maxima > tolerance_squared
+        farthest = farthest[split]
+        keep[farthest] = True
+        starts, ends = np.concatenate((starts[split], farthest)), np.concatenate((farthest, ends[split]))
+    return keep
+
+
+def drop_repeats(points, keep, line_ids, is_first, is_last):
+    # Of each run of identical kept vertices within a line, keeps the first
+    # one, or the line's own end vertex when the run reaches it, so lines
+    # never lose their endpoints.
+    index = np.flatnonzero(keep)
+    kept = points[index]
+    run_start = np.ones(len(index), dtype=bool)
+    run_start[1:] = np.any(kept[1:] != kept[:-1], axis=1) | (line_ids[index[1:]] != line_ids[index[:-1]])
+    selected = run_start.copy()
+    last = np.flatnonzero(is_last[index])
+    run_first = np.flatnonzero(run_start)[np.cumsum(run_start)[last] - 1]
+    selected[run_first[~is_first[index[run_first]]]] = False
+    selected[last] = True
+    result = np.zeros_like(keep)
+    result[index[selected]] = True
+    return result
+
+
+def _wkb_points(points):
+    return struct.pack('<I', len(points)) + np.ascontiguousarray(points, dtype='<f8').tobytes()
+
+
+def _wkb_rings(rings):
+    return struct.pack('<I', len(rings)) + b''.join(_wkb_points(ring) for ring in rings)
+
+
+def _geometry_parts(geometry):
+    # (coordinates, is_ring) of each line or ring, in order.
+    geometry_type = geometry['type']
+    if geometry_type == 'LineString':
+        yield geometry['coordinates'], False
+    elif geometry_type == 'Polygon':
+        for ring in geometry['coordinates']:
+            yield ring, True
+    elif geometry_type == 'MultiPolygon':
+        for polygon in geometry['coordinates']:
+            for ring in polygon:
+                yield ring, True
+
+
+def _wkb_overhead(geometry, part_count):
+    # WKB bytes besides the vertices: headers and counts, which reduction
+    # leaves as they are.
+    geometry_type = geometry['type']
+    if geometry_type == 'LineString':
+        return 5 + 4 * part_count
+    if geometry_type == 'Polygon':
+        return 9 + 4 * part_count
+    return 9 + 9 * len(geometry['coordinates']) + 4 * part_count
+
+
+def _rebuild(geometry, parts):
+    geometry_type = geometry['type']
+    if geometry_type == 'LineString':
+        coordinates = next(parts)
+    elif geometry_type == 'Polygon':
+        coordinates = [next(parts) for _ in geometry['coordinates']]
+    else:
+        coordinates = [[next(parts) for _ in polygon] for polygon in geometry['coordinates']]
+    return {'type': geometry_type, 'coordinates': coordinates}
+
+
+class GeometryReducer:
+    # Quantizes coordinates to `precision` decimal places and simplifies
+    # lines and rings with a Douglas-Peucker tolerance in metres, batches of
+    # features at a time as single NumPy arrays. Rings that would end up
+    # with fewer than four vertices keep their original ones. Reduced
+    # geometries hold an (n, 2) array per line or ring instead of nested
+    # lists, which to_wkt and to_hex_ewkb encode without a per-vertex Python
+    # loop. Counts the vertices and the WKB size of the geometries before and
+    # after reduction, and the bytes the encoders write.
+    def __init__(self, precision=None, tolerance_m=0.0, batch_size=REDUCE_BATCH_SIZE):
+        self.precision = precision
+        self.tolerance_m = tolerance_m
+        self.batch_size = batch_size
+        # %r is the shortest repr, as the plain encoders' f-strings write.
+        self.point_format = f"%.{precision}f %.{precision}f" if precision is not None else "%r %r"
+        self.stats = {'features': 0, 'vertices_in': 0, 'vertices_out': 0, 'bytes_in': 0, 'bytes_out': 0,
+                      'encoded_bytes': 0}
+
+    def _reduce_batch(self, features):
+        # Geometries this cannot handle are left for the row converters to
+        # reject.
+        reducible = []
+        parts = []
+        overhead = 0
+        for feature in features:
+            geometry = feature.get('geometry')
+            if not isinstance(geometry, dict) or geometry.get('type') not in REDUCIBLE_TYPES:
+                continue
+            feature_parts = list(_geometry_parts(geometry))
+            if all(coordinates for coordinates, _ in feature_parts):
+                reducible.append(feature)
+                parts.extend(feature_parts)
+                overhead += _wkb_overhead(geometry, len(feature_parts))
+        if not parts:
+            return
+        lengths = np.array([len(coordinates) for coordinates, _ in parts])
+        points = np.array([(point[0], point[1]) for coordinates, _ in parts for point in coordinates],
+                          dtype=np.float64)
+        rings = np.array([ring for _, ring in parts])
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        ends -= 1
+        keep = np.ones(len(points), dtype=bool)
+
+        if self.tolerance_m > 0:
+            # Local equirectangular metres per line, plenty for a tolerance.
+            scale = np.repeat(METRES_PER_DEGREE_LON * np.cos(np.radians(points[starts, 1])), lengths)
+            metric = np.column_stack((points[:, 0] * scale, points[:, 1] * METRES_PER_DEGREE_LAT))
+            keep = simplify(metric, self.tolerance_m, starts, ends)
+            collapsed = rings & (np.add.reduceat(keep, starts) < 4)
+            keep |= np.repeat(collapsed, lengths)
+
+        if self.precision is not None:
+            points = np.round(points, self.precision)
+            line_ids = np.repeat(np.arange(len(parts)), lengths)
+            is_first = np.zeros(len(points), dtype=bool)
+            is_first[starts] = True
+            is_last = np.zeros(len(points), dtype=bool)
+            is_last[ends] = True
+            deduplicated = drop_repeats(points, keep, line_ids, is_first, is_last)
+            collapsed = rings & (np.add.reduceat(deduplicated, starts) < 4)
+            keep = np.where(np.repeat(collapsed, lengths), keep, deduplicated)
+
+        kept = points[keep]
+        reduced = iter(np.split(kept, np.cumsum(np.add.reduceat(keep, starts))[:-1]))
+        for feature in reducible:
+            feature['geometry'] = _rebuild(feature['geometry'], reduced)
+        self.stats['features'] += len(reducible)
+        self.stats['vertices_in'] += len(points)
+        self.stats['vertices_out'] += len(kept)
+        self.stats['bytes_in'] += overhead + 16 * len(points)
+        self.stats['bytes_out'] += overhead + 16 * len(kept)
+
+    def reduce_features(self, features):
+        # Features pass through in order with their geometries replaced.
+        for batch in batched(features, self.batch_size):
+            try:
+                self._reduce_batch(batch)
+            except (TypeError, ValueError, IndexError):
+                # A malformed feature spoils the batch's arrays; retried one
+                # by one, the bad ones are left as they are for the row
+                # converters to reject.
+                for feature in batch:
+                    try:
+                        self._reduce_batch([feature])
+                    except (TypeError, ValueError, IndexError):
+                        pass
+            yield from batch
+
+    def _points_wkt(self, points):
+        # One %-format over all of a line's ordinates; fixed precision is
+        # also about three times faster to format than the shortest repr.
+        return ','.join([self.point_format] * len(points)) % tuple(points.ravel().tolist())
+
+    def _polygon_wkt(self, rings):
+        return f"({','.join(f'({self._points_wkt(ring)})' for ring in rings)})"
+
+    def to_wkt(self, geometry):
+        # WKT encoder for reduced geometries. Unlike geometry_to_wkt every
+        # polygon ring is written, holes included.
+        geometry_type = geometry['type']
+        if geometry_type == 'LineString':
+            wkt = f"LINESTRING({self._points_wkt(geometry['coordinates'])})"
+        elif geometry_type == 'Polygon':
+            wkt = f"POLYGON{self._polygon_wkt(geometry['coordinates'])}"
+        elif geometry_type == 'MultiPolygon':
+            wkt = f"MULTIPOLYGON({','.join(self._polygon_wkt(polygon) for polygon in geometry['coordinates'])})"
+        else:
+            raise ValueError(f"Unsupported geometry type: {geometry_type}")
+        self.stats['encoded_bytes'] += len(wkt)
+        return wkt
+
+    def to_hex_ewkb(self, geometry, srid=4326):
+        # Same output as bulk_load.geometry_to_hex_ewkb, with each line or
+        # ring packed straight from its array.
+        geometry_type = geometry['type']
+        if geometry_type not in REDUCIBLE_TYPES:
+            raise ValueError(f"Unsupported geometry type: {geometry_type}")
+        header = struct.pack('<BII', 1, WKB_TYPES[geometry_type] | EWKB_SRID_FLAG, srid)
+        coordinates = geometry['coordinates']
+        if geometry_type == 'LineString':
+            ewkb = header + _wkb_points(coordinates)
+        elif geometry_type == 'Polygon':
+            ewkb = header + _wkb_rings(coordinates)
+        else:
+            polygon_header = struct.pack('<BI', 1, WKB_TYPES['Polygon'])
+            members = b''.join(polygon_header + _wkb_rings(polygon) for polygon in coordinates)
+            ewkb = header + struct.pack('<I', len(coordinates)) + members
+        self.stats['encoded_bytes'] += len(ewkb)
+        return ewkb.hex()
+
+    def describe(self):
+        vertices_in = self.stats['vertices_in']
+        vertices_out = self.stats['vertices_out']
+        bytes_in = self.stats['bytes_in']
+        bytes_out = self.stats['bytes_out']
+        saved = 1 - vertices_out / vertices_in if vertices_in else 0.0
+        smaller = 1 - bytes_out / bytes_in if bytes_in else 0.0
+        return (f"{self.stats['features']} geometries, {vertices_in} -> {vertices_out} vertices "
+                f"({saved:.1%} fewer), {bytes_in} -> {bytes_out} WKB bytes ({smaller:.1%} smaller), "
+                f"{self.stats['encoded_bytes']} bytes encoded at precision {self.precision}, "
+                f"tolerance {self.tolerance_m} m")
+
+
+def default_reducer():
+    # GeometryReducer from the INGEST_* settings, or None when both are off.
+    precision = int(COORDINATE_PRECISION) if COORDINATE_PRECISION else None
+    if precision is None and SIMPLIFY_TOLERANCE_M <= 0:
+        return None
+    return GeometryReducer(precision, SIMPLIFY_TOLERANCE_M)
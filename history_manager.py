@@ -0,0 +1,123 @@
+import hashlib
+import os
+
+import tiktoken
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "1000"))
+SUMMARY_MAX_TOKENS = int(os.environ.get("HISTORY_SUMMARY_MAX_TOKENS", "250"))
+# Once over budget, evict down to this fraction of it so the summary is
+# extended every few turns rather than on every turn.
+LOW_WATER_MARK = float(os.environ.get("HISTORY_LOW_WATER_MARK", "0.6"))
+# Role and separator tokens the chat format adds around every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_template("""Progressively summarize the conversation below, adding to the previous summary and returning a new summary. Keep names, facts and open questions; drop pleasantries. Use at most {max_words} words.
+
+Previous summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:""")
+
+
+def get_encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class ChatHistoryManager:
+    # Keeps the most recent turns verbatim within a token budget and folds
+    # older turns into a rolling summary. Each message is summarized once:
+    # the summary is only extended with newly evicted turns, and summaries
+    # are memoized by (previous summary, evicted turns).
+    def __init__(self, llm, token_budget=TOKEN_BUDGET, summary_max_tokens=SUMMARY_MAX_TOKENS,
+                 low_water_mark=LOW_WATER_MARK, model="gpt-3.5-turbo"):
+        self.summarizer = SUMMARY_PROMPT | llm | StrOutputParser()
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.low_water_mark = low_water_mark
+        self.encoding = get_encoding(model)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.recent = []  # (message, token count)
+        self.summaries = {}
+        self.summary_calls = 0
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text))
+
+    def _message_tokens(self, message):
+        return self.count_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS
+
+    @property
+    def recent_tokens(self):
+        return sum(tokens for _, tokens in self.recent)
+
+    @property
+    def total_tokens(self):
+        return self.summary_tokens + self.recent_tokens
+
+    def add(self, message):
+        self.recent.append((message, self._message_tokens(message)))
+        self.compact()
+
+    def add_turn(self, question, answer):
+        self.extend([HumanMessage(content=question), AIMessage(content=answer)])
+
+    def extend(self, messages):
+        for message in messages:
+            self.recent.append((message, self._message_tokens(message)))
+        self.compact()
+
+    def compact(self):
+        if self.total_tokens <= self.token_budget:
+            return
+        target = self.token_budget * self.low_water_mark - self.summary_max_tokens
+        evicted = []
+        recent_tokens = self.recent_tokens
+        # Evict whole turns: keep going until the kept history starts with a
+        # human message, but always keep the latest message.
+        while len(self.recent) > 1 and (recent_tokens > target or not isinstance(self.recent[0][0], HumanMessage)):
+            message, tokens = self.recent.pop(0)
+            evicted.append(message)
+            recent_tokens -= tokens
+        if evicted:
+            self._fold(evicted)
+
+    def _fold(self, messages):
+        new_lines = get_buffer_string(messages)
+        key = hashlib.sha256(f"{self.summary}\0{new_lines}".encode("utf-8")).hexdigest()
+        summary = self.summaries.get(key)
+        if summary is None:
+            self.summary_calls += 1
+            summary = self.summarizer.invoke({
+                "summary": self.summary or "(none)",
+                "new_lines": new_lines,
+                "max_words": int(self.summary_max_tokens * 0.75),
+            }).strip()
+            # Hold the summary to its budget even if the model overshoots.
+            tokens = self.encoding.encode(summary)
+            if len(tokens) > self.summary_max_tokens:
+                summary = self.encoding.decode(tokens[:self.summary_max_tokens])
+            self.summaries[key] = summary
+        self.summary = summary
+        self.summary_tokens = self._message_tokens(SystemMessage(content=self._summary_text()))
+
+    def _summary_text(self):
+        return f"Summary of the earlier conversation: {self.summary}"
+
+    @property
+    def messages(self):
+        # Messages to pass as chat_history: the summary (if any) followed by
+        # the verbatim recent turns.
+        messages = [message for message, _ in self.recent]
+        if self.summary:
+            messages.insert(0, SystemMessage(content=self._summary_text()))
+        return messages
@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+
+from db import pooled_connection
+
+# Seconds between IngestWatcher checks of ingest_log for ingests run by other
+# processes (the CLI loaders).
+INGEST_POLL_INTERVAL = float(os.environ.get("INGEST_POLL_INTERVAL", "5"))
+
+_listeners = []
+# ingest_log ids written by this process, whose listeners already ran.
+_recorded = set()
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def on_ingest(callback):
+    # callback(table, bbox) runs after an ingest into `table` finishes in this
+    # process, or in another one once an IngestWatcher picks it up. bbox is
+    # (min_lon, min_lat, max_lon, max_lat) of the changed features when the
+    # loader knows it, otherwise None (treat as "anything").
+    _listeners.append(callback)
+    return callback
+
+
+def remove_ingest_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def _run_listeners(table, bbox):
+    for callback in list(_listeners):
+        try:
+            callback(table, bbox)
+        except Exception as e:
+            logging.exception(f"Ingest listener {callback!r} failed: {e}")
+
+
+def create_ingest_log_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_log (
+            id BIGSERIAL PRIMARY KEY,
+            table_name VARCHAR(100) NOT NULL,
+            min_lon FLOAT8,
+            min_lat FLOAT8,
+            max_lon FLOAT8,
+            max_lat FLOAT8,
+            ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def notify_ingest(table, bbox=None, connection_string=None):
+    # Runs this process's listeners. With a connection string the ingest is
+    # also recorded in ingest_log, where IngestWatchers in other processes
+    # (the API server's caches) pick it up.
+    if connection_string:
+        try:
+            with pooled_connection(connection_string) as conn:
+                with conn.cursor() as cur:
+                    create_ingest_log_table(cur)
+                    cur.execute("""
+                        INSERT INTO ingest_log (table_name, min_lon, min_lat, max_lon, max_lat)
+                        VALUES (%s, %s, %s, %s, %s) RETURNING id
+                    """, (table, *(bbox or (None,) * 4)))
+                    _recorded.add(cur.fetchone()[0])
+        except Exception as e:
+            logging.exception(f"Could not record {table} ingest in ingest_log: {e}")
+    _run_listeners(table, bbox)
+
+
+def last_row_id(connection_string, table):
+    # Highest id in table, taken before a load that only appends rows.
+    with pooled_connection(connection_string) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COALESCE(max(id), 0) FROM {table}")
+            return cur.fetchone()[0]
+
+
+def notify_rows_added(connection_string, table, after_id):
+    # notify_ingest with the extent of the rows appended after after_id (see
+    # last_row_id); nothing to report when none were.
+    with pooled_connection(connection_string) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+                FROM (SELECT ST_Extent(geom) AS e FROM {table} WHERE id > %s) s
+            """, (after_id,))
+            bbox = cur.fetchone()
+    if bbox[0] is not None:
+        notify_ingest(table, tuple(bbox), connection_string)
+
+
+class IngestWatcher:
+    # Polls ingest_log every interval seconds and runs this process's
+    # listeners for each ingest recorded since it started, so caches in a
+    # long-running server follow loads made by separate processes.
+    def __init__(self, connection_string, interval=INGEST_POLL_INTERVAL):
+        self.connection_string = connection_string
+        self.interval = interval
+        self.last_id = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="ingest-watcher", daemon=True)
+            self.thread.start()
+        return self
+
+    def poll(self):
+        with pooled_connection(self.connection_string) as conn:
+            with conn.cursor() as cur:
+                if self.last_id is None:
+                    create_ingest_log_table(cur)
+                    cur.execute("SELECT COALESCE(max(id), 0) FROM ingest_log")
+                    self.last_id = cur.fetchone()[0]
+                    return 0
+                cur.execute("""
+                    SELECT id, table_name, min_lon, min_lat, max_lon, max_lat
+                    FROM ingest_log WHERE id > %s ORDER BY id
+                """, (self.last_id,))
+                rows = cur.fetchall()
+        for entry_id, table, *bbox in rows:
+            self.last_id = entry_id
+            if entry_id in _recorded:
+                _recorded.discard(entry_id)
+                continue
+            _run_listeners(table, None if bbox[0] is None else tuple(bbox))
+        return len(rows)
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logging.exception(f"Polling ingest_log failed: {e}")
+            if self.stopped.wait(self.interval):
+                return
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def watch_ingests(connection_string):
+    # The process-wide IngestWatcher for a database, started on first use.
+    with _watchers_lock:
+        watcher = _watchers.get(connection_string)
+        if watcher is None:
+            watcher = _watchers[connection_string] = IngestWatcher(connection_string).start()
+        return watcher
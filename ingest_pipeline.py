@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import aiohttp
+import numpy as np
+from bs4 import BeautifulSoup
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from faiss_index import TRAIN_SAMPLE, create_index, index_settings, train_index, tune_index
+
+MAX_CONNECTIONS = int(os.environ.get("INGEST_MAX_CONNECTIONS", "16"))
+MAX_CONNECTIONS_PER_HOST = int(os.environ.get("INGEST_MAX_CONNECTIONS_PER_HOST", "8"))
+FETCH_TIMEOUT = float(os.environ.get("INGEST_FETCH_TIMEOUT", "30"))
+EMBED_BATCH_SIZE = int(os.environ.get("INGEST_EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.environ.get("INGEST_EMBED_CONCURRENCY", "4"))
+
+
+def html_to_document(html, source):
+    # Same text and metadata as WebBaseLoader produces for a page.
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": source}
+    if soup.find("title"):
+        metadata["title"] = soup.find("title").get_text()
+    description = soup.find("meta", attrs={"name": "description"})
+    if description:
+        metadata["description"] = description.get("content", "No description found.")
+    html_tag = soup.find("html")
+    if html_tag:
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+def read_file(path):
+    with open(path, encoding="utf-8", errors="replace") as file:
+        text = file.read()
+    if path.endswith((".html", ".htm")):
+        return html_to_document(text, path)
+    return Document(page_content=text, metadata={"source": path})
+
+
+async def fetch_url(session, url):
+    async with session.get(url) as response:
+        response.raise_for_status()
+        html = await response.text()
+    # Parsing is CPU-bound; keep it off the event loop so fetches overlap.
+    return await asyncio.to_thread(html_to_document, html, url)
+
+
+async def load_source(session, source):
+    try:
+        if source.startswith(("http://", "https://")):
+            return await fetch_url(session, source)
+        return await asyncio.to_thread(read_file, source)
+    except Exception as e:
+        raise RuntimeError(f"{source}: {e}") from e
+
+
+async def iter_documents(sources, max_connections=MAX_CONNECTIONS, per_host=MAX_CONNECTIONS_PER_HOST,
+                         timeout=FETCH_TIMEOUT, failures=None):
+    # Yields documents in completion order. At most max_connections sources
+    # load at once and the connector also caps connections per host; failed
+    # sources are logged, collected in `failures` and skipped. The timeouts
+    # apply to connecting and to each read, not to time spent queued for a
+    # connection, so a long source list does not time out unsent requests.
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=per_host)
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    slots = asyncio.Semaphore(max_connections)
+
+    async def load(source):
+        async with slots:
+            return await load_source(session, source)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        tasks = {asyncio.ensure_future(load(source)): source for source in sources}
+        try:
+            for future in asyncio.as_completed(tasks):
+                try:
+                    yield await future
+                except Exception as e:
+                    logging.warning(f"Failed to load document: {e}")
+                    if failures is not None:
+                        failures.append(str(e))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class IncrementalVectorStore:
+    # Adds embedded chunks to a FAISS store as they arrive. Flat and HNSW
+    # indexes take vectors immediately; IVF indexes buffer until
+    # `train_size` vectors (or the end of the input) are available, then
+    # are created, trained and given everything buffered. Without
+    # expected_chunks, an IVF index is sized from the chunks buffered by
+    # then: all of them for inputs under TRAIN_SAMPLE chunks.
+    def __init__(self, embeddings, index=None, expected_chunks=0, vectorstore=None):
+        self.embeddings = embeddings
+        self.settings = index or index_settings()
+        self.expected_chunks = expected_chunks
+        self.train_size = min(expected_chunks or TRAIN_SAMPLE, TRAIN_SAMPLE)
+        self.vectorstore = vectorstore
+        self.pending = []  # (text, vector, metadata)
+        self.added = 0
+
+    def _create(self, dim, count):
+        faiss_index = create_index(dim, count, self.settings)
+        self.vectorstore = FAISS(self.embeddings, faiss_index, InMemoryDocstore(), {})
+
+    def add(self, chunks, vectors):
+        self.pending.extend((chunk.page_content, vector, chunk.metadata) for chunk, vector in zip(chunks, vectors))
+        self._flush()
+
+    def _flush(self, final=False):
+        if not self.pending:
+            return
+        trained_mode = self.settings['mode'] in ('ivf_flat', 'ivf_pq')
+        if self.vectorstore is None:
+            if trained_mode and not final and len(self.pending) < self.train_size:
+                return
+            self._create(len(self.pending[0][1]), max(self.expected_chunks, len(self.pending)))
+        index = self.vectorstore.index
+        if not index.is_trained:
+            if not final and len(self.pending) < self.train_size:
+                return
+            train_index(index, np.asarray([vector for _, vector, _ in self.pending], dtype=np.float32))
+            tune_index(index)
+        self.vectorstore.add_embeddings([(text, vector) for text, vector, _ in self.pending],
+                                        [metadata for _, _, metadata in self.pending])
+        self.added += len(self.pending)
+        self.pending = []
+
+    def finish(self):
+        self._flush(final=True)
+        return self.vectorstore
+
+
+async def ingest_sources(sources, embeddings, text_splitter=None, vectorstore=None, index=None,
+                         expected_chunks=0, batch_size=EMBED_BATCH_SIZE, embed_concurrency=EMBED_CONCURRENCY,
+                         max_connections=MAX_CONNECTIONS, per_host=MAX_CONNECTIONS_PER_HOST):
+    # Fetches every source concurrently and splits each document as soon as
+    # it arrives; chunks are embedded in batches of `batch_size` with at most
+    # `embed_concurrency` embedding calls in flight, and each embedded batch
+    # is added to the FAISS store straight away.
+    text_splitter = text_splitter or RecursiveCharacterTextSplitter()
+    store = IncrementalVectorStore(embeddings, index, expected_chunks, vectorstore)
+    slots = asyncio.Semaphore(embed_concurrency)
+    embedding_tasks = set()
+    failures = []
+    stats = {'documents': 0, 'chunks': 0}
+    start = time.perf_counter()
+
+    async def embed_batch(batch):
+        try:
+            vectors = await embeddings.aembed_documents([chunk.page_content for chunk in batch])
+            store.add(batch, vectors)
+            if 'first_chunk_seconds' not in stats:
+                stats['first_chunk_seconds'] = time.perf_counter() - start
+        finally:
+            slots.release()
+
+    async def submit(batch):
+        await slots.acquire()
+        task = asyncio.create_task(embed_batch(batch))
+        embedding_tasks.add(task)
+        task.add_done_callback(embedding_tasks.discard)
+
+    batch = []
+    async for document in iter_documents(sources, max_connections, per_host, failures=failures):
+        stats['documents'] += 1
+        for chunk in text_splitter.split_documents([document]):
+            batch.append(chunk)
+            stats['chunks'] += 1
+            if len(batch) >= batch_size:
+                await submit(batch)
+                batch = []
+    if batch:
+        await submit(batch)
+    await asyncio.gather(*embedding_tasks)
+
+    stats['failed'] = len(failures)
+    stats['seconds'] = time.perf_counter() - start
+    return store.finish(), stats
+
+
+if __name__ == "__main__":
+    from embedding_cache import CachedEmbeddings
+    from embedding_engine import BatchedEmbeddings, token_text_splitter
+    from vector_cache import save_vectorstore
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Fetch, split and embed many URLs or files into a FAISS index.")
+    parser.add_argument("sources", nargs="+", help="URLs or local file paths")
+    parser.add_argument("--output", required=True, help="Directory to save the FAISS index to")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    args = parser.parse_args()
+
+    embeddings = CachedEmbeddings(BatchedEmbeddings())
+    vectorstore, stats = asyncio.run(ingest_sources(
+        args.sources, embeddings, token_text_splitter(), batch_size=args.batch_size,
+        max_connections=args.max_connections))
+    embeddings.close()
+    logging.info(f"Ingested {stats['documents']} documents ({stats['chunks']} chunks, {stats['failed']} failed) "
+                 f"in {stats['seconds']:.1f}s")
+    if vectorstore is not None:
+        save_vectorstore(vectorstore, args.output)
@@ -1,46 +1,88 @@
-import psycopg2
 import json
+import time
+import numpy as np
 from psycopg2.extras import execute_values
+from geojson_stream import iter_features, batched, with_progress
+from bulk_load import ROAD_SEGMENT_COLUMNS, copy_rows, geometry_to_hex_ewkb
+from db import pooled_connection, execute_prepared
+from geometry_reduction import default_reducer
+from ingest_hooks import last_row_id, notify_rows_added
+from speed_grid import build_speed_grid
+
+def linestring_to_wkt(geometry):
+    return f"LINESTRING({','.join([f'{lon} {lat}' for lon, lat in geometry['coordinates']])})"
+
+def road_feature_to_row(feature, encode_geometry=linestring_to_wkt):
+    properties = feature['properties']
+    geometry = feature['geometry']
+    
+    if geometry['type'] != 'LineString':
+        raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+    
+    speed_limit = properties.get('ns_speed_limit', '0')
+    speed_limit = int(speed_limit) if isinstance(speed_limit, str) and speed_limit.isdigit() else 0
+    
+    return (
+        properties.get('road_id', 0),
+        properties.get('road_name', ''),
+        properties.get('Shape__Length', 0.0),
+        speed_limit,
+        encode_geometry(geometry)
+    )
+
+def iter_road_rows(features, encode_geometry=linestring_to_wkt):
+    for index, feature in enumerate(features):
+        try:
+            yield road_feature_to_row(feature, encode_geometry)
+        except KeyError as e:
+            print(f"Warning: Skipping record {index} due to missing key: {e}")
+        except ValueError as e:
+            print(f"Warning: Skipping record {index} due to value error: {e}")
+        except Exception as e:
+            print(f"Warning: Skipping record {index} due to unexpected error: {e}")
 
 def create_table_if_not_exists(connection_string):
-    conn = psycopg2.connect(connection_string)
-    cur = conn.cursor()
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
     
-    # Enable PostGIS extension if not already enabled
-    cur.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
+        # Enable PostGIS extension if not already enabled
+        cur.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
 
-    # Check if table exists
-    cur.execute("""
-    SELECT EXISTS (
-        SELECT FROM information_schema.tables 
-        WHERE table_name = 'road_segments'
-    );
-    """)
-    table_exists = cur.fetchone()[0]
-    
-    if not table_exists:
-        # Create table with PostGIS geometry
+        # Check if table exists
         cur.execute("""
-        CREATE TABLE road_segments (
-            id SERIAL PRIMARY KEY,
-            ramm_road_id INTEGER,
-            road_name VARCHAR(255),
-            shape_length FLOAT,
-            speed_limit INTEGER,
-            geom GEOMETRY(LINESTRING, 4326)
+        SELECT EXISTS (
+            SELECT FROM information_schema.tables 
+            WHERE table_name = 'road_segments'
         );
-        
-        CREATE INDEX idx_road_segments_geom ON road_segments USING GIST (geom);
         """)
-        conn.commit()
-        print("Table 'road_segments' created successfully.")
-    else:
-        print("Table 'road_segments' already exists.")
+        table_exists = cur.fetchone()[0]
     
-    cur.close()
-    conn.close()
+        if not table_exists:
+            # Create table with PostGIS geometry
+            cur.execute("""
+            CREATE TABLE road_segments (
+                id SERIAL PRIMARY KEY,
+                ramm_road_id INTEGER,
+                road_name VARCHAR(255),
+                shape_length FLOAT,
+                speed_limit INTEGER,
+                geom GEOMETRY(LINESTRING, 4326)
+            );
+        
+            CREATE INDEX idx_road_segments_geom ON road_segments USING GIST (geom);
+            """)
+            conn.commit()
+            print("Table 'road_segments' created successfully.")
+        else:
+            print("Table 'road_segments' already exists.")
+    
+        cur.close()
 
-def insert_road_data(connection_string, geojson_file_path):
+def insert_road_data(connection_string, geojson_file_path, speed_grid_path=None, reducer=None):
+    # reducer: a geometry_reduction.GeometryReducer to quantize and simplify
+    # coordinates before they are written (default from the INGEST_* settings).
+    reducer = reducer or default_reducer()
+    first_id = last_row_id(connection_string, 'road_segments')
     # Read GeoJSON file
     with open(geojson_file_path, 'r') as file:
         data = json.load(file)
@@ -48,92 +90,173 @@ def insert_road_data(connection_string, geojson_file_path):
     # Extract features
     features = data['features']
     
-    conn = psycopg2.connect(connection_string)
-    cur = conn.cursor()
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        
+        # Prepare the data for batch insert
+        if reducer:
+            values = list(iter_road_rows(reducer.reduce_features(features), reducer.to_wkt))
+        else:
+            values = list(iter_road_rows(features))
     
-    # Prepare the data for batch insert
-    values = []
-    for index, feature in enumerate(features):
+        # Perform batch insert
         try:
-            properties = feature['properties']
-            geometry = feature['geometry']
-            
-            if geometry['type'] != 'LineString':
-                raise ValueError(f"Unsupported geometry type: {geometry['type']}")
-            
-            speed_limit = properties.get('ns_speed_limit', '0')
-            speed_limit = int(speed_limit) if isinstance(speed_limit, str) and speed_limit.isdigit() else 0
-            
-            coordinates = geometry['coordinates']
-            linestring = f"LINESTRING({','.join([f'{lon} {lat}' for lon, lat in coordinates])})"
-            
-            values.append((
-                properties.get('road_id', 0),
-                properties.get('road_name', ''),
-                properties.get('Shape__Length', 0.0),
-                speed_limit,
-                linestring
-            ))
-        except KeyError as e:
-            print(f"Warning: Skipping record {index} due to missing key: {e}")
-        except ValueError as e:
-            print(f"Warning: Skipping record {index} due to value error: {e}")
+            execute_values(cur, """
+                INSERT INTO road_segments 
+                (ramm_road_id, road_name, shape_length, speed_limit, geom) 
+                VALUES %s
+            """, values, template="(%s, %s, %s, %s, ST_GeomFromText(%s, 4326))")
+        
+            conn.commit()
+            print(f"Successfully inserted {len(values)} road segments.")
         except Exception as e:
-            print(f"Warning: Skipping record {index} due to unexpected error: {e}")
+            conn.rollback()
+            print(f"Error during batch insert: {e}")
+            # If batch insert fails, try inserting records one by one
+            print("Attempting to insert records individually...")
+            for v in values:
+                try:
+                    cur.execute("""
+                        INSERT INTO road_segments 
+                        (ramm_road_id, road_name, shape_length, speed_limit, geom) 
+                        VALUES (%s, %s, %s, %s, ST_GeomFromText(%s, 4326))
+                    """, (v[0], v[1], v[2], v[3], v[4]))
+                    conn.commit()
+                    print(f"Successfully inserted road segment: {v[1]}")
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Error inserting road segment {v[1]}: {e}")
     
-    # Perform batch insert
-    try:
-        execute_values(cur, """
-            INSERT INTO road_segments 
-            (ramm_road_id, road_name, shape_length, speed_limit, geom) 
-            VALUES %s
-        """, [(v[0], v[1], v[2], v[3], f"ST_GeomFromText('{v[4]}', 4326)") for v in values])
-        
-        conn.commit()
-        print(f"Successfully inserted {len(values)} road segments.")
-    except Exception as e:
-        conn.rollback()
-        print(f"Error during batch insert: {e}")
-        # If batch insert fails, try inserting records one by one
-        print("Attempting to insert records individually...")
-        for v in values:
-            try:
-                cur.execute("""
-                    INSERT INTO road_segments 
-                    (ramm_road_id, road_name, shape_length, speed_limit, geom) 
-                    VALUES (%s, %s, %s, %s, ST_GeomFromText(%s, 4326))
-                """, (v[0], v[1], v[2], v[3], v[4]))
-                conn.commit()
-                print(f"Successfully inserted road segment: {v[1]}")
-            except Exception as e:
-                conn.rollback()
-                print(f"Error inserting road segment {v[1]}: {e}")
-    
-    cur.close()
-    conn.close()
+        cur.close()
     
     print(f"Inserted {len(values)} road segments.")
+    if reducer:
+        print(f"Geometry reduction: {reducer.describe()}")
+    notify_rows_added(connection_string, 'road_segments', first_id)
+    rebuild_speed_grid(connection_string, speed_grid_path)
+
+def stream_road_data(connection_string, geojson_file_path, batch_size=5000, speed_grid_path=None, reducer=None):
+    # Parses features one at a time and writes bounded batches while the file
+    # is still being read, so memory use does not grow with the file size.
+    reducer = reducer or default_reducer()
+    first_id = last_row_id(connection_string, 'road_segments')
+    features = with_progress(iter_features(geojson_file_path), "road segments")
+    if reducer:
+        rows = iter_road_rows(reducer.reduce_features(features), reducer.to_wkt)
+    else:
+        rows = iter_road_rows(features)
+    total_inserted = 0
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        try:
+            for batch in batched(rows, batch_size):
+                try:
+                    execute_values(cur, """
+                        INSERT INTO road_segments 
+                        (ramm_road_id, road_name, shape_length, speed_limit, geom) 
+                        VALUES %s
+                    """, batch, template="(%s, %s, %s, %s, ST_GeomFromText(%s, 4326))", page_size=batch_size)
+                    conn.commit()
+                    total_inserted += len(batch)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Error inserting batch of {len(batch)} road segments: {e}")
+        except Exception as e:
+            print(f"Error reading road segments: {e}")
+        finally:
+            cur.close()
+    
+    print(f"Inserted {total_inserted} road segments.")
+    if reducer:
+        print(f"Geometry reduction: {reducer.describe()}")
+    notify_rows_added(connection_string, 'road_segments', first_id)
+    rebuild_speed_grid(connection_string, speed_grid_path)
+    return total_inserted
+
+def copy_road_data(connection_string, geojson_file_path, speed_grid_path=None, reducer=None):
+    # Bulk load through COPY: geometries are encoded client-side as hex EWKB
+    # and streamed straight from the parser into a staging table.
+    reducer = reducer or default_reducer()
+    first_id = last_row_id(connection_string, 'road_segments')
+    features = with_progress(iter_features(geojson_file_path), "road segments")
+    if reducer:
+        rows = iter_road_rows(reducer.reduce_features(features), encode_geometry=reducer.to_hex_ewkb)
+    else:
+        rows = iter_road_rows(features, encode_geometry=geometry_to_hex_ewkb)
+    with pooled_connection(connection_string) as conn:
+        inserted = copy_rows(conn, 'road_segments', ROAD_SEGMENT_COLUMNS, rows)
+    
+    print(f"Inserted {inserted} road segments.")
+    if reducer:
+        print(f"Geometry reduction: {reducer.describe()}")
+    notify_rows_added(connection_string, 'road_segments', first_id)
+    rebuild_speed_grid(connection_string, speed_grid_path)
+    return inserted
+
+def rebuild_speed_grid(connection_string, speed_grid_path):
+    # Road segments only change at ingest, so the precomputed speed grid is
+    # rebuilt here rather than checked for staleness at lookup time.
+    if not speed_grid_path:
+        return
+    start = time.perf_counter()
+    meta = build_speed_grid(connection_string, speed_grid_path)
+    if meta is not None:
+        print(f"Built speed grid at {speed_grid_path} in {time.perf_counter() - start:.1f}s "
+              f"({meta['covered_cells']} cells, {meta['candidates']} candidates).")
 
 def query_nearest_road(connection_string, lat, lon):
-    conn = psycopg2.connect(connection_string)
-    cur = conn.cursor()
-    
-    cur.execute("""
-    SELECT 
-        road_name, 
-        speed_limit, 
-        ST_Distance(geom, ST_SetSRID(ST_MakePoint(%s, %s), 4326)) AS distance
-    FROM road_segments
-    ORDER BY geom <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)
-    LIMIT 1;
-    """, (lon, lat, lon, lat))
-    
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        execute_prepared(cur, 'nearest_road', (lon, lat))
+        result = cur.fetchone()
+        cur.close()
     
     return result
 
+def query_roads_near_area(connection_string, lat, lon, half_width):
+    # (road_name, speed_limit, linestring WKB) of every road that can be the
+    # nearest one to a point within half_width degrees of (lat, lon).
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        execute_prepared(cur, 'roads_near_area', (lon, lat, half_width))
+        results = cur.fetchall()
+        cur.close()
+    
+    return results
+
+def query_nearest_roads(connection_string, lats, lons=None, chunk_size=10000):
+    # Snaps a whole trace in one round trip per chunk. Accepts separate lat/lon
+    # sequences or a single (N, 2) array of (lat, lon) rows, and returns
+    # columnar results aligned with the input order.
+    if lons is None:
+        points = np.asarray(lats, dtype=np.float64).reshape(-1, 2)
+        lats, lons = points[:, 0], points[:, 1]
+    lats = np.asarray(lats, dtype=np.float64).ravel()
+    lons = np.asarray(lons, dtype=np.float64).ravel()
+    if lats.shape != lons.shape:
+        raise ValueError(f"lats and lons differ in length: {lats.size} != {lons.size}")
+    
+    count = lats.size
+    road_names = [None] * count
+    speed_limits = np.full(count, -1, dtype=np.int32)
+    distances = np.full(count, np.nan, dtype=np.float64)
+    
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        for start in range(0, count, chunk_size):
+            end = min(start + chunk_size, count)
+            execute_prepared(cur, 'nearest_roads_batch', (lons[start:end].tolist(), lats[start:end].tolist()))
+            for ordinal, road_name, speed_limit, distance in cur.fetchall():
+                index = start + ordinal - 1
+                road_names[index] = road_name
+                if speed_limit is not None:
+                    speed_limits[index] = speed_limit
+                if distance is not None:
+                    distances[index] = distance
+        cur.close()
+    
+    return {'road_name': road_names, 'speed_limit': speed_limits, 'distance': distances}
+
 def test_insertion_and_query(connection_string, test_lat, test_lon):
     print("\nTesting data insertion and querying:")
     nearest_road = query_nearest_road(connection_string, test_lat, test_lon)
@@ -1,7 +1,42 @@
 import logging
-import psycopg2
 import json
 from psycopg2.extras import execute_values
+from geojson_stream import iter_features, batched, with_progress
+from bulk_load import ROAD_CONSTRUCTION_COLUMNS, copy_rows, geometry_to_hex_ewkb
+from db import pooled_connection, execute_prepared
+from geometry_reduction import default_reducer
+from ingest_hooks import last_row_id, notify_rows_added
+
+# Stored NZTM (EPSG:2193) copy of geom so metre-based proximity searches
+# can use a GIST index instead of casting every row to geography.
+NZTM_COLUMN_SQL = """
+ALTER TABLE road_construction
+    ADD COLUMN IF NOT EXISTS geom_nztm GEOMETRY(GEOMETRY, 2193)
+    GENERATED ALWAYS AS (ST_Transform(geom, 2193)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_road_construction_geom_nztm ON road_construction USING GIST (geom_nztm);
+"""
+# Databases whose road_construction is known to have geom_nztm.
+_nztm_ready = set()
+
+def ensure_nztm_column(connection_string):
+    # Adds geom_nztm and its index to a road_construction table created before
+    # they existed. Checked once per process; the ALTER (which rewrites the
+    # table) only runs when something is missing.
+    if connection_string in _nztm_ready:
+        return
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name = 'road_construction' AND column_name = 'geom_nztm'),
+                   to_regclass('idx_road_construction_geom_nztm') IS NOT NULL
+        """)
+        if not all(cur.fetchone()):
+            logging.info("Adding geom_nztm to road_construction")
+            cur.execute(NZTM_COLUMN_SQL)
+        cur.close()
+    _nztm_ready.add(connection_string)
 
 def geometry_to_wkt(geometry):
     if geometry['type'] == 'Polygon':
@@ -15,51 +50,108 @@ def geometry_to_wkt(geometry):
     else:
         raise ValueError(f"Unsupported geometry type: {geometry['type']}")
 
-def insert_road_construction_data(connection_string, geojson_file_path):
+def construction_feature_to_row(feature, encode_geometry=geometry_to_wkt):
+    properties = feature['properties']
+    geometry = feature['geometry']
+    
+    if geometry['type'] not in ('Polygon', 'MultiPolygon'):
+        raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+    
+    return (
+        properties.get('WorksiteCode'),
+        properties.get('WorksiteName'),
+        properties.get('ProjectName'),
+        properties.get('Status'),
+        properties.get('WorksiteType'),
+        properties.get('Shape__Area'),
+        properties.get('Shape__Length'),
+        properties.get('PrincipalOrganisation'),
+        properties.get('ProjectStartDate'),
+        properties.get('ProjectEndDate'),
+        properties.get('WorkStartDate'),
+        properties.get('WorkCompletionDate'),
+        properties.get('WorkStatus'),
+        encode_geometry(geometry)
+    )
+
+def iter_construction_rows(features, offset=0, encode_geometry=geometry_to_wkt):
+    for index, feature in enumerate(features, start=offset):
+        try:
+            row = construction_feature_to_row(feature, encode_geometry)
+            logging.debug(f"Feature {index} geometry: {row[-1][:100]}...")  # Log first 100 characters of geometry
+            yield row
+        except Exception as e:
+            logging.error(f"Error processing feature {index}: {str(e)}")
+
+def insert_road_construction_data(connection_string, geojson_file_path, reducer=None):
+    # reducer: see insert_road.insert_road_data.
+    reducer = reducer or default_reducer()
     try:
+        first_id = last_row_id(connection_string, 'road_construction')
+        ensure_nztm_column(connection_string)
         with open(geojson_file_path, 'r') as file:
             data = json.load(file)
         
         features = data['features']
+        if reducer:
+            features = list(reducer.reduce_features(features))
+        encode_geometry = reducer.to_wkt if reducer else geometry_to_wkt
         
-        conn = psycopg2.connect(connection_string)
-        cur = conn.cursor()
-        
-        batch_size = 100  # Adjust this value based on your data size and system capabilities
-        total_inserted = 0
+        with pooled_connection(connection_string) as conn:
+            cur = conn.cursor()
+            
+            batch_size = 100  # Adjust this value based on your data size and system capabilities
+            total_inserted = 0
         
-        for i in range(0, len(features), batch_size):
-            batch = features[i:i+batch_size]
-            values = []
+            for i in range(0, len(features), batch_size):
+                batch = features[i:i+batch_size]
+                values = list(iter_construction_rows(batch, offset=i, encode_geometry=encode_geometry))
             
-            for index, feature in enumerate(batch):
-                try:
-                    properties = feature['properties']
-                    geometry = feature['geometry']
-                    
-                    wkt = geometry_to_wkt(geometry)
-                    logging.debug(f"Feature {i+index} WKT: {wkt[:100]}...")  # Log first 100 characters of WKT
+                if values:
+                    try:
+                        execute_values(cur, """
+                            INSERT INTO road_construction 
+                            (worksite_code, worksite_name, project_name, status, worksite_type, 
+                             shape_area, shape_length, principal_organisation, project_start_date, 
+                             project_end_date, work_start_date, work_completion_date, work_status, geom)
+                            VALUES %s
+                        """, values, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, ST_GeomFromText(%s, 4326))")
                     
-                    values.append((
-                        properties.get('WorksiteCode'),
-                        properties.get('WorksiteName'),
-                        properties.get('ProjectName'),
-                        properties.get('Status'),
-                        properties.get('WorksiteType'),
-                        properties.get('Shape__Area'),
-                        properties.get('Shape__Length'),
-                        properties.get('PrincipalOrganisation'),
-                        properties.get('ProjectStartDate'),
-                        properties.get('ProjectEndDate'),
-                        properties.get('WorkStartDate'),
-                        properties.get('WorkCompletionDate'),
-                        properties.get('WorkStatus'),
-                        wkt
-                    ))
-                except Exception as e:
-                    logging.error(f"Error processing feature {i+index}: {str(e)}")
+                        conn.commit()
+                        total_inserted += len(values)
+                        logging.info(f"Inserted batch of {len(values)} records. Total inserted: {total_inserted}")
+                    except Exception as e:
+                        conn.rollback()
+                        logging.error(f"Error inserting batch: {str(e)}")
+                        # Optionally, you could try to insert records one by one here
+                else:
+                    logging.warning(f"No valid records in batch {i//batch_size + 1}")
             
-            if values:
+            cur.close()
+        
+        print(f"Total inserted records: {total_inserted}")
+        if reducer:
+            print(f"Geometry reduction: {reducer.describe()}")
+        notify_rows_added(connection_string, 'road_construction', first_id)
+    except Exception as e:
+        logging.exception(f"An error occurred: {str(e)}")
+
+def stream_road_construction_data(connection_string, geojson_file_path, batch_size=1000, reducer=None):
+    # Streaming variant of insert_road_construction_data: features are parsed
+    # one at a time and each bounded batch is written as soon as it fills up.
+    reducer = reducer or default_reducer()
+    first_id = last_row_id(connection_string, 'road_construction')
+    ensure_nztm_column(connection_string)
+    features = with_progress(iter_features(geojson_file_path), "roadworks features")
+    if reducer:
+        rows = iter_construction_rows(reducer.reduce_features(features), encode_geometry=reducer.to_wkt)
+    else:
+        rows = iter_construction_rows(features)
+    total_inserted = 0
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        try:
+            for values in batched(rows, batch_size):
                 try:
                     execute_values(cur, """
                         INSERT INTO road_construction 
@@ -67,90 +159,133 @@ def insert_road_construction_data(connection_string, geojson_file_path):
                          shape_area, shape_length, principal_organisation, project_start_date, 
                          project_end_date, work_start_date, work_completion_date, work_status, geom)
                         VALUES %s
-                    """, values, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, ST_GeomFromText(%s, 4326))")
-                    
+                    """, values, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, ST_GeomFromText(%s, 4326))", page_size=batch_size)
+                
                     conn.commit()
                     total_inserted += len(values)
                     logging.info(f"Inserted batch of {len(values)} records. Total inserted: {total_inserted}")
                 except Exception as e:
                     conn.rollback()
                     logging.error(f"Error inserting batch: {str(e)}")
-                    # Optionally, you could try to insert records one by one here
-            else:
-                logging.warning(f"No valid records in batch {i//batch_size + 1}")
-        
-        print(f"Total inserted records: {total_inserted}")
-        
-        cur.close()
-        conn.close()
+        except Exception as e:
+            logging.exception(f"An error occurred: {str(e)}")
+        finally:
+            cur.close()
+    
+    print(f"Total inserted records: {total_inserted}")
+    if reducer:
+        print(f"Geometry reduction: {reducer.describe()}")
+    notify_rows_added(connection_string, 'road_construction', first_id)
+    return total_inserted
+
+def copy_road_construction_data(connection_string, geojson_file_path, reducer=None):
+    # COPY-based bulk load; unlike geometry_to_wkt the EWKB encoder keeps
+    # interior rings (holes) of each polygon.
+    reducer = reducer or default_reducer()
+    first_id = last_row_id(connection_string, 'road_construction')
+    ensure_nztm_column(connection_string)
+    features = with_progress(iter_features(geojson_file_path), "roadworks features")
+    if reducer:
+        rows = iter_construction_rows(reducer.reduce_features(features), encode_geometry=reducer.to_hex_ewkb)
+    else:
+        rows = iter_construction_rows(features, encode_geometry=geometry_to_hex_ewkb)
+    try:
+        with pooled_connection(connection_string) as conn:
+            inserted = copy_rows(conn, 'road_construction', ROAD_CONSTRUCTION_COLUMNS, rows)
     except Exception as e:
         logging.exception(f"An error occurred: {str(e)}")
+        inserted = 0
+    
+    print(f"Total inserted records: {inserted}")
+    if reducer:
+        print(f"Geometry reduction: {reducer.describe()}")
+    notify_rows_added(connection_string, 'road_construction', first_id)
+    return inserted
 
 # Don't forget to update the create_road_construction_table function to allow for MultiPolygon:
 def create_road_construction_table(connection_string):
-    conn = psycopg2.connect(connection_string)
-    cur = conn.cursor()
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+    
+        # Enable PostGIS extension if not already enabled
+        cur.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
+
+        # Create table with PostGIS geometry that allows for both Polygon and MultiPolygon
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS road_construction (
+            id SERIAL PRIMARY KEY,
+            worksite_code VARCHAR(50),
+            worksite_name VARCHAR(255),
+            project_name VARCHAR(255),
+            status VARCHAR(50),
+            worksite_type VARCHAR(100),
+            shape_area FLOAT,
+            shape_length FLOAT,
+            principal_organisation VARCHAR(255),
+            project_start_date TIMESTAMP,
+            project_end_date TIMESTAMP,
+            work_start_date TIMESTAMP,
+            work_completion_date TIMESTAMP,
+            work_status VARCHAR(50),
+            geom GEOMETRY(GEOMETRY, 4326)
+        );
     
-    # Enable PostGIS extension if not already enabled
-    cur.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
-
-    # Create table with PostGIS geometry that allows for both Polygon and MultiPolygon
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS road_construction (
-        id SERIAL PRIMARY KEY,
-        worksite_code VARCHAR(50),
-        worksite_name VARCHAR(255),
-        project_name VARCHAR(255),
-        status VARCHAR(50),
-        worksite_type VARCHAR(100),
-        shape_area FLOAT,
-        shape_length FLOAT,
-        principal_organisation VARCHAR(255),
-        project_start_date TIMESTAMP,
-        project_end_date TIMESTAMP,
-        work_start_date TIMESTAMP,
-        work_completion_date TIMESTAMP,
-        work_status VARCHAR(50),
-        geom GEOMETRY(GEOMETRY, 4326)
-    );
+        CREATE INDEX IF NOT EXISTS idx_road_construction_geom ON road_construction USING GIST (geom);
+        """)
     
-    CREATE INDEX IF NOT EXISTS idx_road_construction_geom ON road_construction USING GIST (geom);
-    """)
+        cur.execute(NZTM_COLUMN_SQL)
     
-    conn.commit()
-    logging.debug("Table 'road_construction' created or already exists.")
+        conn.commit()
+        logging.debug("Table 'road_construction' created or already exists.")
     
-    cur.close()
-    conn.close()
+        cur.close()
+
+def query_roadworks_within(connection_string, lat, lon, radius_m=100):
+    # Every worksite within radius_m metres of the point, nearest first, as
+    # (worksite_name, project_name, status, work_status, distance, worksite_code).
+    ensure_nztm_column(connection_string)
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        execute_prepared(cur, 'roadworks_near', (lon, lat, radius_m))
+        results = cur.fetchall()
+        cur.close()
+    
+    return results
+
+def query_roadworks_geometries_within(connection_string, lat, lon, radius_m):
+    # Worksites within radius_m metres of the point with their geometry, as
+    # (worksite_name, project_name, status, work_status, worksite_code, WKB).
+    ensure_nztm_column(connection_string)
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        execute_prepared(cur, 'roadworks_geometries_near', (lon, lat, radius_m))
+        results = cur.fetchall()
+        cur.close()
+    
+    return results
 
 def test_insertion(connection_string, test_lat, test_lon):
-    conn = psycopg2.connect(connection_string)
-    cur = conn.cursor()
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        
+        # Check the total number of records
+        cur.execute("SELECT COUNT(*) FROM road_construction")
+        count = cur.fetchone()[0]
+        logging.debug(f"Total records in road_construction table: {count}")
     
-    # Check the total number of records
-    cur.execute("SELECT COUNT(*) FROM road_construction")
-    count = cur.fetchone()[0]
-    logging.debug(f"Total records in road_construction table: {count}")
+        # Retrieve and display a sample record
+        cur.execute("SELECT worksite_name, ST_AsText(geom) FROM road_construction LIMIT 1")
+        sample = cur.fetchone()
+        if sample:
+            logging.debug(f"Sample record - Worksite Name: {sample[0]}")
+            logging.debug(f"Geometry: {sample[1][:100]}...")  # Printing first 100 characters of geometry
     
-    # Retrieve and display a sample record
-    cur.execute("SELECT worksite_name, ST_AsText(geom) FROM road_construction LIMIT 1")
-    sample = cur.fetchone()
-    if sample:
-        logging.debug(f"Sample record - Worksite Name: {sample[0]}")
-        logging.debug(f"Geometry: {sample[1][:100]}...")  # Printing first 100 characters of geometry
+        cur.close()
     
     # Check for construction at the given coordinates
-    cur.execute("""
-        SELECT worksite_name, project_name, status, work_status, 
-               ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) AS distance
-        FROM road_construction
-        WHERE ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, 100)
-        ORDER BY distance
-        LIMIT 1;
-    """, (test_lon, test_lat, test_lon, test_lat))
-    
-    nearby_construction = cur.fetchone()
-    if nearby_construction:
+    nearby = query_roadworks_within(connection_string, test_lat, test_lon, 100)
+    if nearby:
+        nearby_construction = nearby[0]
         print(f"\nConstruction found near coordinates ({test_lat}, {test_lon}):")
         print(f"Worksite Name: {nearby_construction[0]}")
         print(f"Project Name: {nearby_construction[1]}")
@@ -159,15 +294,16 @@ def test_insertion(connection_string, test_lat, test_lon):
         print(f"Distance: {nearby_construction[4]:.2f} meters")
     else:
         print(f"\nNo construction found within 100 meters of coordinates ({test_lat}, {test_lon})")
-    
-    cur.close()
-    conn.close()
+    if len(nearby) > 1:
+        print(f"{len(nearby) - 1} more worksite(s) within 100 meters")
 
 # Example usage
 if __name__ == "__main__":
     connection_string = ""
     geojson_file_path = "Roadworks.geojson"  # Replace with your actual file path
     
+    # Creates the table on a fresh database. Older tables get geom_nztm from
+    # ensure_nztm_column on the first query or load.
     # create_road_construction_table(connection_string)
     # insert_road_construction_data(connection_string, geojson_file_path)
 
@@ -0,0 +1,229 @@
+import threading
+import time
+from bisect import bisect_left
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(label_names, labels):
+    if not label_names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(label_names, escaped)) + "}"
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        # Hot path: one bisect and three increments under a short lock; the
+        # cumulative bucket counts are only built when rendering.
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_labels = _format_labels(self.label_names + ("le",), labels + (le,))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                label_text = _format_labels(self.label_names, labels)
+                lines.append(f"{self.name}_sum{label_text} {total}")
+                lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Gauge:
+    # Value read from `func` at scrape time; func returns a number or a dict
+    # of label tuple -> number.
+    def __init__(self, name, documentation, func, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.label_names = label_names
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def gauge(self, name, documentation, func, label_names=()):
+        # Re-registering a gauge replaces its callback (e.g. a new app).
+        gauge = Gauge(name, documentation, func, label_names)
+        with self.lock:
+            self.metrics[name] = gauge
+        return gauge
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "agent_stage_duration_seconds", "Time spent per pipeline stage.", ("stage", "name"))
+REQUEST_DURATION = REGISTRY.histogram(
+    "agent_request_duration_seconds", "End-to-end time of top-level agent runs.")
+STAGE_ERRORS = REGISTRY.counter(
+    "agent_stage_errors_total", "Pipeline stage runs that raised.", ("stage", "name"))
+LLM_TOKENS = REGISTRY.counter(
+    "agent_llm_tokens_total", "LLM tokens reported by the provider.", ("type",))
+TOOL_CALLS = REGISTRY.counter(
+    "agent_tool_calls_total", "Tool invocations made by the agent.", ("tool",))
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    # Records per-stage timings for retriever, LLM and tool runs plus the
+    # top-level run, keyed by run id. Pass it in the invoke config (not the
+    # constructor) so every child run inherits it.
+    run_inline = True
+
+    def __init__(self):
+        self.runs = {}
+
+    def _start(self, run_id, stage, name):
+        self.runs[run_id] = (stage, name, time.perf_counter())
+
+    def _end(self, run_id, error=False):
+        started = self.runs.pop(run_id, None)
+        if started is None:
+            return
+        stage, name, start = started
+        elapsed = time.perf_counter() - start
+        if stage == "request":
+            REQUEST_DURATION.observe(elapsed)
+        else:
+            STAGE_DURATION.observe(elapsed, stage, name)
+        if error:
+            STAGE_ERRORS.inc(1, stage, name)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None:
+            self._start(run_id, "request", "agent")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id, "retriever", kwargs.get("name") or "retriever")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "llm", kwargs.get("name") or (serialized or {}).get("name", "llm"))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm", kwargs.get("name") or (serialized or {}).get("name", "chat_model"))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        if not usage:
+            # Streamed generations have no llm_output; chat models report
+            # usage on the message instead (ChatOpenAI with stream_usage).
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += metadata.get("input_tokens") or 0
+                    completion_tokens += metadata.get("output_tokens") or 0
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, "prompt")
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, "completion")
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        TOOL_CALLS.inc(1, name)
+        self._start(run_id, "tool", name)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+
+METRICS_HANDLER = MetricsCallbackHandler()
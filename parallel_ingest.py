@@ -0,0 +1,121 @@
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import psycopg2
+
+from bulk_load import ROAD_CONSTRUCTION_COLUMNS, ROAD_SEGMENT_COLUMNS, copy_rows, geometry_to_hex_ewkb
+from db import pooled_connection
+from geojson_stream import batched, iter_features, with_progress
+from geometry_reduction import default_reducer
+from ingest_hooks import last_row_id, notify_rows_added
+from insert_road import road_feature_to_row
+from insert_roadworks import construction_feature_to_row
+
+INGEST_TARGETS = {
+    'road_segments': (ROAD_SEGMENT_COLUMNS, road_feature_to_row),
+    'road_construction': (ROAD_CONSTRUCTION_COLUMNS, construction_feature_to_row),
+}
+
+# Per-process state, set up once by _init_worker in each pool process.
+_worker_conn = None
+_worker_table = None
+_worker_reducer = None
+
+
+def _init_worker(connection_string, table):
+    global _worker_conn, _worker_table, _worker_reducer
+    _worker_conn = psycopg2.connect(connection_string)
+    _worker_table = table
+    # Shards are reduced in the workers when the INGEST_* settings ask for it.
+    _worker_reducer = default_reducer()
+
+
+def _ingest_shard(features):
+    columns, feature_to_row = INGEST_TARGETS[_worker_table]
+    encode_geometry = geometry_to_hex_ewkb
+    if _worker_reducer:
+        features = list(_worker_reducer.reduce_features(features))
+        encode_geometry = _worker_reducer.to_hex_ewkb
+    rows = []
+    rejected = 0
+    for feature in features:
+        try:
+            rows.append(feature_to_row(feature, encode_geometry))
+        except Exception as e:
+            logging.debug(f"Rejected feature in pid {os.getpid()}: {e}")
+            rejected += 1
+
+    if not rows:
+        return 0, rejected
+    try:
+        return copy_rows(_worker_conn, _worker_table, columns, rows), rejected
+    except Exception as e:
+        logging.error(f"Error loading shard of {len(rows)} rows in pid {os.getpid()}: {e}")
+        return 0, len(features)
+
+
+def _count_rows(connection_string, table):
+    with pooled_connection(connection_string) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM {table}")
+        return cur.fetchone()[0]
+
+
+def parallel_ingest(connection_string, geojson_file_path, table, workers=None, shard_size=2000):
+    if table not in INGEST_TARGETS:
+        raise ValueError(f"Unsupported ingest table: {table}")
+    workers = workers or os.cpu_count() or 1
+    # Keep a small window of shards in flight so the parser never runs more
+    # than a couple of shards ahead of the workers.
+    max_pending = workers * 2
+
+    rows_before = _count_rows(connection_string, table)
+    first_id = last_row_id(connection_string, table)
+    parsed = inserted = rejected = 0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(connection_string, table)) as pool:
+        pending = set()
+        features = with_progress(iter_features(geojson_file_path), f"{table} features")
+        for shard in batched(features, shard_size):
+            parsed += len(shard)
+            pending.add(pool.submit(_ingest_shard, shard))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shard_inserted, shard_rejected = future.result()
+                    inserted += shard_inserted
+                    rejected += shard_rejected
+        for future in wait(pending).done:
+            shard_inserted, shard_rejected = future.result()
+            inserted += shard_inserted
+            rejected += shard_rejected
+
+    # Reconcile what the workers reported against the parser and the table.
+    rows_added = _count_rows(connection_string, table) - rows_before
+    if inserted + rejected != parsed:
+        logging.warning(f"Parsed {parsed} features but workers accounted for {inserted + rejected}")
+    if rows_added != inserted:
+        logging.warning(f"Workers reported {inserted} inserted rows but {table} grew by {rows_added}")
+
+    print(f"Parallel ingest into {table} with {workers} workers: "
+          f"{parsed} parsed, {inserted} inserted, {rejected} rejected")
+    notify_rows_added(connection_string, table, first_id)
+    return {'parsed': parsed, 'inserted': inserted, 'rejected': rejected, 'rows_added': rows_added}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load a GeoJSON file using a pool of worker processes.")
+    parser.add_argument("connection_string")
+    parser.add_argument("geojson_file_path")
+    parser.add_argument("--table", choices=sorted(INGEST_TARGETS), default='road_construction')
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    parallel_ingest(args.connection_string, args.geojson_file_path, args.table,
+                    workers=args.workers, shard_size=args.shard_size)
@@ -1,10 +1,6 @@
 # RETRIEVAL CHAIN - for document retrieval
 from langchain_community.document_loaders import WebBaseLoader
-from langchain_openai import ChatOpenAI, OpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain, create_history_aware_retriever
+from langchain_openai import ChatOpenAI, OpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
@@ -12,6 +8,12 @@ from langchain.tools.retriever import create_retriever_tool
 from langchain import hub
 from langchain.agents import create_openai_functions_agent, AgentExecutor
 # from langchain.agents import 
+from embedding_cache import CachedEmbeddings
+from embedding_engine import BatchedEmbeddings, token_text_splitter
+from history_manager import ChatHistoryManager
+from vector_cache import build_vectorstore
+from retrieval_memo import MemoizedRetriever, create_memoized_history_aware_retriever, retrieval_scope
+from metrics import METRICS_HANDLER, REGISTRY
 
 loader = WebBaseLoader("https://docs.smith.langchain.com/user_guide")
 llm = OpenAI()
@@ -19,51 +21,40 @@ llm = OpenAI()
 #1. Load the documents
 docs = loader.load()
 #2. Create the embeddings
-embeddings = OpenAIEmbeddings()
+embeddings = CachedEmbeddings(BatchedEmbeddings())
 #3. Create the retriever
-text_splitter = RecursiveCharacterTextSplitter()
+text_splitter = token_text_splitter()
 #4. Split the text
 documents = text_splitter.split_documents(docs)
 #5. Create the vector store
-vector = FAISS.from_documents(documents, embeddings)
+vector = build_vectorstore(documents, embeddings)
 #6. Create the retriever
-retriever = vector.as_retriever()
+# Memoized per request (see retrieval_scope below), so the history-aware
+# lookup and the agent's tool share one FAISS search per query.
+retriever = MemoizedRetriever(retriever=vector.as_retriever())
 
-# Create the context dynamically by retrieving documents from the vector store
-def create_context_from_documents(input_query):
+retriever_prompt = ChatPromptTemplate.from_messages([
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("user", "{input}"),
+    ("user", "Given the above conversation, generate a search query to look up in order to get information relevant to the conversation"),
+])
+#7. Create the retrievar chain - for history (no rewrite LLM call without history)
+retriever_chain = create_memoized_history_aware_retriever(llm, retriever, retriever_prompt)
+
+# Create the context dynamically by retrieving documents from the vector store,
+# with the question rewritten against the chat history first
+def create_context_from_documents(input_query, chat_history):
     print('input_query: ', input_query)
-    # Pass the correct input format to retriever.invoke
-    result = retriever.invoke(input_query)
+    result = retriever_chain.invoke({"input": input_query, "chat_history": chat_history},
+                                    config={"callbacks": [METRICS_HANDLER]})
     print('result: ', result)
     docs = result if isinstance(result, list) else result['documents']
     context = "\n\n".join([doc.page_content for doc in docs])
     return context
 
-#7. Create the prompt
-doc_prompt = ChatPromptTemplate.from_template("""Answer the following question based only on the provided context:
-
-<context>
-{context}
-</context>
-
-Question: {input}""")
-
-#8. Create the document chain
-document_chain = create_stuff_documents_chain(llm, doc_prompt)
-
-retriever_prompt = ChatPromptTemplate.from_messages([
-    ("system", "Answer the user's questions based on the below context:\n\n{context}"),
-    MessagesPlaceholder(variable_name="chat_history"),
-    ("user", "{input}"),
-])
-#9. Create the retrievar chain - for history
-retriever_chain = create_history_aware_retriever(llm, retriever, retriever_prompt)
-#10. Create the retrieval chain (document + history)
-retrieval_chain = create_retrieval_chain(retriever_chain, document_chain)
-
 # search tool
 retriever_tool = create_retriever_tool(
-    retrieval_chain,
+    retriever,
     "langsmith_search",
     "Search for information about LangSmith. For any questions about LangSmith, you must use this tool!"
 )
@@ -84,16 +75,27 @@ chat_history = [
   HumanMessage(content="What is prototyping in the from the user guide?"),
   AIMessage(content="Prototyping is the process of quickly experimenting and testing different aspects of an LLM (Language Model) application, such as prompts, model types, and retrieval strategies. This allows developers to understand how the model is performing and debug any issues that may arise."),
   ]
+# Recent turns stay verbatim within a token budget; older ones are folded into
+# a rolling summary so the prompt does not grow with the conversation.
+history = ChatHistoryManager(llm)
+history.extend(chat_history)
 input_query = "When developing new LLM applications, what does the document suggest?"
-context = create_context_from_documents(input_query)
-print('context: ', context)
+with retrieval_scope():
+    context = create_context_from_documents(input_query, history.messages)
+    print('context: ', context)
 
-# Invoke agent with chat history, input query, and context
-result = agent_executor.invoke({
-    "chat_history": chat_history,
-    "input": input_query,
-    # "context": context
-})
+    # Invoke agent with chat history, input query, and context
+    result = agent_executor.invoke({
+        "chat_history": history.messages,
+        "input": input_query,
+        # "context": context
+    }, config={"callbacks": [METRICS_HANDLER]})
 
 print(result)
-print(result["answer"])
\ No newline at end of file
+print(result["output"])
+history.add_turn(input_query, result["output"])
+print(f'history: {history.total_tokens} tokens ({len(history.recent)} recent messages, {history.summary_calls} summary calls)')
+
+# Per-stage timings, token and tool-call counts for this run
+print(REGISTRY.render())
+embeddings.close()
\ No newline at end of file
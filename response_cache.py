@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.messages import messages_to_dict
+from langchain_core.runnables import Runnable
+
+# Opt-in: answers built from live web search go stale within the TTL.
+CACHE_ENABLED = os.environ.get("AGENT_CACHE", "0") == "1"
+MAX_ENTRIES = int(os.environ.get("AGENT_CACHE_MAX_ENTRIES", "1024"))
+TTL = float(os.environ.get("AGENT_CACHE_TTL", "300"))
+# Optional second tier that survives restarts and is shared by workers.
+DISK_PATH = os.environ.get("AGENT_CACHE_DISK_PATH", "")
+
+
+def request_key(question, chat_history):
+    # Whitespace differences in the question do not change the answer;
+    # everything in the chat history (type, content, extras) does.
+    payload = {
+        'input': ' '.join(str(question).split()),
+        'chat_history': messages_to_dict(chat_history or []),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, disk_path=DISK_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value, cost_seconds)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.saved_seconds = 0.0
+        self.disk = None
+        if disk_path:
+            self.disk = sqlite3.connect(disk_path, check_same_thread=False, timeout=30)
+            self.disk.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    cost REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self.disk.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, value, cost = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    self.saved_seconds += cost
+                    return value
+                del self.entries[key]
+
+            if self.disk is not None:
+                row = self.disk.execute(
+                    "SELECT value, cost, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                    (key, now)).fetchone()
+                if row is not None:
+                    value, cost, expires_at = json.loads(row[0]), row[1], row[2]
+                    self._remember(key, value, cost, expires_at)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self.saved_seconds += cost
+                    return value
+        return None
+
+    def _remember(self, key, value, cost, expires_at):
+        self.entries[key] = (expires_at, value, cost)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def put(self, key, value, cost):
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self._remember(key, value, cost, expires_at)
+            if self.disk is not None:
+                self.disk.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, cost, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), cost, expires_at))
+                self.disk.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                self.disk.commit()
+
+    def compute(self, key, func):
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self.lock:
+            self.misses += 1
+        start = time.perf_counter()
+        value = func()
+        self.put(key, value, time.perf_counter() - start)
+        return value
+
+    async def acompute(self, key, afunc):
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        # Identical requests arriving while one is running wait for its
+        # result instead of starting another agent run. The run is a task of
+        # its own, shielded from every caller, so a client that disconnects
+        # (cancelling its request) does not fail the others waiting on it.
+        task = self.inflight.get(key)
+        if task is not None:
+            with self.lock:
+                self.coalesced += 1
+        else:
+            with self.lock:
+                self.misses += 1
+            task = asyncio.ensure_future(self._run(key, afunc))
+            # Marks the exception retrieved when every caller has gone.
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self.inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _run(self, key, afunc):
+        start = time.perf_counter()
+        try:
+            value = await afunc()
+            self.put(key, value, time.perf_counter() - start)
+            return value
+        finally:
+            self.inflight.pop(key, None)
+
+    @property
+    def stats(self):
+        with self.lock:
+            served = self.hits + self.coalesced
+            total = served + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'hit_ratio': served / total if total else 0.0,
+                'saved_seconds': self.saved_seconds,
+            }
+
+
+class CachedAgent(Runnable):
+    # invoke/ainvoke are answered from the cache. Only the final output
+    # string is cached; input and chat_history are echoed back from the
+    # request so hits return the executor's shape. stream/astream, which
+    # langserve's stream, stream_log and stream_events routes go through,
+    # run the agent itself so clients still see its intermediate steps.
+    name = "CachedAgentExecutor"
+
+    def __init__(self, agent_executor, cache):
+        self.agent_executor = agent_executor
+        self.cache = cache
+
+    def _invoke(self, inputs, config):
+        key = request_key(inputs.get('input', ''), inputs.get('chat_history'))
+        output = self.cache.compute(key, lambda: self.agent_executor.invoke(inputs, config)['output'])
+        return {**inputs, 'output': output}
+
+    async def _ainvoke(self, inputs, config):
+        key = request_key(inputs.get('input', ''), inputs.get('chat_history'))
+
+        async def run_agent():
+            result = await self.agent_executor.ainvoke(inputs, config)
+            return result['output']
+
+        output = await self.cache.acompute(key, run_agent)
+        return {**inputs, 'output': output}
+
+    def invoke(self, input, config=None, **kwargs):
+        return self._call_with_config(self._invoke, input, config)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self._acall_with_config(self._ainvoke, input, config)
+
+    def stream(self, input, config=None, **kwargs):
+        yield from self.agent_executor.stream(input, config, **kwargs)
+
+    async def astream(self, input, config=None, **kwargs):
+        async for chunk in self.agent_executor.astream(input, config, **kwargs):
+            yield chunk
+
+
+def cached_agent(agent_executor, cache):
+    return CachedAgent(agent_executor, cache)
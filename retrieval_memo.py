@@ -0,0 +1,96 @@
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.messages import get_buffer_string
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableLambda
+
+# Standard query-rewrite prompt: turns a follow-up question into a standalone
+# search query using the conversation so far.
+REWRITE_PROMPT = ChatPromptTemplate.from_messages([
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("user", "{input}"),
+    ("user", "Given the above conversation, generate a search query to look up in order to get information relevant to the conversation"),
+])
+
+_memo = ContextVar("retrieval_memo", default=None)
+
+
+@contextmanager
+def retrieval_scope():
+    # Everything retrieved inside the block (one user request) is shared:
+    # the same query against the same retriever runs once, and the same
+    # question and history is rewritten once. The memo is dropped on exit.
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+def _normalize(query):
+    return ' '.join(str(query).split()).lower()
+
+
+def _memoized(key, compute):
+    memo = _memo.get()
+    if memo is None:
+        return compute()
+    if key not in memo:
+        memo[key] = compute()
+    return memo[key]
+
+
+async def _amemoized(key, acompute):
+    memo = _memo.get()
+    if memo is None:
+        return await acompute()
+    if key not in memo:
+        memo[key] = await acompute()
+    return memo[key]
+
+
+class MemoizedRetriever(BaseRetriever):
+    # Wraps a retriever so that, inside retrieval_scope(), repeated queries
+    # (ignoring case and whitespace) reuse the first result. Outside a scope
+    # it simply delegates.
+    retriever: BaseRetriever
+
+    def _key(self, query):
+        return ('retrieve', id(self.retriever), _normalize(query))
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return _memoized(self._key(query),
+                         lambda: self.retriever.invoke(query, config={"callbacks": run_manager.get_child()}))
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        return await _amemoized(self._key(query),
+                                lambda: self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()}))
+
+
+def create_memoized_history_aware_retriever(llm, retriever, prompt=REWRITE_PROMPT):
+    # Same contract as create_history_aware_retriever ({"input", "chat_history"}
+    # in, documents out). Without chat history the question goes straight to
+    # the retriever with no rewrite call; with history the rewritten query is
+    # memoized per request.
+    rewrite = prompt | llm | StrOutputParser()
+
+    def rewrite_key(inputs):
+        payload = f"{_normalize(inputs['input'])}\0{get_buffer_string(inputs['chat_history'])}"
+        return ('rewrite', hashlib.sha256(payload.encode('utf-8')).hexdigest())
+
+    def rewrite_query(inputs, config):
+        if not inputs.get("chat_history"):
+            return inputs["input"]
+        return _memoized(rewrite_key(inputs), lambda: rewrite.invoke(inputs, config))
+
+    async def arewrite_query(inputs, config):
+        if not inputs.get("chat_history"):
+            return inputs["input"]
+        return await _amemoized(rewrite_key(inputs), lambda: rewrite.ainvoke(inputs, config))
+
+    return (RunnableLambda(rewrite_query, afunc=arewrite_query, name="rewrite_query") | retriever).with_config(
+        run_name="chat_retriever_chain")
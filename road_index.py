@@ -0,0 +1,261 @@
+import struct
+import threading
+
+import numpy as np
+
+from db import pooled_connection
+from ingest_hooks import on_ingest, remove_ingest_listener, watch_ingests
+
+DEFAULT_CELL_SIZE = 0.01  # degrees, roughly 1km around Auckland
+# Points this many rings away from any populated cell fall back to a scan of
+# every segment rather than walking empty rings.
+MAX_RING_SEARCH = 64
+NO_SPEED_LIMIT = -1
+
+
+def linestring_from_wkb(wkb):
+    # ST_AsBinary(geom, 'NDR') of a 2D LINESTRING: 1 byte order, uint32 type,
+    # uint32 point count, then little-endian float64 x/y pairs.
+    wkb = bytes(wkb)
+    (count,) = struct.unpack_from('<I', wkb, 5)
+    return np.frombuffer(wkb, dtype='<f8', count=2 * count, offset=9).reshape(-1, 2)
+
+
+def point_segment_distances(px, py, x0, y0, x1, y1):
+    dx = x1 - x0
+    dy = y1 - y0
+    length_sq = dx * dx + dy * dy
+    safe_length_sq = np.where(length_sq > 0, length_sq, 1.0)
+    t = np.clip(((px - x0) * dx + (py - y0) * dy) / safe_length_sq, 0.0, 1.0)
+    t = np.where(length_sq > 0, t, 0.0)
+    return np.hypot(px - (x0 + t * dx), py - (y0 + t * dy))
+
+
+class RoadSegments:
+    # Flat, array-backed copy of road_segments: one row per line segment
+    # (consecutive vertex pair) pointing back at its road.
+    def __init__(self, road_names, speed_limits, starts, ends, segment_roads):
+        self.road_names = road_names
+        self.speed_limits = speed_limits
+        self.x0 = np.ascontiguousarray(starts[:, 0])
+        self.y0 = np.ascontiguousarray(starts[:, 1])
+        self.x1 = np.ascontiguousarray(ends[:, 0])
+        self.y1 = np.ascontiguousarray(ends[:, 1])
+        self.segment_roads = segment_roads
+
+    def __len__(self):
+        return len(self.segment_roads)
+
+    def distances(self, px, py, candidates=None):
+        if candidates is None:
+            return point_segment_distances(px, py, self.x0, self.y0, self.x1, self.y1)
+        return point_segment_distances(px, py, self.x0[candidates], self.y0[candidates],
+                                       self.x1[candidates], self.y1[candidates])
+
+    def road_result(self, segment, distance):
+        road = self.segment_roads[segment]
+        speed_limit = int(self.speed_limits[road])
+        return (self.road_names[road],
+                None if speed_limit == NO_SPEED_LIMIT else speed_limit,
+                float(distance))
+
+
+def road_segments_from_rows(rows):
+    # (road_name, speed_limit, linestring WKB) rows -> RoadSegments.
+    road_names = []
+    speed_limits = []
+    starts = []
+    ends = []
+    segment_roads = []
+    for road_name, speed_limit, wkb in rows:
+        coords = linestring_from_wkb(wkb)
+        if len(coords) < 2:
+            continue
+        road = len(road_names)
+        road_names.append(road_name)
+        speed_limits.append(NO_SPEED_LIMIT if speed_limit is None else speed_limit)
+        starts.append(coords[:-1])
+        ends.append(coords[1:])
+        segment_roads.append(np.full(len(coords) - 1, road, dtype=np.int32))
+
+    if not road_names:
+        return RoadSegments([], np.empty(0, dtype=np.int32), np.empty((0, 2)), np.empty((0, 2)),
+                            np.empty(0, dtype=np.int32))
+    return RoadSegments(road_names, np.asarray(speed_limits, dtype=np.int32),
+                        np.concatenate(starts), np.concatenate(ends), np.concatenate(segment_roads))
+
+
+def load_road_segments(connection_string):
+    with pooled_connection(connection_string) as conn:
+        # Named (server-side) cursor so rows stream in instead of being
+        # buffered client-side all at once.
+        cur = conn.cursor(name='road_index_load')
+        cur.itersize = 10000
+        cur.execute("""
+            SELECT road_name, speed_limit, ST_AsBinary(geom, 'NDR')
+            FROM road_segments
+            WHERE geom IS NOT NULL
+        """)
+        segments = road_segments_from_rows(cur)
+        cur.close()
+    return segments
+
+
+class UniformGrid:
+    # Buckets segments into square cells by bounding box, stored CSR-style:
+    # sorted cell keys plus start/end offsets into one segment id array.
+    def __init__(self, segments, cell_size):
+        self.cell_size = cell_size
+        min_x = np.minimum(segments.x0, segments.x1)
+        max_x = np.maximum(segments.x0, segments.x1)
+        min_y = np.minimum(segments.y0, segments.y1)
+        max_y = np.maximum(segments.y0, segments.y1)
+        self.origin_x = float(min_x.min())
+        self.origin_y = float(min_y.min())
+
+        cx0 = self._cell(min_x, self.origin_x)
+        cx1 = self._cell(max_x, self.origin_x)
+        cy0 = self._cell(min_y, self.origin_y)
+        cy1 = self._cell(max_y, self.origin_y)
+        self.columns = int(cx1.max()) + 1
+        self.rows = int(cy1.max()) + 1
+
+        # Expand each segment into every cell its bounding box covers.
+        widths = cx1 - cx0 + 1
+        spans = widths * (cy1 - cy0 + 1)
+        segment_ids = np.repeat(np.arange(len(segments), dtype=np.int32), spans)
+        offsets = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        repeated_widths = np.repeat(widths, spans)
+        cell_x = np.repeat(cx0, spans) + offsets % repeated_widths
+        cell_y = np.repeat(cy0, spans) + offsets // repeated_widths
+        keys = cell_y * self.columns + cell_x
+
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        self.segment_ids = segment_ids[order]
+        self.cell_keys, self.cell_starts = np.unique(keys, return_index=True)
+        self.cell_ends = np.append(self.cell_starts[1:], len(keys))
+
+    def _cell(self, values, origin):
+        return np.floor((values - origin) / self.cell_size).astype(np.int64)
+
+    def cell_of(self, x, y):
+        return (int(np.floor((x - self.origin_x) / self.cell_size)),
+                int(np.floor((y - self.origin_y) / self.cell_size)))
+
+    def ring_segments(self, cx, cy, ring):
+        if ring == 0:
+            xs = np.array([cx])
+            ys = np.array([cy])
+        else:
+            span = np.arange(-ring, ring + 1)
+            inner = span[1:-1]
+            xs = np.concatenate([cx + span, cx + span, np.full(len(inner), cx - ring), np.full(len(inner), cx + ring)])
+            ys = np.concatenate([np.full(len(span), cy - ring), np.full(len(span), cy + ring), cy + inner, cy + inner])
+        inside = (xs >= 0) & (xs < self.columns) & (ys >= 0) & (ys < self.rows)
+        if not inside.any():
+            return np.empty(0, dtype=np.int32)
+        keys = ys[inside] * self.columns + xs[inside]
+        positions = np.searchsorted(self.cell_keys, keys)
+        found = positions < len(self.cell_keys)
+        found[found] = self.cell_keys[positions[found]] == keys[found]
+        positions = positions[found]
+        if not len(positions):
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate([self.segment_ids[self.cell_starts[p]:self.cell_ends[p]] for p in positions]))
+
+    def max_ring(self, cx, cy):
+        outside = max(0, -cx, cx - self.columns + 1, -cy, cy - self.rows + 1)
+        return max(self.columns, self.rows) + outside
+
+
+class RoadIndex:
+    # In-process nearest-road engine over a snapshot of road_segments. Results
+    # have the same shape as query_nearest_road: (road_name, speed_limit,
+    # distance), with distance in the units of the 4326 geometry (degrees).
+    def __init__(self, connection_string, cell_size=DEFAULT_CELL_SIZE, auto_refresh=True):
+        self.connection_string = connection_string
+        self.cell_size = cell_size
+        self._lock = threading.Lock()
+        self._snapshot = None
+        # Bumped by invalidate(); the snapshot is current while it was loaded
+        # at the latest generation.
+        self._generation = 0
+        self._loaded_generation = None
+        self.auto_refresh = auto_refresh
+        if auto_refresh:
+            # Loads by other processes arrive through ingest_log.
+            on_ingest(self._on_ingest)
+            watch_ingests(connection_string)
+
+    def _on_ingest(self, table, bbox):
+        if table == 'road_segments':
+            self.invalidate()
+
+    def invalidate(self):
+        # The next lookup reloads; ingest itself never waits on the rebuild.
+        self._generation += 1
+
+    def close(self):
+        if self.auto_refresh:
+            remove_ingest_listener(self._on_ingest)
+
+    def refresh(self):
+        with self._lock:
+            return self._load()
+
+    def _load(self):
+        # Called with self._lock held, so loads never overlap. An
+        # invalidation during the load leaves the snapshot stale.
+        generation = self._generation
+        segments = load_road_segments(self.connection_string)
+        grid = UniformGrid(segments, self.cell_size) if len(segments) else None
+        self._snapshot = (segments, grid)
+        self._loaded_generation = generation
+        return len(segments)
+
+    def _current(self):
+        snapshot = self._snapshot
+        if snapshot is None or self._loaded_generation != self._generation:
+            with self._lock:
+                # Callers that queued behind a reload use its result.
+                if self._snapshot is None or self._loaded_generation != self._generation:
+                    self._load()
+                snapshot = self._snapshot
+        return snapshot
+
+    def nearest(self, lat, lon):
+        segments, grid = self._current()
+        if grid is None:
+            return None
+
+        cx, cy = grid.cell_of(lon, lat)
+        best_distance = np.inf
+        best_segment = -1
+        max_ring = grid.max_ring(cx, cy)
+        for ring in range(min(max_ring, MAX_RING_SEARCH) + 1):
+            candidates = grid.ring_segments(cx, cy, ring)
+            if len(candidates):
+                distances = segments.distances(lon, lat, candidates)
+                position = int(np.argmin(distances))
+                if distances[position] < best_distance:
+                    best_distance = distances[position]
+                    best_segment = int(candidates[position])
+            # Anything in an unvisited ring is at least ring * cell_size away.
+            if best_distance <= ring * grid.cell_size:
+                break
+        else:
+            if max_ring > MAX_RING_SEARCH:
+                distances = segments.distances(lon, lat)
+                best_segment = int(np.argmin(distances))
+                best_distance = distances[best_segment]
+
+        return segments.road_result(best_segment, best_distance)
+
+    def nearest_many(self, lats, lons):
+        results = [self.nearest(lat, lon) for lat, lon in zip(lats, lons)]
+        return {
+            'road_name': [r[0] if r else None for r in results],
+            'speed_limit': np.array([r[1] if r and r[1] is not None else NO_SPEED_LIMIT for r in results], dtype=np.int32),
+            'distance': np.array([r[2] if r else np.nan for r in results], dtype=np.float64),
+        }
@@ -0,0 +1,316 @@
+import math
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.tools import StructuredTool
+
+from geometry_reduction import METRES_PER_DEGREE_LAT, METRES_PER_DEGREE_LON
+from ingest_hooks import on_ingest, remove_ingest_listener, watch_ingests
+from insert_road import query_roads_near_area
+from insert_roadworks import query_roadworks_geometries_within
+from road_index import point_segment_distances, road_segments_from_rows
+
+# Geohash precision of the cache tiles: 7 is about 153 m x 153 m, 8 about
+# 38 m x 19 m. Each tile caches the roads and worksites that can matter to
+# any point in it; answers are then measured from the point asked about.
+GEOHASH_PRECISION = int(os.environ.get("ROAD_TOOLS_GEOHASH_PRECISION", "7"))
+CACHE_MAX_ENTRIES = int(os.environ.get("ROAD_TOOLS_CACHE_MAX_ENTRIES", "50000"))
+DEFAULT_RADIUS_M = float(os.environ.get("ROAD_TOOLS_ROADWORKS_RADIUS_M", "100"))
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Even bits split longitude, odd bits latitude.
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash):
+    # (min_lon, min_lat, max_lon, max_lat) of the tile.
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lon_range[0], lat_range[0], lon_range[1], lat_range[1]
+
+
+def geohash_center(geohash):
+    min_lon, min_lat, max_lon, max_lat = geohash_bounds(geohash)
+    return (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+
+
+def polygon_rings_from_wkb(wkb):
+    # ST_AsBinary(geom, 'NDR') of a 2D POLYGON or MULTIPOLYGON -> its rings
+    # as (n, 2) arrays; other geometry types have none.
+    wkb = bytes(wkb)
+    (geometry_type,) = struct.unpack_from('<I', wkb, 1)
+    if geometry_type == 3:
+        polygons, offset = 1, 0
+    elif geometry_type == 6:
+        (polygons,) = struct.unpack_from('<I', wkb, 5)
+        offset = 9
+    else:
+        return []
+    rings = []
+    for _ in range(polygons):
+        (ring_count,) = struct.unpack_from('<I', wkb, offset + 5)
+        offset += 9
+        for _ in range(ring_count):
+            (count,) = struct.unpack_from('<I', wkb, offset)
+            rings.append(np.frombuffer(wkb, dtype='<f8', count=2 * count, offset=offset + 4).reshape(-1, 2))
+            offset += 4 + 16 * count
+    return rings
+
+
+class WorksiteCandidates:
+    # Worksites fetched for a tile with their ring edges flattened into one
+    # array, so each query measures all of them from its own point.
+    def __init__(self, rows):
+        self.attributes = []
+        edges = []
+        owners = []
+        for worksite_name, project_name, status, work_status, worksite_code, wkb in rows:
+            rings = [ring for ring in polygon_rings_from_wkb(wkb) if len(ring) >= 2]
+            if not rings:
+                continue
+            owner = len(self.attributes)
+            self.attributes.append((worksite_name, project_name, status, work_status, worksite_code))
+            for ring in rings:
+                edges.append(np.hstack((ring[:-1], ring[1:])))
+                owners.append(np.full(len(ring) - 1, owner, dtype=np.int32))
+        self.edges = np.concatenate(edges) if edges else np.empty((0, 4))
+        self.owners = np.concatenate(owners) if owners else np.empty(0, dtype=np.int32)
+        # Each worksite's edges are contiguous, which reduceat relies on.
+        self.first_edges = np.searchsorted(self.owners, np.arange(len(self.attributes)))
+
+    def within(self, lat, lon, radius_m):
+        # Same rows as query_roadworks_within, with distances in local
+        # equirectangular metres around the point (0 inside a worksite).
+        if not self.attributes:
+            return []
+        scale_x = METRES_PER_DEGREE_LON * math.cos(math.radians(lat))
+        x0 = (self.edges[:, 0] - lon) * scale_x
+        y0 = (self.edges[:, 1] - lat) * METRES_PER_DEGREE_LAT
+        x1 = (self.edges[:, 2] - lon) * scale_x
+        y1 = (self.edges[:, 3] - lat) * METRES_PER_DEGREE_LAT
+        distances = np.minimum.reduceat(point_segment_distances(0.0, 0.0, x0, y0, x1, y1), self.first_edges)
+        # Even-odd rule: edges crossing the ray from the point towards +x.
+        dy = y1 - y0
+        crosses = ((y0 > 0) != (y1 > 0)) & (x0 - y0 * (x1 - x0) / np.where(dy != 0, dy, 1.0) > 0)
+        inside = np.bincount(self.owners[crosses], minlength=len(self.attributes)) % 2 == 1
+        distances[inside] = 0.0
+        results = []
+        for owner in np.argsort(distances, kind='stable'):
+            if distances[owner] > radius_m:
+                break
+            worksite_name, project_name, status, work_status, worksite_code = self.attributes[owner]
+            results.append((worksite_name, project_name, status, work_status, float(distances[owner]),
+                            worksite_code))
+        return results
+
+
+class TileCache:
+    # LRU of lookup results keyed by (geohash tile, extra key). Memory is
+    # bounded by max_entries; invalidate() drops tiles overlapping a bbox, or
+    # everything when no bbox is known.
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, bbox=None, margin=0.0):
+        with self.lock:
+            if bbox is None:
+                self.entries.clear()
+                return
+            min_lon, min_lat, max_lon, max_lat = bbox
+            stale = []
+            for key in self.entries:
+                tile_min_lon, tile_min_lat, tile_max_lon, tile_max_lat = geohash_bounds(key[0])
+                if (tile_min_lon - margin <= max_lon and tile_max_lon + margin >= min_lon
+                        and tile_min_lat - margin <= max_lat and tile_max_lat + margin >= min_lat):
+                    stale.append(key)
+            for key in stale:
+                del self.entries[key]
+
+    @property
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+class LocationInput(BaseModel):
+    lat: float = Field(description="Latitude in decimal degrees (WGS84)")
+    lon: float = Field(description="Longitude in decimal degrees (WGS84)")
+
+
+class RoadContext:
+    # Speed limit and roadworks lookups against the road database. Each
+    # geohash tile caches the candidate roads and worksites for every point
+    # in it, which are then filtered and measured per query. Loading road
+    # segments or road construction data, in this process or another one
+    # (via ingest_log), drops the affected tiles.
+    def __init__(self, connection_string, precision=GEOHASH_PRECISION, max_entries=CACHE_MAX_ENTRIES,
+                 radius_m=DEFAULT_RADIUS_M):
+        self.connection_string = connection_string
+        self.precision = precision
+        self.radius_m = radius_m
+        self.speed_cache = TileCache(max_entries)
+        self.roadworks_cache = TileCache(max_entries)
+        self.listener = on_ingest(self._on_ingest)
+        watch_ingests(connection_string)
+
+    def _on_ingest(self, table, bbox):
+        if table == 'road_segments':
+            # The nearest road to a tile can lie outside the changed bbox by
+            # up to the search distance; without a bound, drop the lot.
+            self.speed_cache.invalidate()
+        elif table == 'road_construction':
+            # Worksites affect tiles within radius_m of them; a metre is at
+            # most about 1.3e-5 degrees of longitude at New Zealand latitudes.
+            self.roadworks_cache.invalidate(bbox, margin=self.radius_m * 1.5e-5)
+
+    def close(self):
+        remove_ingest_listener(self.listener)
+
+    def speed_limit(self, lat, lon):
+        # Same shape as query_nearest_road: (road_name, speed_limit, distance
+        # in degrees), or None without roads.
+        tile = geohash_encode(lat, lon, self.precision)
+
+        def lookup():
+            min_lon, min_lat, max_lon, max_lat = geohash_bounds(tile)
+            half_diagonal = math.hypot(max_lon - min_lon, max_lat - min_lat) / 2
+            center_lat, center_lon = geohash_center(tile)
+            return road_segments_from_rows(
+                query_roads_near_area(self.connection_string, center_lat, center_lon, half_diagonal))
+
+        segments = self.speed_cache.get_or_compute((tile,), lookup)
+        if not len(segments):
+            return None
+        distances = segments.distances(lon, lat)
+        nearest = int(np.argmin(distances))
+        return segments.road_result(nearest, distances[nearest])
+
+    def roadworks(self, lat, lon):
+        tile = geohash_encode(lat, lon, self.precision)
+
+        def lookup():
+            min_lon, min_lat, max_lon, max_lat = geohash_bounds(tile)
+            center_lat, center_lon = geohash_center(tile)
+            half_diagonal_m = math.hypot(
+                (max_lon - min_lon) * METRES_PER_DEGREE_LON * math.cos(math.radians(center_lat)),
+                (max_lat - min_lat) * METRES_PER_DEGREE_LAT) / 2
+            # 1% over for the difference between NZTM and the local metres
+            # WorksiteCandidates measures in.
+            rows = query_roadworks_geometries_within(self.connection_string, center_lat, center_lon,
+                                                      (self.radius_m + half_diagonal_m) * 1.01)
+            return WorksiteCandidates(rows)
+
+        candidates = self.roadworks_cache.get_or_compute((tile, self.radius_m), lookup)
+        return candidates.within(lat, lon, self.radius_m)
+
+    def describe_speed_limit(self, lat, lon):
+        road = self.speed_limit(lat, lon)
+        if road is None:
+            return "No road found near this location."
+        road_name, speed_limit, _ = road
+        limit = f"{speed_limit} km/h" if speed_limit is not None else "unknown"
+        return f"Nearest road: {road_name or 'unnamed road'}. Speed limit: {limit}."
+
+    def describe_roadworks(self, lat, lon):
+        worksites = self.roadworks(lat, lon)
+        if not worksites:
+            return f"No roadworks within {self.radius_m:.0f} m."
+        lines = [f"{len(worksites)} roadworks site(s) within {self.radius_m:.0f} m:"]
+        for worksite_name, project_name, status, work_status, distance, worksite_code in worksites[:10]:
+            lines.append(f"- {worksite_name} ({worksite_code}), project {project_name}, "
+                         f"status {status}/{work_status}, {distance:.0f} m away")
+        return "\n".join(lines)
+
+    def describe(self, lat, lon):
+        return f"{self.describe_speed_limit(lat, lon)}\n{self.describe_roadworks(lat, lon)}"
+
+    @property
+    def stats(self):
+        return {'speed_limit': self.speed_cache.stats, 'roadworks': self.roadworks_cache.stats}
+
+    def tools(self):
+        return [
+            StructuredTool.from_function(
+                func=self.describe,
+                name="road_context",
+                description="Speed limit of the nearest road and any roadworks near a location in New Zealand. "
+                            "Use this for questions about speed limits or roadworks at a latitude/longitude.",
+                args_schema=LocationInput,
+            ),
+            StructuredTool.from_function(
+                func=self.describe_speed_limit,
+                name="speed_limit",
+                description="Name and speed limit of the road nearest to a location in New Zealand.",
+                args_schema=LocationInput,
+            ),
+            StructuredTool.from_function(
+                func=self.describe_roadworks,
+                name="roadworks_nearby",
+                description="Roadworks sites near a location in New Zealand.",
+                args_schema=LocationInput,
+            ),
+        ]
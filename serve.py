@@ -1,78 +1,76 @@
 #!/usr/bin/env python
-from typing import List
+import os
 
-from fastapi import FastAPI
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.tools.retriever import create_retriever_tool
 from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain import hub
 from langchain.agents import create_openai_functions_agent
 from langchain.agents import AgentExecutor
-from langchain.pydantic_v1 import BaseModel, Field
-from langchain_core.messages import BaseMessage
-from langserve import add_routes
 
-# 1. Load Retriever
-loader = WebBaseLoader("https://docs.smith.langchain.com/user_guide")
-docs = loader.load()
-text_splitter = RecursiveCharacterTextSplitter()
-documents = text_splitter.split_documents(docs)
-embeddings = OpenAIEmbeddings()
-vector = FAISS.from_documents(documents, embeddings)
-retriever = vector.as_retriever()
+from agent_app import LazyAgent, create_app
+from agent_prompt import load_agent_prompt
+from embedding_cache import CachedEmbeddings
+from embedding_engine import BatchedEmbeddings, token_text_splitter
+from response_cache import CACHE_ENABLED, ResponseCache
+from vector_cache import load_or_build_vectorstore
 
-# 2. Create Tools
-retriever_tool = create_retriever_tool(
-    retriever,
-    "langsmith_search",
-    "Search for information about LangSmith. For any questions about LangSmith, you must use this tool!",
-)
-search = TavilySearchResults()
-tools = [retriever_tool, search]
 
+def build_agent_executor():
+    # 1. Load Retriever
+    # The index is cached on disk keyed by source content and settings, so only
+    # the first start (or a changed source) pays for fetching and embedding.
+    # Chunks are sized in tokens and embedded in packed, concurrent batches
+    # (see embedding_engine).
+    text_splitter = token_text_splitter()
+    embeddings = CachedEmbeddings(BatchedEmbeddings())
+    vector = load_or_build_vectorstore("https://docs.smith.langchain.com/user_guide", embeddings, text_splitter)
+    retriever = vector.as_retriever()
 
-# 3. Create Agent
-prompt = hub.pull("hwchase17/openai-functions-agent")
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
-agent = create_openai_functions_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
-
-
-# 4. App definition
-app = FastAPI(
-  title="LangChain Server",
-  version="1.0",
-  description="A simple API server using LangChain's Runnable interfaces",
-)
+    # 2. Create Tools
+    retriever_tool = create_retriever_tool(
+        retriever,
+        "langsmith_search",
+        "Search for information about LangSmith. For any questions about LangSmith, you must use this tool!",
+    )
+    search = TavilySearchResults()
+    tools = [retriever_tool, search]
+    # Speed limit and roadworks lookups when the road database is configured
+    # (cached per geohash tile, see road_tools).
+    road_database_url = os.environ.get("ROAD_DATABASE_URL")
+    if road_database_url:
+        from road_tools import RoadContext
 
-# 5. Adding chain route
+        tools.extend(RoadContext(road_database_url).tools())
 
-# We need to add these input/output schemas because the current AgentExecutor
-# is lacking in schemas.
+    # 3. Create Agent
+    # The hwchase17/openai-functions-agent prompt is vendored (see agent_prompt)
+    # so startup does not depend on the hub being reachable.
+    prompt = load_agent_prompt()
+    # The agent streams the LLM, so token usage is only reported (and counted
+    # in /metrics) when requested for streams.
+    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0, stream_usage=True)
+    agent = create_openai_functions_agent(llm, tools, prompt)
+    # verbose printing to stdout is synchronous and serialises concurrent
+    # requests, so it is opt-in.
+    return AgentExecutor(agent=agent, tools=tools, verbose=os.environ.get("AGENT_VERBOSE") == "1")
 
-class Input(BaseModel):
-    input: str
-    chat_history: List[BaseMessage] = Field(
-        ...,
-        extra={"widget": {"type": "chat", "input": "location"}},
-    )
 
+# 4. App definition and agent route (concurrency-limited, and cached when
+# AGENT_CACHE=1, see agent_app and response_cache). The agent is built in a
+# background task once the server is up; /readyz reports when it can take
+# traffic.
+response_cache = ResponseCache() if CACHE_ENABLED else None
+app = create_app(LazyAgent(build_agent_executor), response_cache=response_cache)
 
-class Output(BaseModel):
-    output: str
+# 5. Vector tiles of road_segments and road_construction for map clients,
+# cached in memory and on disk and invalidated by ingest (see tile_server).
+road_database_url = os.environ.get("ROAD_DATABASE_URL")
+if road_database_url:
+    from tile_server import VectorTileCache, create_tile_router
 
-add_routes(
-    app,
-    agent_executor.with_types(input_type=Input, output_type=Output),
-    path="/agent",
-)
+    app.include_router(create_tile_router(VectorTileCache(road_database_url)))
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="localhost", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="localhost", port=8000)
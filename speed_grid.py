@@ -0,0 +1,301 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import time
+
+import numpy as np
+
+from road_index import DEFAULT_CELL_SIZE, NO_SPEED_LIMIT, UniformGrid, load_road_segments, point_segment_distances
+
+DEFAULT_GRID_CELL_SIZE = 0.001  # degrees, roughly 100m around Auckland
+# cell_speeds values besides a speed limit (or NO_SPEED_LIMIT when every
+# candidate road has none).
+MIXED_SPEED = -2  # candidates disagree: check distances
+UNCOVERED = -3  # no candidates stored: the point is far from every road
+
+ARRAYS = ('cell_keys', 'cell_offsets', 'cell_speeds', 'candidates', 'segments', 'segment_roads', 'speed_limits')
+
+
+def build_grid_arrays(segments, cell_size=DEFAULT_GRID_CELL_SIZE, block_size=DEFAULT_CELL_SIZE):
+    # For every cell of a fine grid over the road network, the segments that
+    # can be nearest to some point in the cell. With d the distance from the
+    # cell centre to its nearest segment and h half the cell diagonal, every
+    # point in the cell is within d + h of that segment and any segment more
+    # than d + 2h from the centre is further than that from every point, so
+    # the candidates are the segments within d + 2h of the centre. Work is
+    # done one coarse block at a time against the segments of the 3x3 blocks
+    # around it, which is complete while d + 2h <= block_size; cells further
+    # from the roads than that are left uncovered. Only covered cells are
+    # stored, as sorted cell keys with CSR offsets like UniformGrid, so the
+    # table scales with the roads rather than their bounding box.
+    ratio = max(1, round(block_size / cell_size))
+    cell_size = block_size / ratio
+    half_diagonal = cell_size * math.sqrt(2) / 2
+    blocks = UniformGrid(segments, block_size)
+    columns = blocks.columns * ratio
+    rows = blocks.rows * ratio
+
+    # Blocks with segments and their neighbours: everything within
+    # block_size of a road.
+    occupied = np.column_stack([blocks.cell_keys % blocks.columns, blocks.cell_keys // blocks.columns])
+    neighbours = (occupied[:, None, :] + np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])).reshape(-1, 2)
+    inside = ((neighbours[:, 0] >= 0) & (neighbours[:, 0] < blocks.columns)
+              & (neighbours[:, 1] >= 0) & (neighbours[:, 1] < blocks.rows))
+    block_cells = np.unique(neighbours[inside], axis=0)
+
+    local = np.arange(ratio)
+    local_x, local_y = np.meshgrid(local, local)
+    local_x = local_x.ravel()
+    local_y = local_y.ravel()
+
+    cell_parts = []
+    candidate_parts = []
+    distance_parts = []
+    for bx, by in block_cells:
+        near = np.union1d(blocks.ring_segments(bx, by, 0), blocks.ring_segments(bx, by, 1))
+        if not len(near):
+            continue
+        cell_x = bx * ratio + local_x
+        cell_y = by * ratio + local_y
+        px = blocks.origin_x + (cell_x + 0.5) * cell_size
+        py = blocks.origin_y + (cell_y + 0.5) * cell_size
+        distances = point_segment_distances(px[:, None], py[:, None], segments.x0[near], segments.y0[near],
+                                            segments.x1[near], segments.y1[near])
+        nearest = distances.min(axis=1)
+        covered = nearest + 2 * half_diagonal <= block_size
+        keep = (distances <= (nearest + 2 * half_diagonal)[:, None]) & covered[:, None]
+        cell_index, near_index = np.nonzero(keep)
+        cell_parts.append(cell_y[cell_index] * columns + cell_x[cell_index])
+        candidate_parts.append(near[near_index])
+        distance_parts.append(distances[cell_index, near_index])
+
+    if cell_parts:
+        cells = np.concatenate(cell_parts)
+        candidates = np.concatenate(candidate_parts).astype(np.int32)
+        distances = np.concatenate(distance_parts)
+    else:
+        cells = np.empty(0, dtype=np.int64)
+        candidates = np.empty(0, dtype=np.int32)
+        distances = np.empty(0)
+    # Group by cell, nearest-to-centre first within each cell.
+    order = np.lexsort((distances, cells))
+    cells = cells[order]
+    candidates = candidates[order]
+
+    cell_keys, group_starts = np.unique(cells, return_index=True)
+    cell_offsets = np.append(group_starts, len(cells)).astype(np.int64)
+
+    # Cells whose candidate roads all share one speed limit need no distance
+    # check at all for speed-limit lookups.
+    cell_speeds = np.empty(len(cell_keys), dtype=np.int32)
+    if len(cells):
+        candidate_speeds = segments.speed_limits[segments.segment_roads[candidates]]
+        low = np.minimum.reduceat(candidate_speeds, group_starts)
+        high = np.maximum.reduceat(candidate_speeds, group_starts)
+        cell_speeds[:] = np.where(low == high, low, MIXED_SPEED)
+
+    arrays = {
+        'cell_keys': cell_keys.astype(np.int64),
+        'cell_offsets': cell_offsets,
+        'cell_speeds': cell_speeds,
+        'candidates': candidates,
+        'segments': np.column_stack([segments.x0, segments.y0, segments.x1, segments.y1]),
+        'segment_roads': segments.segment_roads.astype(np.int32),
+        'speed_limits': segments.speed_limits.astype(np.int32),
+    }
+    meta = {
+        'origin_x': blocks.origin_x,
+        'origin_y': blocks.origin_y,
+        'cell_size': cell_size,
+        'columns': int(columns),
+        'rows': int(rows),
+        'segments': len(segments),
+        'covered_cells': int(len(cell_keys)),
+        'candidates': int(len(candidates)),
+        'built_at': time.time(),
+    }
+    return arrays, meta
+
+
+def save_speed_grid(arrays, meta, road_names, path):
+    # Written to a private directory and renamed into place, like the vector
+    # cache, so readers never map a half-written table.
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(arrays[name]))
+    with open(os.path.join(tmp_path, 'road_names.json'), 'w') as file:
+        json.dump(road_names, file)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as file:
+        json.dump(meta, file, indent=2)
+    old_path = f"{path}.old-{os.getpid()}"
+    if os.path.isdir(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def build_speed_grid(connection_string, path, cell_size=DEFAULT_GRID_CELL_SIZE, block_size=DEFAULT_CELL_SIZE):
+    segments = load_road_segments(connection_string)
+    if not len(segments):
+        return None
+    arrays, meta = build_grid_arrays(segments, cell_size, block_size)
+    save_speed_grid(arrays, meta, segments.road_names, path)
+    return meta
+
+
+class SpeedGrid:
+    # Memory-mapped lookup table written by build_speed_grid. A lookup is a
+    # binary search of the covered cell keys plus a distance check over the cell's
+    # few candidate segments (none when they agree on the speed limit).
+    # Points in uncovered cells go to the database when a connection string
+    # is given, otherwise they resolve to None.
+    def __init__(self, path, connection_string=None, mmap=True):
+        with open(os.path.join(path, 'meta.json')) as file:
+            self.meta = json.load(file)
+        mmap_mode = 'r' if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+        self.path = path
+        self.connection_string = connection_string
+        self._road_names = None
+        self.origin_x = self.meta['origin_x']
+        self.origin_y = self.meta['origin_y']
+        self.cell_size = self.meta['cell_size']
+        self.columns = self.meta['columns']
+        self.rows = self.meta['rows']
+
+    @property
+    def road_names(self):
+        if self._road_names is None:
+            with open(os.path.join(self.path, 'road_names.json')) as file:
+                self._road_names = json.load(file)
+        return self._road_names
+
+    def _cells(self, lats, lons):
+        # Position of each point's cell among the covered cells, or -1.
+        column = np.floor((lons - self.origin_x) / self.cell_size).astype(np.int64)
+        row = np.floor((lats - self.origin_y) / self.cell_size).astype(np.int64)
+        inside = (column >= 0) & (column < self.columns) & (row >= 0) & (row < self.rows)
+        keys = row * self.columns + column
+        positions = np.searchsorted(self.cell_keys, keys)
+        found = inside & (positions < len(self.cell_keys))
+        found[found] = self.cell_keys[positions[found]] == keys[found]
+        return np.where(found, positions, -1)
+
+    def _nearest_segments(self, lats, lons, cells):
+        # Vectorised candidate check for points whose cell is covered:
+        # expand (point, candidate) pairs, measure them all, and keep the
+        # nearest candidate per point.
+        starts = self.cell_offsets[cells]
+        counts = self.cell_offsets[cells + 1] - starts
+        points = np.repeat(np.arange(len(cells)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = self.candidates[np.repeat(starts, counts) + offsets]
+        segments = self.segments[candidates]
+        distances = point_segment_distances(lons[points], lats[points], segments[:, 0], segments[:, 1],
+                                            segments[:, 2], segments[:, 3])
+        order = np.lexsort((distances, points))
+        first = order[np.cumsum(counts) - counts]
+        return candidates[first], distances[first]
+
+    def lookup_speed_limits(self, lats, lons):
+        # Speed limit per point (NO_SPEED_LIMIT when the road has none or the
+        # point is uncovered and there is no database fallback).
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+        cells = self._cells(lats, lons)
+        speeds = np.full(len(cells), UNCOVERED, dtype=np.int32)
+        covered = cells >= 0
+        speeds[covered] = self.cell_speeds[cells[covered]]
+        mixed = np.flatnonzero(speeds == MIXED_SPEED)
+        if len(mixed):
+            segments, _ = self._nearest_segments(lats[mixed], lons[mixed], cells[mixed])
+            speeds[mixed] = self.speed_limits[self.segment_roads[segments]]
+        uncovered = np.flatnonzero(speeds == UNCOVERED)
+        if len(uncovered):
+            speeds[uncovered] = NO_SPEED_LIMIT
+            if self.connection_string:
+                from insert_road import query_nearest_roads
+                speeds[uncovered] = query_nearest_roads(
+                    self.connection_string, lats[uncovered], lons[uncovered])['speed_limit']
+        return speeds.astype(np.int32)
+
+    def nearest_many(self, lats, lons):
+        # Same columnar shape as query_nearest_roads.
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+        cells = self._cells(lats, lons)
+        covered = np.flatnonzero(cells >= 0)
+        road_names = [None] * len(lats)
+        speed_limits = np.full(len(lats), NO_SPEED_LIMIT, dtype=np.int32)
+        distances = np.full(len(lats), np.nan)
+        if len(covered):
+            segments, segment_distances = self._nearest_segments(lats[covered], lons[covered], cells[covered])
+            roads = self.segment_roads[segments]
+            speed_limits[covered] = self.speed_limits[roads]
+            distances[covered] = segment_distances
+            names = self.road_names
+            for i, road in zip(covered, roads):
+                road_names[i] = names[road]
+        uncovered = np.setdiff1d(np.arange(len(lats)), covered)
+        if len(uncovered) and self.connection_string:
+            from insert_road import query_nearest_roads
+            fallback = query_nearest_roads(self.connection_string, lats[uncovered], lons[uncovered])
+            speed_limits[uncovered] = fallback['speed_limit']
+            distances[uncovered] = fallback['distance']
+            for i, name in zip(uncovered, fallback['road_name']):
+                road_names[i] = name
+        return {'road_name': road_names, 'speed_limit': speed_limits, 'distance': distances}
+
+    def _cell(self, lat, lon):
+        column = math.floor((lon - self.origin_x) / self.cell_size)
+        row = math.floor((lat - self.origin_y) / self.cell_size)
+        if not (0 <= column < self.columns and 0 <= row < self.rows):
+            return -1
+        key = row * self.columns + column
+        position = int(np.searchsorted(self.cell_keys, key))
+        if position < len(self.cell_keys) and self.cell_keys[position] == key:
+            return position
+        return -1
+
+    def speed_limit(self, lat, lon):
+        # Scalar speed-limit lookup; None when the road has no limit.
+        cell = self._cell(lat, lon)
+        if cell >= 0 and self.cell_speeds[cell] != MIXED_SPEED:
+            speed_limit = int(self.cell_speeds[cell])
+        else:
+            road = self.nearest(lat, lon)
+            return road[1] if road else None
+        return None if speed_limit == NO_SPEED_LIMIT else speed_limit
+
+    def nearest(self, lat, lon):
+        # Same shape as query_nearest_road: (road_name, speed_limit, distance).
+        cell = self._cell(lat, lon)
+        if cell < 0:
+            if self.connection_string:
+                from insert_road import query_nearest_road
+                return query_nearest_road(self.connection_string, lat, lon)
+            return None
+        candidates = self.candidates[self.cell_offsets[cell]:self.cell_offsets[cell + 1]]
+        segments = self.segments[candidates]
+        distances = point_segment_distances(lon, lat, segments[:, 0], segments[:, 1], segments[:, 2], segments[:, 3])
+        best = int(np.argmin(distances))
+        road = int(self.segment_roads[candidates[best]])
+        speed_limit = int(self.speed_limits[road])
+        return (self.road_names[road], None if speed_limit == NO_SPEED_LIMIT else speed_limit, float(distances[best]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the precomputed speed-limit grid from road_segments.")
+    parser.add_argument("connection_string")
+    parser.add_argument("path")
+    parser.add_argument("--cell-size", type=float, default=DEFAULT_GRID_CELL_SIZE)
+    parser.add_argument("--block-size", type=float, default=DEFAULT_CELL_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    meta = build_speed_grid(args.connection_string, args.path, args.cell_size, args.block_size)
+    print(f"Built speed grid in {time.perf_counter() - start:.1f}s: {meta}")
@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, HTTPException, Response
+
+from db import close_pools, pooled_connection
+from ingest_hooks import on_ingest, remove_ingest_listener, watch_ingests
+from metrics import REGISTRY
+
+TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR", ".tile_cache")
+TILE_CACHE_MAX_BYTES = int(os.environ.get("TILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Seconds a cached tile is served before being rendered again, in memory and
+# on disk; bounds staleness from ingests missed while the server was down.
+# 0 keeps tiles until an ingest invalidates them.
+TILE_CACHE_TTL = float(os.environ.get("TILE_CACHE_TTL", "86400"))
+# The disk tier is swept this often (seconds), deleting expired tiles and
+# then the oldest ones while it is over TILE_CACHE_MAX_DISK_BYTES (0 for no
+# limit).
+TILE_CACHE_MAX_DISK_BYTES = int(os.environ.get("TILE_CACHE_MAX_DISK_BYTES", str(1024 * 1024 * 1024)))
+TILE_CACHE_SWEEP_INTERVAL = float(os.environ.get("TILE_CACHE_SWEEP_INTERVAL", "600"))
+TILE_MAX_ZOOM = int(os.environ.get("TILE_MAX_ZOOM", "18"))
+# The speed limit layer is too dense to be useful below this zoom; roadworks
+# are sparse enough to show from further out.
+ROAD_MIN_ZOOM = int(os.environ.get("TILE_ROAD_MIN_ZOOM", "10"))
+ROADWORKS_MIN_ZOOM = int(os.environ.get("TILE_ROADWORKS_MIN_ZOOM", "8"))
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+# Simplification tolerance in tile units; 8 is about a screen pixel on a
+# 512 px tile, so simplified geometry renders the same.
+SIMPLIFY_UNITS = float(os.environ.get("TILE_SIMPLIFY_UNITS", "8"))
+TILE_MAX_AGE = int(os.environ.get("TILE_MAX_AGE", "300"))
+
+MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+WEB_MERCATOR_WIDTH = 40075016.685578488  # metres, EPSG:3857
+
+# Geometries are simplified in Web Mercator after the bbox filter has used
+# the GiST index on the EPSG:4326 column. ST_AsMVTGeom drops anything that
+# collapses or falls outside the buffered tile.
+TILE_QUERY = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom,
+               ST_Transform(ST_Expand(ST_TileEnvelope(%(z)s, %(x)s, %(y)s), %(margin)s), 4326) AS geom_4326
+    ),
+    roads AS (
+        SELECT ST_AsMVTGeom(ST_Simplify(ST_Transform(r.geom, 3857), %(tolerance)s), bounds.geom,
+                            %(extent)s, %(buffer)s) AS geom,
+               r.road_name, r.speed_limit
+        FROM road_segments r, bounds
+        WHERE %(roads)s AND r.geom && bounds.geom_4326
+    ),
+    works AS (
+        SELECT ST_AsMVTGeom(ST_Simplify(ST_Transform(c.geom, 3857), %(tolerance)s), bounds.geom,
+                            %(extent)s, %(buffer)s) AS geom,
+               c.worksite_name, c.worksite_code, c.status, c.work_status
+        FROM road_construction c, bounds
+        WHERE %(roadworks)s AND c.geom && bounds.geom_4326
+    )
+    SELECT
+        COALESCE((SELECT ST_AsMVT(roads, 'road_segments', %(extent)s, 'geom') FROM roads
+                  WHERE geom IS NOT NULL), ''::bytea)
+        || COALESCE((SELECT ST_AsMVT(works, 'road_construction', %(extent)s, 'geom') FROM works
+                     WHERE geom IS NOT NULL), ''::bytea)
+"""
+
+
+def tile_range(bbox, z, margin=0.0):
+    # Inclusive (min_x, min_y, max_x, max_y) of the tiles at zoom z covering
+    # bbox, widened by margin tiles on every side.
+    min_lon, min_lat, max_lon, max_lat = bbox
+    count = 2 ** z
+
+    def tile_x(lon):
+        return (lon + 180.0) / 360.0 * count
+
+    def tile_y(lat):
+        lat = max(-85.0511287798, min(85.0511287798, lat))
+        return (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * count
+
+    def clamp(value):
+        return max(0, min(count - 1, int(math.floor(value))))
+
+    return (clamp(tile_x(min_lon) - margin), clamp(tile_y(max_lat) - margin),
+            clamp(tile_x(max_lon) + margin), clamp(tile_y(min_lat) + margin))
+
+
+def render_tile(connection_string, z, x, y):
+    tile_width = WEB_MERCATOR_WIDTH / 2 ** z
+    params = {
+        'z': z,
+        'x': x,
+        'y': y,
+        'extent': TILE_EXTENT,
+        'buffer': TILE_BUFFER,
+        'margin': tile_width * TILE_BUFFER / TILE_EXTENT,
+        'tolerance': tile_width * SIMPLIFY_UNITS / TILE_EXTENT,
+        'roads': z >= ROAD_MIN_ZOOM,
+        'roadworks': z >= ROADWORKS_MIN_ZOOM,
+    }
+    with pooled_connection(connection_string) as conn:
+        with conn.cursor() as cur:
+            cur.execute(TILE_QUERY, params)
+            return bytes(cur.fetchone()[0])
+
+
+class VectorTileCache:
+    # Two-level tile cache: an in-process LRU bounded by bytes in front of
+    # files under cache_dir/{z}/{x}/{y}.mvt. Tiles are rendered on a miss or
+    # once older than ttl seconds; ingests, including those of other
+    # processes via ingest_log, drop the tiles overlapping the changed bbox
+    # (all of them when the loader does not know it), on disk as well as in
+    # memory. The disk tier is bounded by max_disk_bytes through a periodic
+    # sweep; watch=False skips following other processes' ingests, for
+    # one-shot users like the seeder.
+    def __init__(self, connection_string, cache_dir=TILE_CACHE_DIR, max_bytes=TILE_CACHE_MAX_BYTES,
+                 max_zoom=TILE_MAX_ZOOM, ttl=TILE_CACHE_TTL, max_disk_bytes=TILE_CACHE_MAX_DISK_BYTES,
+                 sweep_interval=TILE_CACHE_SWEEP_INTERVAL, watch=True):
+        self.connection_string = connection_string
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_zoom = max_zoom
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.sweep_interval = sweep_interval
+        self.entries = OrderedDict()
+        self.bytes = 0
+        # Disk usage as of the last sweep plus the tiles written since.
+        self.disk_bytes = 0
+        self.next_sweep = 0.0
+        self.sweeping = False
+        self.lock = threading.Lock()
+        # Bumped by every invalidation; a tile rendered across one is served
+        # but not stored, since it may predate the change.
+        self.generation = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'renders': 0, 'invalidated': 0, 'expired': 0,
+                      'swept': 0}
+        self.listener = on_ingest(self._on_ingest)
+        if watch:
+            watch_ingests(connection_string)
+
+    def close(self):
+        remove_ingest_listener(self.listener)
+
+    def _path(self, z, x, y):
+        return os.path.join(self.cache_dir, str(z), str(x), f"{y}.mvt")
+
+    def _expired(self, rendered_at):
+        return self.ttl > 0 and time.time() - rendered_at > self.ttl
+
+    def _remember(self, key, tile, rendered_at):
+        if key in self.entries:
+            self.bytes -= len(self.entries.pop(key)[0])
+        self.entries[key] = (tile, rendered_at)
+        self.bytes += len(tile)
+        while self.bytes > self.max_bytes and self.entries:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.bytes -= len(evicted)
+
+    def get(self, z, x, y):
+        key = (z, x, y)
+        with self.lock:
+            if key in self.entries:
+                tile, rendered_at = self.entries[key]
+                if not self._expired(rendered_at):
+                    self.entries.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return tile
+                self.bytes -= len(self.entries.pop(key)[0])
+                self.stats['expired'] += 1
+            generation = self.generation
+        path = self._path(z, x, y)
+        cached = False
+        try:
+            with open(path, 'rb') as file:
+                # The file's age carries over to memory, so a disk hit does
+                # not extend its life.
+                rendered_at = os.fstat(file.fileno()).st_mtime
+                if not self._expired(rendered_at):
+                    tile = file.read()
+                    cached = True
+        except FileNotFoundError:
+            pass
+        if not cached:
+            tile = render_tile(self.connection_string, z, x, y)
+            rendered_at = time.time()
+        with self.lock:
+            self.stats['disk_hits' if cached else 'renders'] += 1
+            if generation != self.generation:
+                return tile
+            self._remember(key, tile, rendered_at)
+            if cached:
+                return tile
+            # Written under the lock so an invalidation cannot run between
+            # the generation check and the file appearing.
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary, 'wb') as file:
+                file.write(tile)
+            os.replace(temporary, path)
+            self.disk_bytes += len(tile)
+            sweep = not self.sweeping and (time.monotonic() >= self.next_sweep
+                                           or 0 < self.max_disk_bytes < self.disk_bytes)
+            if sweep:
+                self.sweeping = True
+        if sweep:
+            threading.Thread(target=self.sweep, name="tile-cache-sweep", daemon=True).start()
+        return tile
+
+    def sweep(self):
+        # Deletes expired tile files, then the oldest ones until the disk
+        # tier is back under 90% of max_disk_bytes. Runs off the lock; a tile
+        # deleted under a reader is simply rendered again.
+        removed = 0
+        files = []
+        try:
+            for root, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    if not name.endswith('.mvt'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        status = os.stat(path)
+                        if self._expired(status.st_mtime):
+                            os.remove(path)
+                            removed += 1
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    files.append((status.st_mtime, status.st_size, path))
+            total = sum(size for _, size, _ in files)
+            if 0 < self.max_disk_bytes < total:
+                files.sort()
+                for _, size, path in files:
+                    if total <= self.max_disk_bytes * 0.9:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    removed += 1
+        except Exception as e:
+            logging.exception(f"Sweeping the tile cache failed: {e}")
+            total = self.disk_bytes
+        with self.lock:
+            self.disk_bytes = total
+            self.stats['swept'] += removed
+            self.next_sweep = time.monotonic() + self.sweep_interval
+            self.sweeping = False
+        return removed
+
+    def invalidate(self, bbox=None):
+        if bbox is None:
+            # The directory is moved aside under the lock and deleted after
+            # it, so tile requests do not wait on the delete.
+            stale_dir = f"{self.cache_dir}.stale-{os.getpid()}-{threading.get_ident()}"
+            with self.lock:
+                self.generation += 1
+                self.stats['invalidated'] += len(self.entries)
+                self.entries.clear()
+                self.bytes = 0
+                self.disk_bytes = 0
+                try:
+                    os.rename(self.cache_dir, stale_dir)
+                except FileNotFoundError:
+                    return
+            shutil.rmtree(stale_dir, ignore_errors=True)
+            return
+        with self.lock:
+            self.generation += 1
+            # Features reach into neighbouring tiles by up to the buffer.
+            ranges = [tile_range(bbox, z, TILE_BUFFER / TILE_EXTENT) for z in range(self.max_zoom + 1)]
+
+            def stale(z, x, y):
+                min_x, min_y, max_x, max_y = ranges[z]
+                return min_x <= x <= max_x and min_y <= y <= max_y
+
+            for key in [key for key in self.entries if key[0] <= self.max_zoom and stale(*key)]:
+                self.bytes -= len(self.entries.pop(key)[0])
+                self.stats['invalidated'] += 1
+            for z, (min_x, min_y, max_x, max_y) in enumerate(ranges):
+                zoom_dir = os.path.join(self.cache_dir, str(z))
+                if not os.path.isdir(zoom_dir):
+                    continue
+                # Only the cached x directories inside the range are listed,
+                # so a small bbox at a deep zoom stays cheap.
+                for x_entry in os.scandir(zoom_dir):
+                    if not (x_entry.name.isdigit() and min_x <= int(x_entry.name) <= max_x):
+                        continue
+                    for y_entry in os.scandir(x_entry.path):
+                        y = y_entry.name.removesuffix('.mvt')
+                        if y.isdigit() and min_y <= int(y) <= max_y:
+                            self.disk_bytes -= y_entry.stat().st_size
+                            os.remove(y_entry.path)
+
+    def _on_ingest(self, table, bbox):
+        if table in ('road_segments', 'road_construction'):
+            start = time.perf_counter()
+            self.invalidate(bbox)
+            logging.info(f"Invalidated vector tiles for {table} ingest in {time.perf_counter() - start:.3f}s")
+
+    @property
+    def memory_stats(self):
+        with self.lock:
+            return {**self.stats, 'entries': len(self.entries), 'bytes': self.bytes, 'disk_bytes': self.disk_bytes}
+
+
+def create_tile_router(tile_cache):
+    router = APIRouter()
+
+    @router.get("/tiles/{z}/{x}/{y}.mvt")
+    async def tile(z: int, x: int, y: int):
+        if not 0 <= z <= tile_cache.max_zoom or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise HTTPException(status_code=404, detail="Tile out of range")
+        # Rendering and the disk cache block, so they run off the event loop.
+        data = await asyncio.to_thread(tile_cache.get, z, x, y)
+        headers = {"Cache-Control": f"public, max-age={TILE_MAX_AGE}"}
+        if not data:
+            return Response(status_code=204, headers=headers)
+        return Response(content=data, media_type=MEDIA_TYPE, headers=headers)
+
+    @router.get("/tiles/stats")
+    async def tile_stats():
+        return tile_cache.memory_stats
+
+    REGISTRY.gauge("vector_tile_cache", "Vector tile cache counters.",
+                   lambda: {(name,): value for name, value in tile_cache.memory_stats.items()}, ("stat",))
+    return router
+
+
+def data_bbox(connection_string):
+    with pooled_connection(connection_string) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+                FROM (SELECT ST_Extent(geom) AS e FROM (
+                    SELECT geom FROM road_segments UNION ALL SELECT geom FROM road_construction) g) s
+            """)
+            bbox = cur.fetchone()
+    return None if bbox[0] is None else bbox
+
+
+def seed_tiles(tile_cache, bbox, min_zoom, max_zoom, workers=4):
+    # Renders every tile of the zoom range over bbox into the cache.
+    tiles = []
+    for z in range(min_zoom, max_zoom + 1):
+        min_x, min_y, max_x, max_y = tile_range(bbox, z)
+        tiles.extend((z, x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1))
+    start = time.perf_counter()
+    total_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i, tile in enumerate(executor.map(lambda key: tile_cache.get(*key), tiles), 1):
+            total_bytes += len(tile)
+            if i % 1000 == 0:
+                print(f"Seeded {i}/{len(tiles)} tiles")
+    seconds = time.perf_counter() - start
+    print(f"Seeded {len(tiles)} tiles ({total_bytes / 1e6:.1f} MB) in {seconds:.1f}s")
+    return len(tiles)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the on-disk vector tile cache.")
+    parser.add_argument("connection_string")
+    parser.add_argument("--min-zoom", type=int, default=ROADWORKS_MIN_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=14)
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"),
+                        help="Area to seed (default: extent of the data)")
+    parser.add_argument("--cache-dir", default=TILE_CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-disk-bytes", type=int, default=TILE_CACHE_MAX_DISK_BYTES,
+                        help="Cap on the disk cache; tiles seeded past it evict the oldest (0 for no limit)")
+    args = parser.parse_args()
+
+    bbox = args.bbox or data_bbox(args.connection_string)
+    if bbox is None:
+        print("No road data to seed tiles from.")
+    else:
+        # Memory is not needed when seeding; everything goes to disk.
+        cache = VectorTileCache(args.connection_string, args.cache_dir, max_bytes=0,
+                                max_zoom=max(args.max_zoom, TILE_MAX_ZOOM),
+                                max_disk_bytes=args.max_disk_bytes, watch=False)
+        seed_tiles(cache, bbox, args.min_zoom, args.max_zoom, args.workers)
+        cache.close()
+    close_pools()
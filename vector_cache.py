@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import uuid
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.document_loaders import WebBaseLoader
+from langchain_community.vectorstores import FAISS
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from faiss_index import build_index, index_settings, tune_index
+
+CACHE_DIR = os.environ.get("VECTOR_CACHE_DIR", ".vector_cache")
+# Set to 1 to re-fetch the source on startup and rebuild only if it changed;
+# otherwise a cached index is used without touching the network.
+REFRESH = os.environ.get("VECTOR_CACHE_REFRESH", "0") == "1"
+MANIFEST = "manifest.json"
+
+
+def build_settings(text_splitter, embeddings, index=None):
+    # Everything besides the source content that changes the built index.
+    # Caching wrappers (see embedding_cache) do not change the vectors, and
+    # search-time knobs (nprobe, efSearch) are applied on load instead.
+    embeddings = getattr(embeddings, 'underlying', embeddings)
+    return {
+        'splitter': type(text_splitter).__name__,
+        'chunk_size': getattr(text_splitter, '_chunk_size', None),
+        'chunk_overlap': getattr(text_splitter, '_chunk_overlap', None),
+        'length_function': getattr(getattr(text_splitter, '_length_function', len), '__name__', None),
+        'embeddings': type(embeddings).__name__,
+        'model': getattr(embeddings, 'model', None),
+        'index': index or index_settings(),
+    }
+
+
+def content_key(docs, settings):
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    for doc in docs:
+        digest.update(doc.page_content.encode('utf-8'))
+        digest.update(json.dumps(doc.metadata, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def save_vectorstore(vectorstore, path):
+    # Write into a private directory and rename it into place, so concurrent
+    # workers never see a half-written index.
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    faiss.write_index(vectorstore.index, os.path.join(tmp_path, 'index.faiss'))
+    with open(os.path.join(tmp_path, 'docstore.pkl'), 'wb') as file:
+        pickle.dump((vectorstore.docstore, vectorstore.index_to_docstore_id), file)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another worker finished the same build first.
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_vectorstore(path, embeddings):
+    index_path = os.path.join(path, 'index.faiss')
+    try:
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Not every index type supports memory-mapping.
+        index = faiss.read_index(index_path)
+    tune_index(index)
+    # The pickle is written by save_vectorstore in this cache directory only.
+    with open(os.path.join(path, 'docstore.pkl'), 'rb') as file:
+        docstore, index_to_docstore_id = pickle.load(file)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, MANIFEST)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def build_vectorstore(documents, embeddings, index=None):
+    # Like FAISS.from_documents, but the index type comes from faiss_index
+    # (flat by default; IVF-Flat, HNSW or IVF-PQ for large corpora).
+    if not documents:
+        raise ValueError("No documents to index (did every source fail to load?)")
+    texts = [doc.page_content for doc in documents]
+    if hasattr(embeddings, 'embed_array'):
+        vectors = embeddings.embed_array(texts)
+    else:
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    faiss_index = build_index(vectors, index or index_settings())
+    ids = [str(uuid.uuid4()) for _ in documents]
+    docstore = InMemoryDocstore(dict(zip(ids, documents)))
+    return FAISS(embeddings, faiss_index, docstore, dict(enumerate(ids)))
+
+
+def load_or_build_vectorstore(url, embeddings, text_splitter=None, cache_dir=CACHE_DIR, refresh=REFRESH, index=None):
+    text_splitter = text_splitter or RecursiveCharacterTextSplitter()
+    settings = build_settings(text_splitter, embeddings, index)
+    source_id = hashlib.sha256(json.dumps([url, settings], sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    os.makedirs(cache_dir, exist_ok=True)
+
+    manifest = _read_manifest(cache_dir)
+    cached_key = manifest.get(source_id, {}).get('key')
+    if cached_key and not refresh and os.path.isdir(os.path.join(cache_dir, cached_key)):
+        logging.info(f"Loading cached vector index {cached_key} for {url}")
+        return load_vectorstore(os.path.join(cache_dir, cached_key), embeddings)
+
+    docs = WebBaseLoader(url).load()
+    key = content_key(docs, settings)
+    path = os.path.join(cache_dir, key)
+    if os.path.isdir(path):
+        logging.info(f"Source unchanged, loading cached vector index {key} for {url}")
+        vectorstore = load_vectorstore(path, embeddings)
+    else:
+        logging.info(f"Building vector index {key} for {url}")
+        vectorstore = build_vectorstore(text_splitter.split_documents(docs), embeddings, settings['index'])
+        save_vectorstore(vectorstore, path)
+
+    manifest = _read_manifest(cache_dir)
+    previous_key = manifest.get(source_id, {}).get('key')
+    manifest[source_id] = {'url': url, 'key': key, 'settings': settings}
+    _write_manifest(cache_dir, manifest)
+    if previous_key and previous_key != key:
+        shutil.rmtree(os.path.join(cache_dir, previous_key), ignore_errors=True)
+    return vectorstore